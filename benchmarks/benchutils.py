@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from blockdiag.builder import DiagramTreeBuilder  # NOQA
+from blockdiag.elements import Diagram, DiagramNode, DiagramEdge, NodeGroup  # NOQA
+from blockdiag.parser import parse_string  # NOQA
+
+
+def generate_tree(count, branches=3):
+    """Generate source of a tree shaped diagram having ``count`` nodes"""
+    lines = ['blockdiag {']
+    for i in range(1, count):
+        lines.append('  N%d -> N%d;' % ((i - 1) // branches, i))
+    lines.append('}')
+
+    return '\n'.join(lines)
+
+
+def build_tree(source):
+    """Parse and instantiate diagram (without layouting)"""
+    DiagramNode.clear()
+    DiagramEdge.clear()
+    NodeGroup.clear()
+    Diagram.clear()
+
+    return DiagramTreeBuilder().build(parse_string(source), None)
+
+
+def measure(func, *args, **kwargs):
+    """Return best elapsed time of ``func`` in seconds"""
+    repeat = kwargs.pop('repeat', 3)
+    setup = kwargs.pop('setup', None)
+
+    elapsed = []
+    for _ in range(repeat):
+        if setup:
+            args = setup()
+
+        started = time.time()
+        func(*args)
+        elapsed.append(time.time() - started)
+
+    return min(elapsed)
+
+
+def report(title, rows):
+    print(title)
+    for row in rows:
+        print('  ' + '  '.join('%12s' % col for col in row))
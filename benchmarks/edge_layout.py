@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of EdgeLayoutManager on diagrams having many skipping edges.
+
+Compares the index of cells with full scans of nodes::
+
+    $ python benchmarks/edge_layout.py
+"""
+
+from benchutils import build_tree, measure, report
+from blockdiag.builder import DiagramLayoutManager, EdgeLayoutManager
+
+
+def generate_skipping_edges(count, span=5):
+    """Generate source of a chain having ``count`` edges (including skips)"""
+    nodes = count // 2 + 1
+    lines = ['blockdiag {']
+    for i in range(1, nodes):
+        lines.append('  N%d -> N%d;' % (i - 1, i))
+    for i in range(count - (nodes - 1)):
+        node1 = i % (nodes - span)
+        lines.append('  N%d -> N%d;' % (node1, node1 + span))
+    lines.append('}')
+
+    return '\n'.join(lines)
+
+
+class ScanningCells(object):
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __contains__(self, xy):
+        nodes = [x for x in self.manager.nodes if x.xy == xy]
+        return len(nodes) > 0
+
+
+class ScanningEdgeLayoutManager(EdgeLayoutManager):
+    """Edge layout manager scanning all nodes on each query (legacy)"""
+    @property
+    def cells(self):
+        return ScanningCells(self)
+
+
+def layout(source):
+    diagram = build_tree(source)
+    DiagramLayoutManager(diagram).run()
+    diagram.fixiate(True)
+
+    return diagram
+
+
+def main():
+    rows = [('edges', 'scan (sec)', 'index (sec)', 'speedup')]
+    for count in (250, 500, 1000):
+        diagram = layout(generate_skipping_edges(count))
+
+        scan = measure(lambda: ScanningEdgeLayoutManager(diagram).run())
+        index = measure(lambda: EdgeLayoutManager(diagram).run())
+        rows.append((count, '%.3f' % scan, '%.3f' % index,
+                     '%.1fx' % (scan / index)))
+
+    report('EdgeLayoutManager.run()', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of rendering diagrams whose nodes share a few icons.
+
+Compares decoded image cache of default budget with a cache which keeps
+only one image (nearly decodes icons per node)::
+
+    $ python benchmarks/icons.py
+"""
+
+import os
+from tempfile import mkdtemp
+from shutil import rmtree
+from PIL import Image
+from benchutils import measure, report
+from blockdiag import drawer
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.parser import parse_string
+from blockdiag.utils import images
+from blockdiag.utils.images import DecodedImageCache
+
+
+def generate_icons(tmpdir, count):
+    """Generate icons (BMP; SVG drawer embeds them as data URI)"""
+    icons = []
+    for i in range(count):
+        path = os.path.join(tmpdir, 'icon%d.bmp' % i)
+        color = (i * 40, 128, 255 - i * 40)
+        Image.new('RGB', (256, 256), color).save(path)
+        icons.append(path)
+
+    return icons
+
+
+def generate_source(icons, count):
+    lines = ['{']
+    for i in range(count):
+        lines.append('  N%d [icon = "%s"];' % (i, icons[i % len(icons)]))
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def render(_format, diagram, filename, cache):
+    images.decoded_cache = cache
+    draw = drawer.DiagramDraw(_format, diagram, filename)
+    draw.draw()
+    draw.save()
+
+
+def main():
+    tmpdir = mkdtemp()
+    try:
+        icons = generate_icons(tmpdir, 5)
+        source = generate_source(icons, 300)
+        filename = os.path.join(tmpdir, 'output')
+
+        rows = [('format', 'uncached', 'cached', 'decodes')]
+        for _format in ('PNG', 'SVG'):
+            elapsed = []
+            for maxsize in (0, images.DECODED_CACHE_SIZE):
+                diagram = ScreenNodeBuilder.build(parse_string(source))
+
+                def setup():
+                    return (_format, diagram, filename,
+                            DecodedImageCache(maxsize))
+
+                elapsed.append(measure(render, setup=setup))
+
+            rows.append((_format, '%.3f' % elapsed[0], '%.3f' % elapsed[1],
+                         images.decoded_cache.misses))
+
+        report('Rendering 300 nodes sharing 5 icons', rows)
+    finally:
+        images.decoded_cache = DecodedImageCache()
+        rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
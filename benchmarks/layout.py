@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of DiagramLayoutManager on large tree shaped diagrams.
+
+Compares the adjacency index (NodeRelations) with full scans of edges::
+
+    $ python benchmarks/layout.py
+"""
+
+from benchutils import build_tree, generate_tree, measure, report
+from blockdiag.builder import DiagramLayoutManager
+
+
+class ScanningLayoutManager(DiagramLayoutManager):
+    """Layout manager scanning all edges on each query (legacy behavior)"""
+    def get_related_nodes(self, node, parent=False, child=False):
+        uniq = {}
+        for edge in self.edges:
+            if edge.folded:
+                continue
+
+            if parent and edge.node2 == node:
+                uniq[edge.node1] = 1
+            elif child and edge.node1 == node:
+                uniq[edge.node2] = 1
+
+        related = [n for n in uniq if n != node and n.group == node.group]
+        related.sort(key=lambda x: x.order)
+        return related
+
+
+def run_layout(klass, diagram):
+    klass(diagram).run()
+
+
+def main():
+    rows = [('nodes', 'scan (sec)', 'index (sec)', 'speedup')]
+    for count in (100, 200, 400, 800):
+        source = generate_tree(count)
+
+        def setup():
+            return (build_tree(source),)
+
+        scan = measure(lambda d: run_layout(ScanningLayoutManager, d),
+                       setup=setup)
+        index = measure(lambda d: run_layout(DiagramLayoutManager, d),
+                        setup=setup)
+        rows.append((count, '%.3f' % scan, '%.3f' % index,
+                     '%.1fx' % (scan / index)))
+
+    report('DiagramLayoutManager.run()', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of SpreadSheetMetrics on wide diagrams.
+
+Compares the cached offsets of columns with summing up widths each time::
+
+    $ python benchmarks/metrics.py
+"""
+
+from benchutils import measure, report
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.metrics import DiagramMetrics, SpreadSheetMetrics
+from blockdiag.parser import parse_string
+
+
+def generate_chain(count):
+    """Generate source of a diagram having ``count`` columns"""
+    nodes = ' -> '.join('N%d' % i for i in range(count))
+    return 'blockdiag { %s; }' % nodes
+
+
+class SummingSpreadSheetMetrics(SpreadSheetMetrics):
+    """Spreadsheet summing up sizes on each query (legacy behavior)"""
+    def offset(self, name, count):
+        sizes = getattr(self, name)
+        return sum(sizes[i] for i in range(count))
+
+
+def get_metrics(diagram, klass):
+    metrics = DiagramMetrics(diagram)
+    sheet = klass(metrics)
+    for name in ('node_width', 'node_height', 'span_width', 'span_height'):
+        setattr(sheet, name, getattr(metrics.spreadsheet, name))
+    metrics.spreadsheet = sheet
+
+    return metrics
+
+
+def run_metrics(diagram, klass):
+    metrics = get_metrics(diagram, klass)
+    for _ in range(10):
+        for node in diagram.nodes:
+            metrics.cell(node)
+
+
+def main():
+    rows = [('columns', 'sum (sec)', 'cache (sec)', 'speedup')]
+    for count in (200, 400, 800):
+        diagram = ScreenNodeBuilder.build(parse_string(generate_chain(count)))
+
+        summing = measure(run_metrics, diagram, SummingSpreadSheetMetrics)
+        cached = measure(run_metrics, diagram, SpreadSheetMetrics)
+        rows.append((count, '%.3f' % summing, '%.3f' % cached,
+                     '%.1fx' % (summing / cached)))
+
+    report('SpreadSheetMetrics', rows)
+
+
+if __name__ == '__main__':
+    main()
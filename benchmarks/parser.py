@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of parser engines on large (and small) diagrams.
+
+Compares funcparserlib engine with hand-written one (engine='fast')::
+
+    $ python benchmarks/parser.py
+"""
+
+from benchutils import measure, report
+from blockdiag import parser
+
+
+def generate_source(count):
+    """Generate source of a diagram having edges, nodes and groups"""
+    lines = ['blockdiag {', '  default_shape = roundedbox;',
+             '  class emphasis [color = red, style = dashed];']
+    for i in range(count):
+        if i % 50 == 0:
+            lines.append('  group G%d {' % i)
+            lines.append('    color = "#CCCCFF";')
+        lines.append('    N%d -> N%d, N%d [label = "edge %d", folded];' %
+                     (i // 3, i + 1, i + 2, i))
+        lines.append('    N%d [class = emphasis, width = 128];' % i)
+        if i % 50 == 49 or i == count - 1:
+            lines.append('  }')
+    lines.append('}')
+
+    return '\n'.join(lines)
+
+
+def parse_many(tokens, engine):
+    for seq in tokens:
+        parser.ENGINES[engine](seq)
+
+
+def main():
+    rows = [('diagram', 'funcparserlib (sec)', 'fast (sec)', 'speedup')]
+    for statements, count in ((25000, 1), (25, 1000)):
+        source = generate_source(statements)
+        assert (parser.parse_string(source) ==
+                parser.parse_string(source, engine='fast'))
+
+        # measure parsing only; tokenizing is shared by both engines
+        tokens = [parser.tokenize(source)] * count
+        elapsed1 = measure(parse_many, tokens, 'funcparserlib')
+        elapsed2 = measure(parse_many, tokens, 'fast')
+        rows.append(('%d stmts x %d' % (statements * 2, count),
+                     '%.3f' % elapsed1, '%.3f' % elapsed2,
+                     '%.1fx' % (elapsed1 / elapsed2)))
+
+    report('Parsing diagrams', rows)
+
+
+if __name__ == '__main__':
+    main()
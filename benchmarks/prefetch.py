@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of loading remote icons of nodes.
+
+Serves icons from a local HTTP server with latency, and compares serial
+downloads, concurrent prefetch and persistent cache (warm)::
+
+    $ python benchmarks/prefetch.py
+"""
+
+import sys
+import threading
+import time
+from tempfile import mkdtemp
+from shutil import rmtree
+from benchutils import measure, report
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.parser import parse_string
+from blockdiag.utils import images
+
+if sys.version_info[0] == 2:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+LATENCY = 0.05  # seconds per request
+
+
+class IconServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class IconRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(LATENCY)
+        content = b'icon' * 256
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def generate_source(server, count):
+    port = server.server_address[1]
+    lines = ['{']
+    for i in range(count):
+        lines.append('  N%d [icon = "http://127.0.0.1:%d/%d.png"];' %
+                     (i, port, i))
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def serial(tree):
+    images.cleanup()
+    images.PREFETCH_THREADS = 1
+    try:
+        ScreenNodeBuilder.build(tree)
+    finally:
+        images.PREFETCH_THREADS = 8
+
+
+def prefetch(tree):
+    images.cleanup()
+    ScreenNodeBuilder.build(tree)
+
+
+def main():
+    server = IconServer(('127.0.0.1', 0), IconRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    cachedir = mkdtemp()
+    try:
+        rows = [('icons', 'serial', 'prefetch', 'cached')]
+        for count in (10, 50):
+            tree = parse_string(generate_source(server, count))
+            images.enable_cache(cachedir)
+            prefetch(tree)  # warm up the persistent cache
+            cached = measure(prefetch, tree)
+            images.disable_cache()
+
+            rows.append((count, '%.3f' % measure(serial, tree, repeat=1),
+                         '%.3f' % measure(prefetch, tree), '%.3f' % cached))
+
+        report('Loading remote icons (building diagrams; %dms latency)' %
+               (LATENCY * 1000), rows)
+    finally:
+        images.cleanup()
+        server.shutdown()
+        rmtree(cachedir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of metrics of scaled (antialiased) diagrams.
+
+Compares AutoScaler proxy with DiagramMetrics(scale_ratio=2)::
+
+    $ python benchmarks/scaling.py
+"""
+
+from benchutils import generate_tree, measure, report
+from blockdiag import noderenderer
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.metrics import AutoScaler, DiagramMetrics
+from blockdiag.parser import parse_string
+
+
+def proxied_metrics(diagram):
+    return AutoScaler(DiagramMetrics(diagram), scale_ratio=2)
+
+
+def native_metrics(diagram):
+    return DiagramMetrics(diagram, scale_ratio=2)
+
+
+def run_metrics(diagram, create_metrics):
+    """Query metrics as DiagramDraw.draw() does"""
+    metrics = create_metrics(diagram)
+    for node in diagram.traverse_nodes():
+        renderer = noderenderer.get(node.shape, node.context.shape_namespace)
+        shape = renderer(node, metrics)
+        shape.textbox, shape.connectors
+        metrics.font_for(node)
+
+    for edge in diagram.traverse_edges():
+        m = metrics.edge(edge)
+        m.shaft.polylines, m.heads, m.labelbox
+        metrics.font_for(edge)
+
+    for group in diagram.traverse_groups():
+        metrics.group(group).marginbox
+
+
+def main():
+    rows = [('nodes', 'proxy (sec)', 'native (sec)', 'speedup')]
+    for count in (500, 2000):
+        source = generate_tree(count, branches=5)
+        diagram = ScreenNodeBuilder.build(parse_string(source))
+
+        proxied = measure(run_metrics, diagram, proxied_metrics)
+        native = measure(run_metrics, diagram, native_metrics)
+        rows.append((count, '%.3f' % proxied, '%.3f' % native,
+                     '%.1fx' % (proxied / native)))
+
+    report('Metrics of antialiased diagrams (scale_ratio=2)', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of rendering PNG images having shadows of nodes.
+
+Compares blurring shadows one by one with shared blurred images::
+
+    $ python benchmarks/shadow.py
+"""
+
+from benchutils import generate_tree, measure, report
+from blockdiag import drawer
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.imagedraw import png
+from blockdiag.imagedraw.utils import clear_caches
+from blockdiag.parser import parse_string
+
+
+def render(diagram, antialias):
+    draw = drawer.DiagramDraw('PNG', diagram, None, antialias=antialias)
+    draw.draw()
+    return draw.save()
+
+
+def render_without_cache(diagram, antialias):
+    area, png.SHADOW_CACHE_AREA = png.SHADOW_CACHE_AREA, 0
+    try:
+        return render(diagram, antialias)
+    finally:
+        png.SHADOW_CACHE_AREA = area
+
+
+def render_with_cache(diagram, antialias):
+    clear_caches()
+    return render(diagram, antialias)
+
+
+def main():
+    rows = [('nodes', 'antialias', 'each (sec)', 'shared (sec)', 'speedup')]
+    for count in (100, 500):
+        source = generate_tree(count, branches=10)
+        diagram = ScreenNodeBuilder.build(parse_string(source))
+        for antialias in (False, True):
+            image = render_without_cache(diagram, antialias)
+            assert image == render_with_cache(diagram, antialias)
+
+            elapsed1 = measure(render_without_cache, diagram, antialias,
+                               repeat=1)
+            elapsed2 = measure(render_with_cache, diagram, antialias,
+                               repeat=1)
+            rows.append((count, antialias, '%.3f' % elapsed1,
+                         '%.3f' % elapsed2, '%.1fx' % (elapsed1 / elapsed2)))
+
+    report('Rendering PNG images (shadows of nodes)', rows)
+
+
+if __name__ == '__main__':
+    main()
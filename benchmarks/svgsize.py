@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of size of SVG images of sample diagrams (tests/diagrams).
+
+Compares default SVG images with compact ones (compact=True)::
+
+    $ python benchmarks/svgsize.py
+"""
+
+import io
+import os
+import time
+import zlib
+from benchutils import generate_tree, report
+from blockdiag import drawer
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.parser import parse_string
+
+DIAGRAMS_DIR = os.path.join(os.path.dirname(__file__), '..', 'src',
+                            'blockdiag', 'tests', 'diagrams')
+
+
+def sample_diagrams():
+    for name in sorted(os.listdir(DIAGRAMS_DIR)):
+        if name.endswith('.diag'):
+            path = os.path.join(DIAGRAMS_DIR, name)
+            yield io.open(path, encoding='utf-8-sig').read()
+
+
+def render_all(sources, **kwargs):
+    """Returns elapsed time of drawing and total (and gzipped) size"""
+    elapsed = size = compressed = 0
+    for source in sources:
+        diagram = ScreenNodeBuilder.build(parse_string(source))
+
+        started = time.time()
+        draw = drawer.DiagramDraw('SVG', diagram, None, **kwargs)
+        draw.draw()
+        image = draw.save().encode('utf-8')
+        elapsed += time.time() - started
+
+        size += len(image)
+        compressed += len(zlib.compress(image))
+
+    return elapsed, size, compressed
+
+
+def main():
+    samples = []
+    for source in sample_diagrams():
+        try:
+            render_all([source])
+            samples.append(source)
+        except Exception:  # examples of errors, or diagrams having URLs
+            pass
+
+    rows = [('diagrams', 'mode', 'size (KB)', 'gzipped (KB)', 'time (sec)')]
+    for title, sources in (('%d samples' % len(samples), samples),
+                           ('1000 nodes', [generate_tree(1000)])):
+        for mode, options in (('default', {}), ('compact', {'compact': 1})):
+            elapsed, size, compressed = render_all(sources, **options)
+            rows.append((title, mode, '%.1f' % (size / 1024.0),
+                         '%.1f' % (compressed / 1024.0), '%.3f' % elapsed))
+
+    report('Size of SVG images', rows)
+
+
+if __name__ == '__main__':
+    main()
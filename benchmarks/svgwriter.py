@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of peak memory on writing SVG of large diagrams.
+
+Compares the tree writer (default) with streaming one (stream=True)::
+
+    $ python benchmarks/svgwriter.py
+
+Requires python 3.4 or later (tracemalloc).
+"""
+
+import os
+import time
+import tracemalloc
+from tempfile import mkdtemp
+from shutil import rmtree
+from benchutils import generate_tree, report
+from blockdiag import drawer
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.parser import parse_string
+
+
+def render(diagram, filename, **kwargs):
+    """Returns elapsed time and peak memory of drawing and writing SVG"""
+    tracemalloc.start()
+    started = time.time()
+    draw = drawer.DiagramDraw('SVG', diagram, filename, **kwargs)
+    draw.draw()
+    draw.save()
+    elapsed = time.time() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak / (1024.0 * 1024)
+
+
+def main():
+    tmpdir = mkdtemp()
+    try:
+        rows = [('nodes', 'tree (MB)', 'stream (MB)', 'tree (sec)',
+                 'stream (sec)')]
+        for count in (1000, 5000, 10000):
+            source = generate_tree(count, branches=20)
+            diagram = ScreenNodeBuilder.build(parse_string(source))
+            filename = os.path.join(tmpdir, 'output.svg')
+
+            tree = render(diagram, filename)
+            stream = render(diagram, filename, stream=True)
+            rows.append((count, '%.1f' % tree[1], '%.1f' % stream[1],
+                         '%.3f' % tree[0], '%.3f' % stream[0]))
+
+        report('Writing SVG (peak memory of drawing and saving)', rows)
+    finally:
+        rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of drawing labels (TrueType font) to PNG images.
+
+Compares drawing text via mask images with drawing onto the canvas::
+
+    $ python benchmarks/text.py
+"""
+
+import os
+from benchutils import measure, report
+from PIL import Image, ImageDraw
+from blockdiag.imagedraw.png import ImageDrawEx, ttfont_for
+from blockdiag.utils.fontmap import FontInfo
+
+FONTPATH = os.path.join(os.path.dirname(__file__), '..', 'src', 'blockdiag',
+                        'tests', 'VLGothic', 'VL-Gothic-Regular.ttf')
+LABELS = 1000
+
+
+class LegacyImageDrawEx(ImageDrawEx):
+    """text() of blockdiag-1.5 (mask and filler images for each line)"""
+    def paste(self, image, pt, mask=None):
+        self._image.paste(image, pt, mask)
+        self.draw = ImageDraw.Draw(self._image)
+
+    def text(self, xy, string, font, **kwargs):
+        ttfont = ttfont_for(font)
+        size = ttfont.getsize(string)
+
+        mask = Image.new('1', size)
+        draw = ImageDraw.Draw(mask)
+        draw.text((0, 0), string, fill='white', font=ttfont)
+
+        filler = Image.new('RGB', size, kwargs.get('fill'))
+        self.paste(filler, xy, mask)
+
+
+class AllocationCounter(object):
+    """Counts Image.new() and ImageDraw.Draw() calls"""
+    def __init__(self):
+        self.count = 0
+
+    def wrap(self, func):
+        def wrapper(*args, **kwargs):
+            self.count += 1
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    def __enter__(self):
+        self.originals = (Image.new, ImageDraw.Draw)
+        Image.new = self.wrap(Image.new)
+        ImageDraw.Draw = self.wrap(ImageDraw.Draw)
+        return self
+
+    def __exit__(self, *args):
+        Image.new, ImageDraw.Draw = self.originals
+
+
+def draw_labels(klass):
+    """Draws labels having two lines (text folding is not measured)"""
+    drawer = klass(None)
+    drawer.set_canvas_size((1024, 1024))
+    font = FontInfo('serif', FONTPATH, 11)
+    for i in range(LABELS):
+        x = i % 8 * 128
+        y = i % 32 * 32
+        drawer.text((x, y), 'label of node %d' % i, font, fill=(0, 0, 0))
+        drawer.text((x, y + 14), '(multiple lines)', font, fill=(0, 0, 0))
+
+    return drawer._image.tobytes()
+
+
+def main():
+    assert draw_labels(LegacyImageDrawEx) == draw_labels(ImageDrawEx)
+
+    rows = [('drawer', 'allocations/label', 'time (sec)')]
+    for name, klass in (('mask', LegacyImageDrawEx), ('direct', ImageDrawEx)):
+        with AllocationCounter() as counter:
+            draw_labels(klass)
+
+        elapsed = measure(draw_labels, klass)
+        rows.append((name, '%.1f' % (counter.count * 1.0 / LABELS),
+                     '%.3f' % elapsed))
+
+    report('Drawing %d labels' % LABELS, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of text folding on long labels (500 characters).
+
+Compares binary search of folding positions with linear search::
+
+    $ python benchmarks/textfolder.py
+"""
+
+import os
+from benchutils import measure, report
+from blockdiag.imagedraw import textfolder
+from blockdiag.imagedraw.png import ImageDrawEx
+from blockdiag.imagedraw.utils import clear_caches
+from blockdiag.utils import Box
+from blockdiag.utils.fontmap import FontInfo
+
+FONTPATH = os.path.join(os.path.dirname(__file__), '..', 'src', 'blockdiag',
+                        'tests', 'VLGothic', 'VL-Gothic-Regular.ttf')
+
+
+def linear_splittext(metrics, text, bound, measure='width'):
+    folded = []
+    if text == '':
+        folded.append(' ')
+
+    for i in range(len(text), 0, -1):
+        textsize = metrics.textsize(text[0:i])
+
+        if getattr(textsize, measure) <= bound:
+            folded.append(text[0:i])
+            if text[i:]:
+                folded += linear_splittext(metrics, text[i:], bound, measure)
+            break
+
+    return folded
+
+
+def linear_truncate_text(metrics, text, bound, measure='width'):
+    for i in range(len(text), 0, -1):
+        textsize = metrics.textsize(text[0:i] + ' ...')
+
+        if getattr(textsize, measure) <= bound:
+            return text[0:i] + ' ...'
+
+    return text
+
+
+def fold(klass, label, splittext, truncate_text):
+    # measure without caches of text size
+    clear_caches()
+
+    saved = (textfolder.splittext, textfolder.truncate_text)
+    textfolder.splittext = splittext
+    textfolder.truncate_text = truncate_text
+    try:
+        drawer = ImageDrawEx(None)
+        font = FontInfo('serif', FONTPATH, 11)
+        box = Box(0, 0, 400, 400)
+        return list(klass(drawer, box, label, font).lines)
+    finally:
+        textfolder.splittext, textfolder.truncate_text = saved
+
+
+def main():
+    label = ('lorem ipsum dolor sit amet ' * 20)[:500]
+    binary = (textfolder.splittext, textfolder.truncate_text)
+    linear = (linear_splittext, linear_truncate_text)
+
+    rows = [('folder', 'linear (sec)', 'binary (sec)', 'speedup')]
+    for klass in (textfolder.HorizontalTextFolder,
+                  textfolder.VerticalTextFolder):
+        assert fold(klass, label, *linear) == fold(klass, label, *binary)
+
+        elapsed1 = measure(fold, klass, label, *linear)
+        elapsed2 = measure(fold, klass, label, *binary)
+        rows.append((klass.__name__[:-10], '%.3f' % elapsed1,
+                     '%.3f' % elapsed2, '%.1fx' % (elapsed1 / elapsed2)))
+
+    report('Folding labels of 500 characters', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of peak memory on rendering PNG images of large diagrams.
+
+Compares the full canvas (default) with tiled rendering (tile_size=N)::
+
+    $ python benchmarks/tiles.py
+
+Each image is rendered in a child process to measure its peak RSS
+(requires the resource module; Unix only).
+"""
+
+import os
+import resource
+import time
+from multiprocessing import Pool
+from tempfile import mkdtemp
+from shutil import rmtree
+from benchutils import report
+from blockdiag import drawer
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.parser import parse_string
+
+
+def generate_grid(count):
+    """Generate a diagram of count x count nodes (count chains)"""
+    lines = []
+    for row in range(count):
+        nodes = ['N%d_%d' % (row, col) for col in range(count)]
+        lines.append('  %s;' % ' -> '.join(nodes))
+
+    return '{\n%s\n}' % '\n'.join(lines)
+
+
+def render(args):
+    """Returns elapsed time, peak memory (MB) and size of the image"""
+    source, filename, kwargs = args
+    diagram = ScreenNodeBuilder.build(parse_string(source))
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.time()
+    draw = drawer.DiagramDraw('PNG', diagram, filename, **kwargs)
+    draw.draw()
+    draw.save()
+    elapsed = time.time() - started
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    return elapsed, peak / 1024.0, tuple(draw.pagesize())
+
+
+def measure_in_child(*args):
+    pool = Pool(1)
+    try:
+        return pool.map(render, [args])[0]
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main():
+    tmpdir = mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'output.png')
+        rows = [('grid', 'antialias', 'image size', 'full (MB)',
+                 'tiled (MB)', 'full (sec)', 'tiled (sec)')]
+        for count in (30, 60):
+            source = generate_grid(count)
+            for antialias in (False, True):
+                full = measure_in_child(source, filename,
+                                        dict(antialias=antialias))
+                tiled = measure_in_child(source, filename,
+                                         dict(antialias=antialias,
+                                              tile_size=512))
+                rows.append(('%dx%d' % (count, count), antialias,
+                             '%dx%d' % full[2], '%.1f' % full[1],
+                             '%.1f' % tiled[1], '%.3f' % full[0],
+                             '%.3f' % tiled[0]))
+
+        report('Rendering PNG images (peak memory of drawing and saving)',
+               rows)
+    finally:
+        rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
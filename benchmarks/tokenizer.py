@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark of tokenizer on a diagram of 1MB (and small diagrams).
+
+Compares precompiled tokenizer with funcparserlib.lexer.make_tokenizer()::
+
+    $ python benchmarks/tokenizer.py
+"""
+
+import re
+from benchutils import measure, report
+from funcparserlib.lexer import make_tokenizer
+from blockdiag import parser
+
+
+def generate_source(size):
+    """Generate source of a diagram having comments, attributes and labels"""
+    lines = ['blockdiag {', '  // generated diagram',
+             '  default_shape = roundedbox;']
+    i = 0
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append('  N%d -> N%d [label = "edge %d", color = red];' %
+                     (i // 3, i + 1, i))
+        lines.append('  N%d [width = 128];  /* node %d */' % (i, i))
+        i += 1
+    lines.append('}')
+
+    return '\n'.join(lines)
+
+
+def legacy_tokenize(string):
+    specs = [
+        ('Comment', (r'/\*(.|[\r\n])*?\*/', re.MULTILINE)),
+        ('Comment', (r'(//|#).*',)),
+        ('NL',      (r'[\r\n]+',)),
+        ('Space',   (r'[ \t\r\n]+',)),
+        ('Name',    (parser.TOKEN_SPECS[4][1],)),
+        ('Op',      (r'[{};,=\[\]]|(<->)|(<-)|(--)|(->)|(>-<)|(-<)|(>-)',)),
+        ('Number',  (r'-?(\.[0-9]+)|([0-9]+(\.[0-9]*)?)',)),
+        ('String',  (r'(?P<quote>"|\').*?(?<!\\)(?P=quote)', re.DOTALL)),
+    ]
+    useless = ['Comment', 'NL', 'Space']
+    t = make_tokenizer(specs)
+    return [x for x in t(string) if x.type not in useless]
+
+
+def tokenize_many(tokenize, sources):
+    for source in sources:
+        tokenize(source)
+
+
+def main():
+    rows = [('source', 'legacy (sec)', 'compiled (sec)', 'speedup')]
+    for size, count in ((1024 * 1024, 1), (1024, 1000)):
+        source = generate_source(size)
+        tokens = [(t.type, t.value, t.start, t.end)
+                  for t in parser.tokenize(source)]
+        assert tokens == [(t.type, t.value, t.start, t.end)
+                          for t in legacy_tokenize(source)]
+
+        sources = [source] * count
+        elapsed1 = measure(tokenize_many, legacy_tokenize, sources)
+        elapsed2 = measure(tokenize_many, parser.tokenize, sources)
+        rows.append(('%dKB x %d' % (size // 1024, count), '%.3f' % elapsed1,
+                     '%.3f' % elapsed2, '%.1fx' % (elapsed1 / elapsed2)))
+
+    report('Tokenizing diagrams', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,15 +15,20 @@
 
 from blockdiag import parser
 from blockdiag.elements import Diagram, DiagramNode, NodeGroup, DiagramEdge
+from blockdiag.elements import Base
 from blockdiag.plugins import fire_node_event
-from blockdiag.utils import unquote, XY
+from blockdiag.utils import images, unquote, XY
 from blockdiag.utils.compat import cmp_to_key
 
+# max steps to enumerate simple cycles in DiagramLayoutManager
+CIRCULAR_SCAN_LIMIT = 100000
+
 
 class DiagramTreeBuilder:
-    def build(self, tree, config):
+    def build(self, tree, config, context=None):
         self.config = config
-        self.diagram = Diagram()
+        self.context = context or Base.context
+        self.diagram = self.context.Diagram()
         self.instantiate(self.diagram, tree)
         for subgroup in self.diagram.traverse_groups():
             if len(subgroup.nodes) == 0:
@@ -88,25 +93,27 @@ class DiagramTreeBuilder:
 
             # Instantiate statements
             if isinstance(stmt, parser.Node):
-                node = DiagramNode.get(stmt.id)
+                node = self.context.DiagramNode.get(stmt.id)
                 node.set_attributes(stmt.attrs)
                 self.belong_to(node, group)
 
             elif isinstance(stmt, parser.Edge):
-                from_nodes = [DiagramNode.get(n) for n in stmt.from_nodes]
-                to_nodes = [DiagramNode.get(n) for n in stmt.to_nodes]
+                DiagramNodeClass = self.context.DiagramNode
+                from_nodes = [DiagramNodeClass.get(n)
+                              for n in stmt.from_nodes]
+                to_nodes = [DiagramNodeClass.get(n) for n in stmt.to_nodes]
 
                 for node in from_nodes + to_nodes:
                     self.belong_to(node, group)
 
                 for node1 in from_nodes:
                     for node2 in to_nodes:
-                        edge = DiagramEdge.get(node1, node2)
+                        edge = self.context.DiagramEdge.get(node1, node2)
                         edge.set_dir(stmt.edge_type)
                         edge.set_attributes(stmt.attrs)
 
             elif isinstance(stmt, parser.Group):
-                subgroup = NodeGroup.get(stmt.id)
+                subgroup = self.context.NodeGroup.get(stmt.id)
                 subgroup.level = group.level + 1
                 self.belong_to(subgroup, group)
                 self.instantiate(subgroup, stmt)
@@ -117,7 +124,7 @@ class DiagramTreeBuilder:
             elif isinstance(stmt, parser.Extension):
                 if stmt.type == 'class':
                     name = unquote(stmt.name)
-                    Diagram.classes[name] = stmt
+                    self.context.Diagram.classes[name] = stmt
                 elif stmt.type == 'plugin':
                     self.diagram.set_plugin(stmt.name, stmt.attrs,
                                             config=self.config)
@@ -131,25 +138,105 @@ class DiagramTreeBuilder:
     def bind_edges(self, group):
         for node in group.nodes:
             if isinstance(node, DiagramNode):
-                group.edges += DiagramEdge.find(node)
+                group.edges += self.context.DiagramEdge.find(node)
             else:
                 self.bind_edges(node)
 
 
+class NodeRelations(object):
+    """Parent/child adjacency of nodes built from a list of edges.
+
+    Related nodes are sorted by their ``order``; rebuild the index
+    (or call ``DiagramLayoutManager.invalidate_relations()``) after
+    the order of nodes has been changed.
+    """
+    def __init__(self, edges):
+        self.edges = edges
+        self.parents = {}
+        self.children = {}
+
+        uniq = set()
+        for edge in edges:
+            node1 = edge.node1
+            node2 = edge.node2
+            if edge.folded or (node1, node2) in uniq:
+                continue
+            elif node1 == node2 or node1.group != node2.group:
+                continue
+
+            uniq.add((node1, node2))
+            self.parents.setdefault(node2, []).append(node1)
+            self.children.setdefault(node1, []).append(node2)
+
+        for related in self.parents.values():
+            related.sort(key=lambda x: x.order)
+
+        for related in self.children.values():
+            related.sort(key=lambda x: x.order)
+
+    def get_parent_nodes(self, node):
+        return list(self.parents.get(node, []))
+
+    def get_child_nodes(self, node):
+        return list(self.children.get(node, []))
+
+
+class Coordinates(object):
+    """Occupied cells of layout.
+
+    Works as a list of XY for compatibility; membership tests and
+    queries for heights of columns take constant time (or proportional
+    to the number of columns).
+    """
+    def __init__(self):
+        self.cells = []
+        self.occupied = set()
+        self.heights = {}
+
+    def __contains__(self, xy):
+        return xy in self.occupied
+
+    def __iter__(self):
+        return iter(self.cells)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def append(self, xy):
+        self.cells.append(xy)
+        self.occupied.add(xy)
+
+        x, y = xy
+        if x not in self.heights or self.heights[x] < y:
+            self.heights[x] = y
+
+    def max_y(self, min_x=None):
+        """Return the lowest occupied row (of columns from min_x)"""
+        heights = [y for x, y in self.heights.items()
+                   if min_x is None or min_x <= x]
+        if heights:
+            return max(heights)
+        else:
+            return None
+
+
 class DiagramLayoutManager:
     def __init__(self, diagram):
         self.diagram = diagram
 
         self.circulars = []
         self.heightRefs = []
-        self.coordinates = []
+        self.coordinates = Coordinates()
+        self.edges = []
+        self._relations = None
 
     def run(self):
         if isinstance(self.diagram, Diagram):
             for group in self.diagram.traverse_groups():
                 self.__class__(group).run()
 
-        self.edges = DiagramEdge.find_by_level(self.diagram.level)
+        DiagramEdgeClass = self.diagram.context.DiagramEdge
+        self.edges = DiagramEdgeClass.find_by_level(self.diagram.level)
         self.do_layout()
         self.diagram.fixiate()
 
@@ -180,29 +267,31 @@ class DiagramLayoutManager:
         for node in self.diagram.nodes:
             if node.xy.x == 0:
                 self.set_node_ypos(node, height)
-                height = max(xy.y for xy in self.coordinates) + 1
+                height = self.coordinates.max_y() + 1
 
-    def get_related_nodes(self, node, parent=False, child=False):
-        uniq = {}
-        for edge in self.edges:
-            if edge.folded:
-                continue
+    @property
+    def relations(self):
+        if self._relations is None or self._relations.edges is not self.edges:
+            self._relations = NodeRelations(self.edges)
 
-            if parent and edge.node2 == node:
-                uniq[edge.node1] = 1
-            elif child and edge.node1 == node:
-                uniq[edge.node2] = 1
+        return self._relations
 
+    def invalidate_relations(self):
+        self._relations = None
+
+    def get_related_nodes(self, node, parent=False, child=False):
         related = []
-        for uniq_node in uniq.keys():
-            if uniq_node == node:
-                pass
-            elif uniq_node.group != node.group:
-                pass
-            else:
-                related.append(uniq_node)
+        if parent:
+            related += self.relations.get_parent_nodes(node)
+
+        if child:
+            for child_node in self.relations.get_child_nodes(node):
+                if child_node not in related:
+                    related.append(child_node)
+
+            if parent:
+                related.sort(key=lambda x: x.order)
 
-        related.sort(key=lambda x: x.order)
         return related
 
     def get_parent_nodes(self, node):
@@ -212,35 +301,149 @@ class DiagramLayoutManager:
         return self.get_related_nodes(node, child=True)
 
     def detect_circulars(self):
-        for node in self.diagram.nodes:
-            if not [x for x in self.circulars if node in x]:
-                self.detect_circulars_sub(node, [node])
+        """Detect circular references (lists of nodes in cycles).
+
+        is_circular_ref() depends on the order of nodes in circulars; so
+        simple cycles are enumerated and merged as blockdiag-1.5 did,
+        without walking into nodes which do not reach any cycle.  If it
+        takes more than CIRCULAR_SCAN_LIMIT steps (very dense diagrams),
+        strongly connected components are used instead.
+        """
+        components = self.strongly_connected_components()
+        cyclic = set()
+        for component in components:
+            node = component[0]
+            if len(component) > 1 or node in self.get_child_nodes(node):
+                cyclic.update(component)
+
+        if not cyclic:
+            return
+
+        reachable = set(cyclic)  # nodes which reach to cycles
+        nodes = list(cyclic)
+        while nodes:
+            for parent in self.get_parent_nodes(nodes.pop()):
+                if parent not in reachable:
+                    reachable.add(parent)
+                    nodes.append(parent)
+
+        circulars = self.scan_circulars(reachable, CIRCULAR_SCAN_LIMIT)
+        if circulars is None:
+            self.circulars = [c for c in components if len(c) > 1]
+        else:
+            self.circulars = circulars
+
+    def scan_circulars(self, reachable, limit):
+        """Enumerate and merge simple cycles; returns None if over limit"""
+        steps = 0
+        circulars = []
+        found = set()
+        members = set()
+        for root in self.diagram.nodes:
+            if root not in reachable or root in members:
+                continue
+
+            path = [root]
+            position = {root: 0}
+            children = [iter(self.get_child_nodes(root))]
+            while children:
+                for child in children[-1]:
+                    steps += 1
+                    if steps > limit:
+                        return None
+
+                    if child in position:
+                        circular = path[position[child]:]
+                        if tuple(circular) not in found:
+                            found.add(tuple(circular))
+                            members.update(circular)
+                            circulars.append(circular)
+                    elif child in reachable:
+                        position[child] = len(path)
+                        path.append(child)
+                        children.append(iter(self.get_child_nodes(child)))
+                        break
+                else:
+                    children.pop()
+                    del position[path.pop()]
 
         # remove part of other circular
-        for c1 in self.circulars[:]:
-            for c2 in self.circulars:
+        for c1 in circulars[:]:
+            for c2 in circulars:
+                steps += 1
+                if steps > limit:
+                    return None
+
                 intersect = set(c1) & set(c2)
 
                 if c1 != c2 and set(c1) == intersect:
-                    if c1 in self.circulars:
-                        self.circulars.remove(c1)
+                    if c1 in circulars:
+                        circulars.remove(c1)
                     break
 
                 if c1 != c2 and intersect:
-                    if c1 in self.circulars:
-                        self.circulars.remove(c1)
-                    self.circulars.remove(c2)
-                    self.circulars.append(c1 + c2)
+                    if c1 in circulars:
+                        circulars.remove(c1)
+                    circulars.remove(c2)
+                    circulars.append(c1 + c2)
                     break
 
-    def detect_circulars_sub(self, node, parents):
-        for child in self.get_child_nodes(node):
-            if child in parents:
-                i = parents.index(child)
-                if parents[i:] not in self.circulars:
-                    self.circulars.append(parents[i:])
-            else:
-                self.detect_circulars_sub(child, parents + [child])
+        return circulars
+
+    def strongly_connected_components(self):
+        """Returns strongly connected components of nodes.
+
+        Uses Tarjan's algorithm without recursion.  Each component is
+        sorted in reverse postorder of depth-first search (children are
+        visited from the last one), so all edges in the component except
+        the ones going back to the entry follow the order of the list.
+        """
+        components = []
+        index = {}
+        lowlink = {}
+        finished = {}
+        stack = []
+        onstack = set()
+
+        def visit(node):
+            index[node] = lowlink[node] = len(index)
+            stack.append(node)
+            onstack.add(node)
+            return (node, reversed(self.get_child_nodes(node)))
+
+        for root in self.diagram.nodes:
+            if root in index:
+                continue
+
+            path = [visit(root)]
+            while path:
+                node, children = path[-1]
+                for child in children:
+                    if child not in index:
+                        path.append(visit(child))
+                        break
+                    elif child in onstack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                else:
+                    path.pop()
+                    finished[node] = len(finished)
+                    if path:
+                        parent = path[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            onstack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+
+                        component.sort(key=lambda x: -finished[x])
+                        components.append(component)
+
+        return components
 
     def is_circular_ref(self, node1, node2):
         for circular in self.circulars:
@@ -354,6 +557,7 @@ class DiagramLayoutManager:
                             break
 
         self.diagram.update_order()
+        self.invalidate_relations()
 
     def compare_child_node_order(self, parent, node1, node2):
         def compare(x, y):
@@ -371,8 +575,9 @@ class DiagramLayoutManager:
             else:
                 return 1
 
-        edges = (DiagramEdge.find(parent, node1) +
-                 DiagramEdge.find(parent, node2))
+        DiagramEdgeClass = self.diagram.context.DiagramEdge
+        edges = (DiagramEdgeClass.find(parent, node1) +
+                 DiagramEdgeClass.find(parent, node2))
         edges.sort(key=cmp_to_key(compare))
         if len(edges) == 0:
             return 0
@@ -426,9 +631,9 @@ class DiagramLayoutManager:
 
                 if (prev_child and grandchild > 1 and
                    (not self.is_rhombus(prev_child, child))):
-                    coord = [p.y for p in self.coordinates if p.x > child.xy.x]
-                    if coord and max(coord) >= node.xy.y:
-                        height = max(coord) + 1
+                    max_y = self.coordinates.max_y(child.xy.x + 1)
+                    if max_y is not None and max_y >= node.xy.y:
+                        height = max_y + 1
 
                 while True:
                     if self.set_node_ypos(child, height):
@@ -471,7 +676,7 @@ class DiagramLayoutManager:
 
     def get_parent_node_ypos(self, parent, child):
         heights = []
-        for e in DiagramEdge.find(parent, child):
+        for e in self.diagram.context.DiagramEdge.find(parent, child):
             y = parent.xy.y
 
             node = e.node1
@@ -522,7 +727,13 @@ class EdgeLayoutManager(object):
             for edge in (e for e in group.edges if e.style != 'none'):
                 yield edge
 
+    @property
+    def cells(self):
+        """Returns a mapping of coordinates to the node placed on it"""
+        return dict((node.xy, node) for node in self.nodes)
+
     def run(self):
+        cells = self.cells
         for edge in self.edges:
             _dir = edge.direction
 
@@ -531,91 +742,93 @@ class EdgeLayoutManager(object):
                     r = range(edge.node1.xy.x + 1, edge.node2.xy.x)
                     for x in r:
                         xy = (x, edge.node1.xy.y)
-                        nodes = [x for x in self.nodes if x.xy == xy]
-                        if len(nodes) > 0:
+                        if xy in cells:
                             edge.skipped = 1
                 elif _dir == 'right-up':
                     r = range(edge.node1.xy.x + 1, edge.node2.xy.x)
                     for x in r:
                         xy = (x, edge.node1.xy.y)
-                        nodes = [x for x in self.nodes if x.xy == xy]
-                        if len(nodes) > 0:
+                        if xy in cells:
                             edge.skipped = 1
                 elif _dir == 'right-down':
                     if self.diagram.edge_layout == 'flowchart':
                         r = range(edge.node1.xy.y, edge.node2.xy.y)
                         for y in r:
                             xy = (edge.node1.xy.x, y + 1)
-                            nodes = [x for x in self.nodes if x.xy == xy]
-                            if len(nodes) > 0:
+                            if xy in cells:
                                 edge.skipped = 1
 
                     r = range(edge.node1.xy.x + 1, edge.node2.xy.x)
                     for x in r:
                         xy = (x, edge.node2.xy.y)
-                        nodes = [x for x in self.nodes if x.xy == xy]
-                        if len(nodes) > 0:
+                        if xy in cells:
                             edge.skipped = 1
                 elif _dir in ('left-down', 'down'):
                     r = range(edge.node1.xy.y + 1, edge.node2.xy.y)
                     for y in r:
                         xy = (edge.node1.xy.x, y)
-                        nodes = [x for x in self.nodes if x.xy == xy]
-                        if len(nodes) > 0:
+                        if xy in cells:
                             edge.skipped = 1
                 elif _dir == 'up':
                     r = range(edge.node2.xy.y + 1, edge.node1.xy.y)
                     for y in r:
                         xy = (edge.node1.xy.x, y)
-                        nodes = [x for x in self.nodes if x.xy == xy]
-                        if len(nodes) > 0:
+                        if xy in cells:
                             edge.skipped = 1
             else:
                 if _dir == 'right':
                     r = range(edge.node1.xy.x + 1, edge.node2.xy.x)
                     for x in r:
                         xy = (x, edge.node1.xy.y)
-                        nodes = [x for x in self.nodes if x.xy == xy]
-                        if len(nodes) > 0:
+                        if xy in cells:
                             edge.skipped = 1
                 elif _dir in ('left-down', 'down'):
                     r = range(edge.node1.xy.y + 1, edge.node2.xy.y)
                     for y in r:
                         xy = (edge.node1.xy.x, y)
-                        nodes = [x for x in self.nodes if x.xy == xy]
-                        if len(nodes) > 0:
+                        if xy in cells:
                             edge.skipped = 1
                 elif _dir == 'right-down':
                     if self.diagram.edge_layout == 'flowchart':
                         r = range(edge.node1.xy.x, edge.node2.xy.x)
                         for x in r:
                             xy = (x + 1, edge.node1.xy.y)
-                            nodes = [x for x in self.nodes if x.xy == xy]
-                            if len(nodes) > 0:
+                            if xy in cells:
                                 edge.skipped = 1
 
                     r = range(edge.node1.xy.y + 1, edge.node2.xy.y)
                     for y in r:
                         xy = (edge.node2.xy.x, y)
-                        nodes = [x for x in self.nodes if x.xy == xy]
-                        if len(nodes) > 0:
+                        if xy in cells:
                             edge.skipped = 1
 
 
 class ScreenNodeBuilder:
     @classmethod
-    def build(cls, tree, config=None, layout=True):
-        DiagramNode.clear()
-        DiagramEdge.clear()
-        NodeGroup.clear()
-        Diagram.clear()
+    def build(cls, tree, config=None, layout=True, context=None):
+        if context is None:
+            DiagramNode.clear()
+            DiagramEdge.clear()
+            NodeGroup.clear()
+            Diagram.clear()
 
-        return cls(tree, config, layout).run()
+        return cls(tree, config, layout, context).run()
 
-    def __init__(self, tree, config, layout):
-        self.diagram = DiagramTreeBuilder().build(tree, config)
+    def __init__(self, tree, config, layout, context=None):
+        self.diagram = DiagramTreeBuilder().build(tree, config, context)
         self.config = config
         self.layout = layout
+        self.prefetch_images()
+
+    def prefetch_images(self):
+        """Download icons and backgrounds of nodes concurrently"""
+        urls = []
+        for node in self.diagram.traverse_nodes():
+            if isinstance(node, DiagramNode):
+                urls.append(node.icon)
+                urls.append(node.background)
+
+        images.prefetch(url for url in urls if url)
 
     def run(self):
         if self.layout:
@@ -662,7 +875,7 @@ class SeparateDiagramBuilder(ScreenNodeBuilder):
                 n.colheight = 1
                 n.separated = False
 
-            for edge in DiagramEdge.find_all():
+            for edge in self.diagram.context.DiagramEdge.find_all():
                 edge.skipped = False
                 edge.crosspoints = []
 
@@ -701,8 +914,9 @@ class SeparateDiagramBuilder(ScreenNodeBuilder):
             base.level = group.level - 1
 
             # bind edges on base diagram (outer the group)
-            edges = (DiagramEdge.find(None, group) +
-                     DiagramEdge.find(group, None))
+            DiagramEdgeClass = self.diagram.context.DiagramEdge
+            edges = (DiagramEdgeClass.find(None, group) +
+                     DiagramEdgeClass.find(group, None))
             base.edges = self._filter_edges(edges, self.diagram, group.level)
 
             # bind edges on target group (inner the group)
@@ -723,9 +937,9 @@ class SeparateDiagramBuilder(ScreenNodeBuilder):
                     g.separated = True
 
             # pick up nodes to base diagram
-            nodes1 = [e.node1 for e in DiagramEdge.find(None, group)]
+            nodes1 = [e.node1 for e in DiagramEdgeClass.find(None, group)]
             nodes1.sort(key=lambda x: x.order)
-            nodes2 = [e.node2 for e in DiagramEdge.find(group, None)]
+            nodes2 = [e.node2 for e in DiagramEdgeClass.find(group, None)]
             nodes2.sort(key=lambda x: x.order)
 
             nodes = nodes1 + [group] + nodes2
@@ -51,7 +51,11 @@ class BlockdiagApp(Application):
                                    fontmap=self.fontmap,
                                    antialias=self.options.antialias,
                                    nodoctype=self.options.nodoctype,
-                                   transparency=self.options.transparency)
+                                   compact=self.options.compact,
+                                   transparency=self.options.transparency,
+                                   scale=self.options.scale,
+                                   tile_size=self.options.tile_size,
+                                   stream=True)
                 draw.draw()
                 draw.save()
 
@@ -15,7 +15,7 @@
 
 from collections import defaultdict
 from blockdiag import imagedraw, noderenderer
-from blockdiag.metrics import AutoScaler, DiagramMetrics
+from blockdiag.metrics import DiagramMetrics
 
 
 class DiagramDraw(object):
@@ -31,22 +31,38 @@ class DiagramDraw(object):
         self.filename = filename
         self.shadow = self.shadow_colors[self.format.upper()]
 
-        if self.format == 'PNG' and kwargs.get('antialias'):
+        # antialias: True (2x) or ratio of supersampling (an integer)
+        antialias = kwargs.get('antialias')
+        if antialias and antialias is not True:
+            if int(antialias) != antialias or antialias < 1:
+                msg = "antialias should be True or an integer ratio: %r"
+                raise ValueError(msg % (antialias,))
+
+        if self.format == 'PNG' and antialias is True:
             self.scale_ratio = 2
+        elif self.format == 'PNG' and antialias:
+            self.scale_ratio = int(antialias)
         else:
             self.scale_ratio = 1
 
+        # scale: ratio of the output image (any positive number)
+        self.scale = kwargs.get('scale') or 1
+        if self.scale <= 0:
+            raise ValueError("scale should be a positive number: %r" %
+                             (self.scale,))
+
         self.drawer = imagedraw.create(self.format, self.filename,
                                        filters=['linejump'],
                                        scale_ratio=self.scale_ratio,
                                        **kwargs)
 
+        options = dict(drawer=self.drawer, fontmap=kwargs.get('fontmap'))
+        if self.scale_ratio * self.scale != 1:
+            options['scale_ratio'] = self.scale_ratio * self.scale
+        if self.scale != 1:
+            options['original_ratio'] = self.scale
         self.metrics = self.create_metrics(kwargs.get('basediagram', diagram),
-                                           drawer=self.drawer,
-                                           fontmap=kwargs.get('fontmap'))
-        if self.scale_ratio == 2:
-            self.metrics = AutoScaler(self.metrics,
-                                      scale_ratio=self.scale_ratio)
+                                           **options)
 
         self.drawer.set_canvas_size(self.pagesize())
         self.drawer.set_options(jump_radius=self.metrics.cellsize / 2)
@@ -109,7 +125,7 @@ class DiagramDraw(object):
         # Drop node shadows.
         for node in self.nodes:
             if node.color != 'none' and self.diagram.shadow_style != 'none':
-                r = noderenderer.get(node.shape)
+                r = noderenderer.get(node.shape, node.context.shape_namespace)
 
                 shape = r(node, self.metrics)
                 if node.href and self.format == 'SVG':
@@ -141,7 +157,7 @@ class DiagramDraw(object):
             self.group_label(node, **kwargs)
 
     def node(self, node, **kwargs):
-        r = noderenderer.get(node.shape)
+        r = noderenderer.get(node.shape, node.context.shape_namespace)
         shape = r(node, self.metrics)
         if node.href and self.format == 'SVG':
             drawer = self.drawer.anchor(node.href)
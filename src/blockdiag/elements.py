@@ -66,8 +66,9 @@ class Base(object):
         value = unquote(attr.value)
 
         if name == 'class':
-            if value in Diagram.classes:
-                klass = Diagram.classes[value]
+            classes = self.context.Diagram.classes
+            if value in classes:
+                klass = classes[value]
                 self.set_attributes(klass.attrs)
             else:
                 msg = "Unknown class: %s" % value
@@ -195,7 +196,7 @@ class DiagramNode(Element):
         self.linecolor = images.color_to_rgb(color)
 
     def set_shape(self, value):
-        if noderenderer.get(value):
+        if noderenderer.get(value, self.context.shape_namespace):
             self.shape = value
         else:
             msg = "unknown node shape: %s" % value
@@ -556,6 +557,7 @@ class Diagram(NodeGroup):
         cls.shadow_style = 'blur'
         cls.linecolor = (0, 0, 0)
         cls.classes = {}
+        noderenderer.set_default_namespace('', cls.context.shape_namespace)
 
     def __init__(self):
         super(Diagram, self).__init__(None)
@@ -578,8 +580,8 @@ class Diagram(NodeGroup):
         plugins.load(modules, diagram=self, **kwargs)
 
     def set_default_shape(self, value):
-        if noderenderer.get(value):
-            DiagramNode.set_default_shape(value)
+        if noderenderer.get(value, self.context.shape_namespace):
+            self._DiagramNode.set_default_shape(value)
         else:
             msg = "unknown node shape: %s" % value
             raise AttributeError(msg)
@@ -587,7 +589,7 @@ class Diagram(NodeGroup):
     def set_default_label_orientation(self, value):
         value = value.lower()
         if value in ('horizontal', 'vertical'):
-            DiagramNode.label_orientation = value
+            self._DiagramNode.label_orientation = value
         else:
             msg = "unknown label orientation: %s" % value
             raise AttributeError(msg)
@@ -627,7 +629,7 @@ class Diagram(NodeGroup):
         self._NodeGroup.set_default_color(color)
 
     def set_shape_namespace(self, value):
-        noderenderer.set_default_namespace(value)
+        noderenderer.set_default_namespace(value, self.context.shape_namespace)
 
     def set_default_fontfamily(self, fontfamily):
         self._DiagramNode.set_default_fontfamily(fontfamily)
@@ -660,3 +662,51 @@ class Diagram(NodeGroup):
     def set_fontsize(self, value):
         warning("fontsize is obsoleted; use default_fontsize")
         self.set_default_fontsize(int(value))
+
+
+class Context(object):
+    """Registries of diagram elements for each build.
+
+    Element classes keep their namespaces and default attributes as class
+    attributes.  Context derives private subclasses of them, so diagrams
+    built with separate contexts do not share any state (even in threads).
+
+        context = Context()
+        diagram = ScreenNodeBuilder.build(tree, context=context)
+    """
+    def __init__(self):
+        self.plugins = plugins.Registry()
+        self.shape_namespace = []
+
+        self.DiagramNode = self.scope(DiagramNode)
+        self.DiagramEdge = self.scope(DiagramEdge)
+        self.NodeGroup = self.scope(NodeGroup)
+        self.Diagram = self.scope(Diagram,
+                                  _DiagramNode=self.DiagramNode,
+                                  _DiagramEdge=self.DiagramEdge,
+                                  _NodeGroup=self.NodeGroup)
+
+    def scope(self, klass, **attrs):
+        attrs.update(context=self, __module__=klass.__module__)
+        scoped = type(klass.__name__, (klass,), attrs)
+        scoped.clear()
+
+        return scoped
+
+    def cleanup(self):
+        plugins.cleanup(self.plugins)
+
+
+class DefaultContext(Context):
+    """Context using global element classes (compatible behavior)"""
+    def __init__(self):
+        self.plugins = plugins.registry
+        self.shape_namespace = noderenderer.searchpath
+
+        self.DiagramNode = DiagramNode
+        self.DiagramEdge = DiagramEdge
+        self.NodeGroup = NodeGroup
+        self.Diagram = Diagram
+
+
+Base.context = DefaultContext()
@@ -70,5 +70,9 @@ class ImageDraw(object):
     def image(self, box, url):
         pass
 
+    def begin(self, filename, size, _format):
+        # called before drawing operations are replayed by filters
+        pass
+
     def save(self, filename, size, _format):
         pass
@@ -178,5 +178,7 @@ class LineJumpDrawFilter(LazyReceiver):
                     self.x_cross.setdefault(y, set()).add(x)
                     self.y_cross.setdefault(x, set()).add(y)
 
+        if hasattr(self.target, 'begin'):  # drawers of older interface
+            self.target.begin(*args, **kwargs)
         self._run()
         return self.target.save(*args, **kwargs)
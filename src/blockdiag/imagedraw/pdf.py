@@ -20,7 +20,7 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.utils import ImageReader
 from blockdiag.imagedraw import base
-from blockdiag.imagedraw.utils import memoize
+from blockdiag.imagedraw.utils import memoize, textsize_key
 from blockdiag.utils import images, Box, Size
 from blockdiag.utils.fontmap import parse_fontpath
 from blockdiag.utils.compat import string_types
@@ -128,7 +128,7 @@ class PDFImageDraw(base.ImageDraw):
         if 'thick' in kwargs:
             self.canvas.setLineWidth(1)
 
-    @memoize
+    @memoize(key=textsize_key)
     def textlinesize(self, string, font):
         self.set_font(font)
         width = self.canvas.stringWidth(string, font.path, font.size)
@@ -170,8 +170,9 @@ class PDFImageDraw(base.ImageDraw):
         self.canvas.restoreState()
 
         if not rendered and font.size > 0:
-            font.size = int(font.size * 0.8)
-            self.textarea(box, string, font, **kwargs)
+            _font = font.duplicate()
+            _font.size = int(font.size * 0.8)
+            self.textarea(box, string, _font, **kwargs)
 
     def line(self, xy, **kwargs):
         self.set_stroke_color(kwargs.get('fill', 'none'))
@@ -214,7 +215,7 @@ class PDFImageDraw(base.ImageDraw):
 
     def image(self, box, url):
         try:
-            image = images.open(url, mode='pillow')
+            image = images.load(url).image
             if image.mode not in ('RGBA', 'L', 'RGB', 'CYMYK'):
                 # convert to format that reportlab can recognize
                 image = image.convert('RGBA')
@@ -24,8 +24,9 @@ except ImportError:
 from functools import partial, wraps
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 from blockdiag.imagedraw import base
-from blockdiag.imagedraw.utils import memoize
+from blockdiag.imagedraw.utils import memoize, textsize_key
 from blockdiag.imagedraw.utils.ellipse import dots as ellipse_dots
+from blockdiag.imagedraw.utils.pngwriter import PNGWriter
 from blockdiag.utils import images, Box, Size, XY
 from blockdiag.utils.fontmap import parse_fontpath, FontMap
 from blockdiag.utils.myitertools import istep, stepslice
@@ -105,19 +106,33 @@ def style2cycle(style, thick):
     return length
 
 
+@memoize(key=lambda path, index, size: (path, index, size), maxsize=64)
+def truetype(path, index, size):
+    """Load TrueType font; loaded fonts are shared in the process.
+
+    The number of loaded fonts is counted at ``truetype.cache.misses``.
+    """
+    if index:
+        return ImageFont.truetype(path, size, index=index)
+    else:
+        return ImageFont.truetype(path, size)
+
+
 def ttfont_for(font):
     if font.path:
         path, index = parse_fontpath(font.path)
-        if index:
-            ttfont = ImageFont.truetype(path, font.size, index=index)
-        else:
-            ttfont = ImageFont.truetype(path, font.size)
+        ttfont = truetype(path, index, font.size)
     else:
         ttfont = None
 
     return ttfont
 
 
+def is_bitmap_font(font):
+    path, _ = parse_fontpath(font.path)
+    return re.search(r'\.(bdf|pcf)(\.gz)?$', path.lower()) is not None
+
+
 class ImageDrawExBase(base.ImageDraw):
     def __init__(self, filename, **kwargs):
         self.filename = filename
@@ -134,8 +149,12 @@ class ImageDrawExBase(base.ImageDraw):
         self.set_canvas_size(Size(1, 1))  # This line make textsize() workable
 
     def paste(self, image, pt, mask=None):
+        # pasted in place; self.draw is still valid for the canvas
         self._image.paste(image, pt, mask)
+
+    def create_draw(self):
         self.draw = ImageDraw.Draw(self._image)
+        self.draw.fontmode = '1'  # draw text without anti-aliasing
 
     def set_canvas_size(self, size):
         if self.transparency:
@@ -150,11 +169,11 @@ class ImageDrawExBase(base.ImageDraw):
             alpha = Image.new('L', size, 1)
             self._image.putalpha(alpha)
 
-        self.draw = ImageDraw.Draw(self._image)
+        self.create_draw()
 
     def resizeCanvas(self, size):
         self._image = self._image.resize(size, Image.ANTIALIAS)
-        self.draw = ImageDraw.Draw(self._image)
+        self.create_draw()
 
     def arc(self, box, start, end, **kwargs):
         style = kwargs.get('style')
@@ -275,7 +294,7 @@ class ImageDrawExBase(base.ImageDraw):
         textfolder = super(ImageDrawExBase, self).textfolder
         return partial(textfolder, scale=self.scale_ratio)
 
-    @memoize
+    @memoize(key=textsize_key)
     def textlinesize(self, string, font):
         ttfont = ttfont_for(font)
         if ttfont is None:
@@ -307,7 +326,7 @@ class ImageDrawExBase(base.ImageDraw):
                             size[1] * self.scale_ratio)
                 text_image = image.resize(basesize, Image.ANTIALIAS)
                 self.paste(text_image, xy, text_image)
-        else:
+        elif is_bitmap_font(font):
             size = ttfont.getsize(string)
 
             # Generate mask to support BDF(bitmap font)
@@ -318,6 +337,8 @@ class ImageDrawExBase(base.ImageDraw):
             # Rendering text
             filler = Image.new('RGB', size, fill)
             self.paste(filler, xy, mask)
+        else:
+            self.draw.text(xy, string, fill=fill, font=ttfont)
 
     def textarea(self, box, string, font, **kwargs):
         if 'rotate' in kwargs and kwargs['rotate'] != 0:
@@ -356,12 +377,12 @@ class ImageDrawExBase(base.ImageDraw):
 
     def image(self, box, url):
         try:
-            image = images.open(url, mode='pillow')
+            image = images.load(url)
 
-            # resize image.
+            # resize image (shared between nodes; do not modify it)
             w = min([box.width, image.size[0] * self.scale_ratio])
             h = min([box.height, image.size[1] * self.scale_ratio])
-            image.thumbnail((w, h), Image.ANTIALIAS)
+            image = image.resize((w, h))
 
             # centering image.
             w, h = image.size
@@ -409,6 +430,36 @@ class ImageDrawExBase(base.ImageDraw):
         return image
 
 
+# shadows smaller than this area (in pixels) are cached
+SHADOW_CACHE_AREA = 256 * 256
+
+
+def create_shadow(shape, size, *args, **kwargs):
+    """Returns blurred image of the shape drawn on the transparent canvas"""
+    drawer = ImageDrawExBase(None, transparency=True)
+    drawer.set_canvas_size(size)
+    getattr(drawer, shape)(*args, **kwargs)
+
+    for _ in range(15):
+        drawer._image = drawer._image.filter(ImageFilter.SMOOTH_MORE)
+
+    return drawer._image
+
+
+def shadow_key(shape, size, xy, **kwargs):
+    if shape == 'polygon':
+        xy = tuple(tuple(pt) for pt in xy)
+    else:
+        xy = tuple(xy)
+
+    return (shape, tuple(size), xy, tuple(sorted(kwargs.items())))
+
+
+# shadows of nodes are alike (same shape, size and color); blurred images
+# are shared between them (and between diagrams)
+cached_shadow = memoize(create_shadow, key=shadow_key, maxsize=64)
+
+
 def blurred(fn):
     PADDING = 16
 
@@ -428,16 +479,6 @@ def blurred(fn):
         else:
             return box.shift(-dx, -dy)
 
-    def create_shadow(self, size, *args, **kwargs):
-        drawer = ImageDrawExBase(self.filename, transparency=True)
-        drawer.set_canvas_size(size)
-        getattr(drawer, fn.__name__)(*args, **kwargs)
-
-        for _ in range(15):
-            drawer._image = drawer._image.filter(ImageFilter.SMOOTH_MORE)
-
-        return drawer._image
-
     @wraps(fn)
     def func(self, *args, **kwargs):
         args = list(args)
@@ -449,7 +490,10 @@ def blurred(fn):
             args[0] = get_abs_coordinate(box, *args)
 
             size = Size(box.width + PADDING * 2, box.height + PADDING * 2)
-            shadow = create_shadow(self, size, *args, **kwargs)
+            if size.width * size.height <= SHADOW_CACHE_AREA:
+                shadow = cached_shadow(fn.__name__, size, *args, **kwargs)
+            else:
+                shadow = create_shadow(fn.__name__, size, *args, **kwargs)
             xy = XY(box.x1 - PADDING, box.y1 - PADDING)
             self.paste(shadow, xy, shadow)
 
@@ -470,6 +514,192 @@ class ImageDrawEx(ImageDrawExBase):
         super(ImageDrawEx, self).polygon(xy, **kwargs)
 
 
+# margins of tiles (in pixels of the output image)
+TILE_MARGIN = 8  # covers the resampling filters of antialias mode
+CULLING_MARGIN = 32  # covers shadows, thick lines and text around shapes
+
+
+def recorded(name):
+    def method(self, *args, **kwargs):
+        if self.operations is None:  # replaying; draw onto the tile
+            method = getattr(super(TiledImageDrawEx, self), name)
+            return method(*args, **kwargs)
+        else:
+            self.record(name, args, kwargs)
+
+    method.__name__ = name
+    return method
+
+
+class TiledImageDrawEx(ImageDrawEx):
+    """PNG drawer which renders the image tile by tile
+
+    Drawing operations are recorded, and replayed on save() for each tile
+    of ``tile_size`` pixels (operations out of the tile are skipped).  The
+    tiles are written to the PNG stream row by row; the full canvas is
+    never allocated.  The output is pixel-identical to ImageDrawEx.
+    """
+    def __init__(self, filename, **kwargs):
+        self.tile_size = kwargs.get('tile_size')
+        self.operations = []
+        self.pagesize = Size(1, 1)
+        self.stage_scale = 1
+        super(TiledImageDrawEx, self).__init__(filename, **kwargs)
+
+    def set_canvas_size(self, size):
+        if self._image is None:  # canvas for measuring text
+            super(TiledImageDrawEx, self).set_canvas_size(Size(1, 1))
+
+        self.pagesize = Size(*size)
+
+    def record(self, name, args, kwargs):
+        bounds = self.bounds(name, *args, **kwargs)
+        if bounds is not None:
+            # convert to the coordinates of output image
+            scale = self.stage_scale
+            bounds = Box(bounds.x1 // scale - CULLING_MARGIN,
+                         bounds.y1 // scale - CULLING_MARGIN,
+                         bounds.x2 // scale + CULLING_MARGIN + 1,
+                         bounds.y2 // scale + CULLING_MARGIN + 1)
+
+        self.operations.append((name, args, kwargs, bounds))
+
+    def bounds(self, name, xy, *args, **kwargs):
+        if name in ('line', 'polygon'):
+            points = list(point_pairs(xy))
+            xlist = [pt[0] for pt in points]
+            ylist = [pt[1] for pt in points]
+            return Box(min(xlist), min(ylist), max(xlist), max(ylist))
+        elif name == 'text':
+            width, height = self.textlinesize(args[0], args[1])
+            return Box(xy[0], xy[1], xy[0] + width, xy[1] + height)
+        elif name in ('arc', 'ellipse', 'rectangle', 'textarea', 'image'):
+            return Box(*xy)
+        else:
+            return None
+
+    line = recorded('line')
+    rectangle = recorded('rectangle')
+    polygon = recorded('polygon')
+    arc = recorded('arc')
+    ellipse = recorded('ellipse')
+    text = recorded('text')
+    textarea = recorded('textarea')
+    image = recorded('image')
+
+    def resizeCanvas(self, size):
+        if self.operations is None:
+            super(TiledImageDrawEx, self).resizeCanvas(size)
+        else:
+            self.operations.append(('resizeCanvas', (size,), {}, None))
+            self.stage_scale = size[0] // self.pagesize[0]
+
+    def render_tile(self, region, operations):
+        """Render the region (Box in output image) to the image"""
+        dx, dy = region.x1, region.y1
+        scale = 1
+        super(TiledImageDrawEx, self).set_canvas_size(region.size)
+        for name, args, kwargs, _ in operations:
+            if name == 'resizeCanvas':
+                scale = args[0][0] // self.pagesize[0]
+                size = Size(region.width * scale, region.height * scale)
+                self.resizeCanvas(size)
+                continue
+
+            xy = args[0]
+            if name in ('line', 'polygon'):
+                xy = [XY(pt[0] - dx * scale, pt[1] - dy * scale)
+                      for pt in point_pairs(xy)]
+            elif name == 'text':
+                xy = XY(xy[0] - dx * scale, xy[1] - dy * scale)
+            else:
+                xy = Box(*xy).shift(-dx * scale, -dy * scale)
+
+            getattr(self, name)(xy, *args[1:], **kwargs)
+
+        image = self._image
+        if scale != 1:
+            image = image.resize(region.size, Image.ANTIALIAS)
+
+        return image
+
+    def tiles(self):
+        """Render tiles and yield the bands of the image"""
+        width, height = self.pagesize
+        tile_size = self.tile_size
+        self.operations, operations = None, self.operations
+        try:
+            for y in range(0, height, tile_size):
+                rows = min(tile_size, height - y)
+                top = max(0, y - TILE_MARGIN)
+                bottom = min(height, y + rows + TILE_MARGIN)
+                in_band = [op for op in operations
+                           if op[3] is None or
+                           (op[3].y1 < bottom and top < op[3].y2)]
+
+                band = None
+                for x in range(0, width, tile_size):
+                    columns = min(tile_size, width - x)
+                    region = Box(max(0, x - TILE_MARGIN), top,
+                                 min(width, x + columns + TILE_MARGIN), bottom)
+                    in_tile = [op for op in in_band
+                               if op[3] is None or
+                               (op[3].x1 < region.x2 and region.x1 < op[3].x2)]
+
+                    tile = self.render_tile(region, in_tile)
+                    if band is None:
+                        band = Image.new(tile.mode, (width, rows))
+                    tile = tile.crop((x - region.x1, y - top,
+                                      x - region.x1 + columns,
+                                      y - top + rows))
+                    band.paste(tile, (x, 0))
+
+                yield band
+        finally:
+            self.operations = operations
+            super(TiledImageDrawEx, self).set_canvas_size(Size(1, 1))
+
+    def save(self, filename, size, _format):
+        if filename:
+            self.filename = filename
+
+        if size is not None and tuple(size) != tuple(self.pagesize):
+            raise ValueError('tiled PNG drawer does not resize images')
+
+        if self.transparency:
+            mode = 'RGBA'
+        else:
+            mode = 'RGB'
+
+        if self.filename:
+            stream = open(self.filename, 'wb')
+        else:
+            from io import BytesIO
+            stream = BytesIO()
+
+        try:
+            writer = PNGWriter(stream, self.pagesize, mode)
+            for band in self.tiles():
+                writer.write(band)
+            writer.close()
+
+            if self.filename:
+                image = None
+            else:
+                image = stream.getvalue()
+        finally:
+            stream.close()
+
+        return image
+
+
+def create(filename, **kwargs):
+    if kwargs.get('tile_size'):
+        return TiledImageDrawEx(filename, **kwargs)
+    else:
+        return ImageDrawEx(filename, **kwargs)
+
+
 def setup(self):
     from blockdiag.imagedraw import install_imagedrawer
-    install_imagedrawer('png', ImageDrawEx)
+    install_imagedrawer('png', create)
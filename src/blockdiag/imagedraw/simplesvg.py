@@ -14,6 +14,7 @@
 #  limitations under the License.
 
 import re
+from copy import copy
 from blockdiag.utils.compat import u, string_types
 from io import StringIO
 
@@ -29,6 +30,8 @@ def _quote(s):
 
 
 class base(object):
+    indent = '  '
+
     def __init__(self, *args, **kwargs):
         self.text = None
         self.elements = []
@@ -46,13 +49,23 @@ class base(object):
 
     def addElement(self, element):
         self.elements.append(element)
+        return element
 
     def set_text(self, text):
         self.text = text
 
     def to_xml(self, io, level=0):
+        if self.elements == []:
+            self.write_tag(io, level, empty=True)
+        else:
+            self.write_tag(io, level)
+            for e in self.elements:
+                e.to_xml(io, level + 1)
+            self.write_endtag(io, level)
+
+    def write_tag(self, io, level, empty=False):
         clsname = self.__class__.__name__
-        indent = '  ' * level
+        indent = self.indent * level
 
         io.write(u('%s<%s') % (indent, clsname))
         for key in sorted(self.attributes):
@@ -60,20 +73,19 @@ class base(object):
             if value is not None:
                 io.write(u(' %s=%s') % (_escape(key), _quote(value)))
 
-        if self.elements == []:
-            if self.text is not None:
-                io.write(u(">%s</%s>\n") % (_escape(self.text), clsname))
-            else:
-                io.write(u(" />\n"))
-        elif self.elements:
+        if empty is False:
             if self.text is not None:
                 io.write(u(">%s\n") % (_escape(self.text),))
             else:
                 io.write(u(">\n"))
+        elif self.text is not None:
+            io.write(u(">%s</%s>\n") % (_escape(self.text), clsname))
+        else:
+            io.write(u(" />\n"))
 
-            for e in self.elements:
-                e.to_xml(io, level + 1)
-            io.write(u('%s</%s>\n') % (indent, clsname))
+    def write_endtag(self, io, level):
+        indent = self.indent * level
+        io.write(u('%s</%s>\n') % (indent, self.__class__.__name__))
 
 
 class element(base):
@@ -100,16 +112,94 @@ class svg(base):
 
     def to_xml(self):
         io = StringIO()
+        self.write_doctype(io)
+        super(svg, self).to_xml(io)
+
+        return io.getvalue()
 
+    def write_doctype(self, io):
         if not self.nodoctype:
             url = "http://www.w3.org/TR/2001/REC-SVG-20010904/DTD/svg10.dtd"
             io.write(u("<?xml version='1.0' encoding='UTF-8'?>\n"))
             io.write(u('<!DOCTYPE svg PUBLIC ') +
                      u('"-//W3C//DTD SVG 1.0//EN" "%s">\n') % url)
 
-        super(svg, self).to_xml(io)
 
-        return io.getvalue()
+class writer(object):
+    """Serializer of svg which writes elements to io as soon as added.
+
+    addElement() of the writer (and of the handles returned by it) writes
+    out the previous element, so only the chain of open containers (g, a)
+    is kept in memory.  The output is same as svg.to_xml().
+    """
+    def __init__(self, root, io):
+        self.io = io
+        self.stack = []  # open elements: [handle, is start tag written]
+        self.root = self.open(root, None)
+
+    def addElement(self, element):
+        return self.root.addElement(element)
+
+    def open(self, element, parent):
+        handle = writer_handle(self, element, parent)
+        self.stack.append([handle, False])
+        return handle
+
+    def add(self, parent, element):
+        self.activate(parent)
+        return self.open(element, parent)
+
+    def activate(self, handle):
+        if any(entry[0] is handle for entry in self.stack):
+            while self.stack[-1][0] is not handle:
+                self.close()
+        elif handle.parent is None:
+            raise ValueError('svg has already been written')
+        else:
+            # reopen closed container as a new sibling having same attributes
+            self.activate(handle.parent)
+            handle.element = copy(handle.element)
+            handle.element.elements = []
+            self.stack.append([handle, False])
+
+        entry = self.stack[-1]
+        if entry[1] is False:
+            if handle.parent is None:
+                handle.element.write_doctype(self.io)
+
+            handle.element.write_tag(self.io, handle.level)
+            for e in handle.element.elements:
+                e.to_xml(self.io, handle.level + 1)
+            entry[1] = True
+
+    def close(self):
+        handle, started = self.stack.pop()
+        if started:
+            handle.element.write_endtag(self.io, handle.level)
+        elif handle.parent is None:
+            handle.element.write_doctype(self.io)
+            base.to_xml(handle.element, self.io)
+        else:
+            handle.element.to_xml(self.io, handle.level)
+
+    def finish(self):
+        """Writes out all open elements (including root)"""
+        while self.stack:
+            self.close()
+
+
+class writer_handle(object):
+    def __init__(self, writer, element, parent):
+        self.writer = writer
+        self.element = element
+        self.parent = parent
+        if parent is None:
+            self.level = 0
+        else:
+            self.level = parent.level + 1
+
+    def addElement(self, element):
+        return self.writer.add(self, element)
 
 
 class title(base):
@@ -122,6 +212,11 @@ class desc(base):
         super(desc, self).__init__(text=_title)
 
 
+class style(base):
+    def __init__(self, _text, **kwargs):
+        super(style, self).__init__(text=_text, **kwargs)
+
+
 class text(element):
     def __init__(self, x, y, _text, **kwargs):
         super(text, self).__init__(x, y, text=_text, **kwargs)
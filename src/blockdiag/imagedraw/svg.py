@@ -15,16 +15,21 @@
 
 import os
 import re
+import gzip
+import codecs
+from io import StringIO
+from hashlib import sha1
 from PIL.Image import Image
 from base64 import b64encode
-from blockdiag.imagedraw import base as _base
+from blockdiag.imagedraw import base as _base, simplesvg
 from blockdiag.imagedraw.simplesvg import (
     svg, svgclass, filter, title, desc, defs, g, a, text,
-    rect, polygon, ellipse, path, pathdata, image
+    rect, polygon, ellipse, path, pathdata, image, writer
 )
-from blockdiag.imagedraw.utils import memoize
+from blockdiag.imagedraw.utils import memoize, textsize_key
 from blockdiag.imagedraw.utils.ellipse import endpoints as ellipse_endpoints
 from blockdiag.utils import images, Box, XY, is_Pillow_available
+from blockdiag.utils.uuid import generate as uuid
 
 feGaussianBlur = svgclass('feGaussianBlur')
 
@@ -36,6 +41,13 @@ def rgb(color):
     return color
 
 
+RGB_COLOR = re.compile(r'rgb\((\d+),(\d+),(\d+)\)')
+
+
+def hexcolor(match):
+    return '#%02x%02x%02x' % tuple(int(n) for n in match.groups())
+
+
 def style(name):
     if name == 'blur':
         value = "filter:url(#filter_blur)"
@@ -79,6 +91,98 @@ def drawing_params(kwargs):
     return params
 
 
+class Compactor(object):
+    """Optimizer of SVG images (``compact=True`` option of SVGImageDraw).
+
+    Presentation attributes of elements are replaced by CSS classes
+    (shared between elements having same attributes), coordinates are
+    rounded, consecutive strokes of same style are merged into one path
+    element, and elements are not indented.
+
+    Stylesheets are global to HTML documents; class names start with
+    prefix to avoid conflicts between images inlined into same page.
+    """
+    PRESENTATION_ATTRIBUTES = ('fill', 'stroke', 'stroke-width',
+                               'stroke-dasharray', 'font-family', 'font-size',
+                               'font-weight', 'font-style', 'text-anchor')
+    LENGTH_ATTRIBUTES = ('stroke-width', 'font-size')  # need units in CSS
+    PRECISION = 2
+
+    def __init__(self, prefix='s'):
+        self.prefix = prefix
+        self.classes = {}
+        self.rules = []
+        self.last_path = None  # (parent, path, endpoint) lastly added
+
+    def round(self, value):
+        if isinstance(value, float):
+            value = ('%.*f' % (self.PRECISION, value)).rstrip('0')
+            return value.rstrip('.')
+        else:
+            return value
+
+    def round_numbers(self, string):
+        return re.sub(r'\d+\.\d+', lambda m: self.round(float(m.group(0))),
+                      string)
+
+    def apply(self, element):
+        element.indent = ''
+        attrs = element.attributes
+        declarations = []
+        for name in self.PRESENTATION_ATTRIBUTES:
+            value = attrs.pop(name, None)
+            if value is None:
+                continue
+            elif name in self.LENGTH_ATTRIBUTES:
+                declarations.append('%s:%spx' % (name, self.round(value)))
+            else:
+                value = RGB_COLOR.sub(hexcolor, '%s' % value)
+                declarations.append('%s:%s' % (name, value))
+
+        if attrs.get('style'):
+            declarations.append(attrs.pop('style'))
+
+        if declarations:
+            attrs['class'] = self.classname(';'.join(declarations))
+
+        for name in attrs:
+            attrs[name] = self.round(attrs[name])
+
+        if isinstance(attrs.get('d'), pathdata):
+            pd = attrs['d']
+            pd.path = [self.round_numbers(command) for command in pd.path]
+
+    def classname(self, declarations):
+        if declarations not in self.classes:
+            name = '%s%d' % (self.prefix, len(self.rules))
+            self.classes[declarations] = name
+            self.rules.append('.%s{%s}' % (name, declarations))
+
+        return self.classes[declarations]
+
+    def merge(self, parent, element, start, end):
+        """Merges path into the path lastly added to parent if possible"""
+        if self.last_path is None:
+            return False
+
+        last_parent, last, last_end = self.last_path
+        if last_parent is not parent or \
+           last.attributes.get('class') != element.attributes.get('class'):
+            return False
+
+        commands = element.attributes['d'].path
+        if last_end == start:
+            commands = commands[1:]  # omit moveto; continues from last one
+        last.attributes['d'].path.extend(commands)
+        self.last_path = (parent, last, end)
+        return True
+
+    def stylesheet(self):
+        element = simplesvg.style("\n".join(self.rules), type='text/css')
+        element.indent = ''
+        return element
+
+
 class SVGImageDrawElement(_base.ImageDraw):
     self_generative_methods = ['group', 'anchor']
     supported_path = True
@@ -86,6 +190,28 @@ class SVGImageDrawElement(_base.ImageDraw):
 
     def __init__(self, svg, parent=None):
         self.svg = svg
+        if parent:
+            self.compactor = parent.compactor
+        else:
+            self.compactor = None
+
+    def add_element(self, element):
+        if self.compactor:
+            self.compactor.apply(element)
+            self.compactor.last_path = None
+
+        return self.svg.addElement(element)
+
+    def add_path(self, element, start, end):
+        """Adds a stroke; merged into the previous one in compact mode"""
+        if self.compactor:
+            self.compactor.apply(element)
+            if self.compactor.merge(self.svg, element, start, end):
+                return
+
+        self.svg.addElement(element)
+        if self.compactor:
+            self.compactor.last_path = (self.svg, element, end)
 
     def path(self, pd, **kwargs):
         fill = kwargs.get('fill')
@@ -93,7 +219,7 @@ class SVGImageDrawElement(_base.ImageDraw):
 
         p = path(pd, fill=rgb(fill), stroke=rgb(outline),
                  **drawing_params(kwargs))
-        self.svg.addElement(p)
+        self.add_element(p)
 
     def rectangle(self, box, **kwargs):
         thick = kwargs.get('thick')
@@ -103,9 +229,9 @@ class SVGImageDrawElement(_base.ImageDraw):
         r = rect(box.x, box.y, box.width, box.height,
                  fill=rgb(fill), stroke=rgb(outline),
                  stroke_width=thick, **drawing_params(kwargs))
-        self.svg.addElement(r)
+        self.add_element(r)
 
-    @memoize
+    @memoize(key=textsize_key)
     def textlinesize(self, string, font, **kwargs):
         if is_Pillow_available():
             if not hasattr(self, '_pil_drawer'):
@@ -126,7 +252,7 @@ class SVGImageDrawElement(_base.ImageDraw):
                  font_family=font.generic_family, font_size=font.size,
                  font_weight=font.weight, font_style=font.style,
                  text_anchor='middle', textLength=size.width)
-        self.svg.addElement(t)
+        self.add_element(t)
 
     def textarea(self, box, string, font, **kwargs):
         if 'rotate' in kwargs and kwargs['rotate'] != 0:
@@ -167,8 +293,7 @@ class SVGImageDrawElement(_base.ImageDraw):
                        box[0] + box.width, box[1] + box.height)
 
         rotate = "rotate(%d,%d,%d)" % (angle, _box[0], _box[1])
-        group = g(transform="%s" % rotate)
-        self.svg.addElement(group)
+        group = self.add_element(g(transform="%s" % rotate))
 
         elem = SVGImageDrawElement(group, self)
         elem.textarea(_box, string, font, **kwargs)
@@ -183,7 +308,7 @@ class SVGImageDrawElement(_base.ImageDraw):
 
         p = path(pd, fill="none", stroke=rgb(fill),
                  stroke_width=thick, **drawing_params(kwargs))
-        self.svg.addElement(p)
+        self.add_path(p, points[0], points[-1])
 
     def arc(self, box, start, end, **kwargs):
         fill = kwargs.get('fill')
@@ -209,7 +334,7 @@ class SVGImageDrawElement(_base.ImageDraw):
         pd.ellarc(w, h, 0, largearc, 1, pt2[0], pt2[1])
         p = path(pd, fill="none", stroke=rgb(fill),
                  **drawing_params(kwargs))
-        self.svg.addElement(p)
+        self.add_path(p, pt1, pt2)
 
     def ellipse(self, box, **kwargs):
         fill = kwargs.get('fill')
@@ -221,7 +346,7 @@ class SVGImageDrawElement(_base.ImageDraw):
 
         e = ellipse(pt.x, pt.y, w, h, fill=rgb(fill),
                     stroke=rgb(outline), **drawing_params(kwargs))
-        self.svg.addElement(e)
+        self.add_element(e)
 
     def polygon(self, points, **kwargs):
         fill = kwargs.get('fill')
@@ -229,7 +354,7 @@ class SVGImageDrawElement(_base.ImageDraw):
 
         pg = polygon(points, fill=rgb(fill), stroke=rgb(outline),
                      **drawing_params(kwargs))
-        self.svg.addElement(pg)
+        self.add_element(pg)
 
     def image(self, box, url):
         if hasattr(url, 'read'):
@@ -241,43 +366,50 @@ class SVGImageDrawElement(_base.ImageDraw):
                 ext = os.path.splitext(url)[1].lower()
 
             if ext not in ('.jpg', '.png', '.gif'):
-                stream = None
                 try:
-                    stream = images.open(url, mode='png')
-                    url = "data:;base64," + str(b64encode(stream.read()))
+                    url = images.load(url).data_uri()
                 except IOError:
                     pass
-                finally:
-                    if stream:
-                        stream.close()
 
         im = image(url, box.x1, box.y1, box.width, box.height)
-        self.svg.addElement(im)
+        self.add_element(im)
 
     def anchor(self, url):
         a_node = a(url)
         a_node.add_attribute('xlink:href', url)
-        self.svg.addElement(a_node)
+        a_node = self.add_element(a_node)
 
         return SVGImageDrawElement(a_node, self)
 
     def group(self):
-        group = g()
-        self.svg.addElement(group)
+        group = self.add_element(g())
 
         return SVGImageDrawElement(group, self)
 
 
 class SVGImageDraw(SVGImageDrawElement):
+    """SVG drawer; builds a tree of elements and serializes it in save().
+
+    With ``stream=True`` option, elements are written to the output as soon
+    as drawn instead (from begin(), called before the drawing operations
+    are replayed by filters).  Filenames ending with ``.svgz`` are gzipped.
+    ``compact=True`` option makes smaller images (see Compactor); prefix
+    of class names is given by ``classprefix`` option (default: derived
+    from ``code`` option, or unique to the drawer if not given).
+    """
     def __init__(self, filename, **kwargs):
         super(SVGImageDraw, self).__init__(None)
 
         self.filename = filename
         self.options = kwargs
+        self.writer = None
+        self.output = None
+        if kwargs.get('compact'):
+            self.compactor = Compactor(classprefix(**kwargs))
         self.set_canvas_size((0, 0))
 
     def set_canvas_size(self, size):
-        self.svg = svg(0, 0, size[0], size[1], **self.options)
+        self.svg = self.root = svg(0, 0, size[0], size[1], **self.options)
         uri = 'http://www.inkscape.org/namespaces/inkscape'
         self.svg.add_attribute('xmlns:inkspace', uri)
         uri = 'http://www.w3.org/1999/xlink'
@@ -297,23 +429,79 @@ class SVGImageDraw(SVGImageDrawElement):
         self.svg.addElement(title('blockdiag'))
         self.svg.addElement(desc(self.options.get('code')))
 
+    def begin(self, filename, size, _format):
+        if self.options.get('stream') and self.writer is None:
+            if filename:
+                self.filename = filename
+
+            self.set_image_size(size)
+            if self.filename:
+                self.output = open_output(self.filename)
+            else:
+                self.output = StringIO()
+
+            self.svg = self.writer = writer(self.root, self.output)
+
+    def set_image_size(self, size):
+        if size:
+            self.root.attributes['width'] = size[0]
+            self.root.attributes['height'] = size[1]
+
     def save(self, filename, size, _format):
         # Ignore format parameter; compatibility for ImageDrawEx.
 
+        if self.options.get('stream'):
+            return self.save_stream(filename, size, _format)
+
         if filename:
             self.filename = filename
 
-        if size:
-            self.svg.attributes['width'] = size[0]
-            self.svg.attributes['height'] = size[1]
+        self.set_image_size(size)
+        if self.compactor and self.compactor.rules:
+            # at the end of image as well as streaming mode (see save_stream)
+            self.svg.addElement(self.compactor.stylesheet())
 
         image = self.svg.to_xml()
 
         if self.filename:
-            open(self.filename, 'wb').write(image.encode('utf-8'))
+            with open_output(self.filename) as fd:
+                fd.write(image)
 
         return image
 
+    def save_stream(self, filename, size, _format):
+        # returns image only if no filename given (written to StringIO)
+        self.begin(filename, size, _format)
+        if self.compactor and self.compactor.rules:
+            # styles are not known until all elements are written
+            self.writer.addElement(self.compactor.stylesheet())
+        self.writer.finish()
+
+        if self.filename:
+            self.output.close()
+            return None
+        else:
+            return self.output.getvalue()
+
+
+def classprefix(**options):
+    """Returns a prefix of class names for compact SVG images"""
+    if options.get('classprefix'):
+        return options['classprefix']
+
+    seed = options.get('code') or uuid()
+    return 'b%s_' % sha1(seed.encode('utf-8')).hexdigest()[:8]
+
+
+def open_output(filename):
+    """Opens filename to write SVG as text (gzipped if .svgz)"""
+    if filename.lower().endswith('.svgz'):
+        fd = gzip.GzipFile(filename, 'wb')
+    else:
+        fd = open(filename, 'wb')
+
+    return codecs.getwriter('utf-8')(fd)
+
 
 def setup(self):
     from blockdiag.imagedraw import install_imagedrawer
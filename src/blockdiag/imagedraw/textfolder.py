@@ -32,29 +32,50 @@ def splitlabel(string):
         yield re.sub('\x00', '\\\\', line).strip()
 
 
+def fitting_length(metrics, text, bound, measure='width', suffix=''):
+    """Returns length of the longest head of text which fits to bound.
+       The head is measured with suffix (e.g. ' ...').
+       Returns 0 if no head fits.
+    """
+    textsize = metrics.textsize(text + suffix)
+    if getattr(textsize, measure) <= bound:
+        return len(text)
+
+    # binary search: text[0:lower] fits, text[0:upper + 1] does not fit
+    lower = 0
+    upper = len(text) - 1
+    while lower < upper:
+        i = (lower + upper + 1) // 2
+        textsize = metrics.textsize(text[0:i] + suffix)
+
+        if getattr(textsize, measure) <= bound:
+            lower = i
+        else:
+            upper = i - 1
+
+    return lower
+
+
 def splittext(metrics, text, bound, measure='width'):
     folded = []
     if text == '':
         folded.append(u(' '))
 
-    for i in range(len(text), 0, -1):
-        textsize = metrics.textsize(text[0:i])
-
-        if getattr(textsize, measure) <= bound:
-            folded.append(text[0:i])
-            if text[i:]:
-                folded += splittext(metrics, text[i:], bound, measure)
+    while text:
+        i = fitting_length(metrics, text, bound, measure)
+        if i == 0:
             break
 
+        folded.append(text[0:i])
+        text = text[i:]
+
     return folded
 
 
 def truncate_text(metrics, text, bound, measure='width'):
-    for i in range(len(text), 0, -1):
-        textsize = metrics.textsize(text[0:i] + ' ...')
-
-        if getattr(textsize, measure) <= bound:
-            return text[0:i] + ' ...'
+    i = fitting_length(metrics, text, bound, measure, suffix=' ...')
+    if i > 0:
+        return text[0:i] + ' ...'
 
     return text
 
@@ -16,9 +16,12 @@
 import math
 import unicodedata
 from functools import wraps
-from blockdiag.utils import Size
+from blockdiag.utils import LRUCache, Size
 from blockdiag.utils.compat import u
 
+# caches created by memoize()
+caches = []
+
 
 def is_zenkaku(char):
     """Detect given character is Japanese ZENKAKU character"""
@@ -55,15 +58,47 @@ def textsize(string, font):
     return Size(int(math.ceil(width)), font.size)
 
 
-def memoize(fn):
-    fn.cache = {}
+def textsize_key(drawer, string, font, **kwargs):
+    """Cache key of text measurements; it does not depend on drawer instance"""
+    if font is None:
+        return (None, None, string)
+    else:
+        return (font.path, font.size, string)
+
+
+def memoize(fn=None, key=None, maxsize=4096):
+    """Cache results of function to bounded LRU cache (``func.cache``)
+
+    ``key`` is a function which takes the same arguments as ``fn`` and
+    returns hashable key for the call.  The default key is made from
+    the representation of the arguments.
+    """
+    if fn is None:
+        return lambda f: memoize(f, key=key, maxsize=maxsize)
+
+    cache = LRUCache(maxsize)
+    caches.append(cache)
+    missing = object()
 
     @wraps(fn)
     def func(*args, **kwargs):
-        key = str(args) + str(kwargs)
-        if key not in fn.cache:
-            fn.cache[key] = fn(*args, **kwargs)
+        if key is None:
+            _key = str(args) + str(kwargs)
+        else:
+            _key = key(*args, **kwargs)
+
+        value = cache.get(_key, missing)
+        if value is missing:
+            value = fn(*args, **kwargs)
+            cache.set(_key, value)
 
-        return fn.cache[key]
+        return value
 
+    func.cache = cache
     return func
+
+
+def clear_caches():
+    """Clear all caches created by memoize()"""
+    for cache in caches:
+        cache.clear()
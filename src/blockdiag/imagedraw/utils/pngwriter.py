@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import struct
+import zlib
+from PIL import Image, ImageChops
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+COLOR_TYPES = {'RGB': 2, 'RGBA': 6}
+FILTER_UP = b'\x02'
+
+
+class PNGWriter(object):
+    """Write PNG image to the stream row by row
+
+    The image is given as horizontal bands (PIL images of the same width)
+    from top to bottom; only one band is kept in memory at once::
+
+        writer = PNGWriter(stream, (width, height), 'RGBA')
+        for band in bands:
+            writer.write(band)
+        writer.close()
+    """
+    CHUNK_SIZE = 65536
+
+    def __init__(self, stream, size, mode):
+        if mode not in COLOR_TYPES:
+            raise ValueError('unsupported image mode: %s' % mode)
+
+        self.stream = stream
+        self.size = size
+        self.mode = mode
+        self.rows = 0
+        self.prior = Image.new(mode, (size[0], 1))  # zero; above the 1st row
+        self.compressor = zlib.compressobj(6)
+        self.buffer = []
+        self.buffered = 0
+
+        self.stream.write(PNG_SIGNATURE)
+        header = struct.pack('>IIBBBBB', size[0], size[1], 8,
+                             COLOR_TYPES[mode], 0, 0, 0)
+        self.write_chunk(b'IHDR', header)
+
+    def write_chunk(self, chunk_type, data):
+        crc = zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff
+        self.stream.write(struct.pack('>I', len(data)))
+        self.stream.write(chunk_type)
+        self.stream.write(data)
+        self.stream.write(struct.pack('>I', crc))
+
+    def write(self, band):
+        """Write rows of the band (filtered by "Up" filter of PNG)"""
+        width, height = band.size
+        if width != self.size[0] or band.mode != self.mode:
+            raise ValueError('band does not match to the image')
+        if self.rows + height > self.size[1]:
+            raise ValueError('too many rows')
+
+        # each row is stored as the difference from the row above it
+        prior = Image.new(self.mode, band.size)
+        prior.paste(self.prior, (0, 0))
+        prior.paste(band.crop((0, 0, width, height - 1)), (0, 1))
+        data = ImageChops.subtract_modulo(band, prior).tobytes()
+        self.prior = band.crop((0, height - 1, width, height))
+
+        stride = width * len(self.mode)
+        for offset in range(0, len(data), stride):
+            self.compress(FILTER_UP + data[offset:offset + stride])
+        self.rows += height
+
+    def compress(self, data):
+        compressed = self.compressor.compress(data)
+        if compressed:
+            self.buffer.append(compressed)
+            self.buffered += len(compressed)
+            if self.buffered >= self.CHUNK_SIZE:
+                self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.write_chunk(b'IDAT', b''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        if self.rows != self.size[1]:
+            raise ValueError('image has %d rows; expected %d' %
+                             (self.rows, self.size[1]))
+
+        self.buffer.append(self.compressor.flush())
+        self.flush()
+        self.write_chunk(b'IEND', b'')
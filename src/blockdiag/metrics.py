@@ -15,6 +15,7 @@
 
 from __future__ import division
 import copy
+import math
 from collections import defaultdict
 from blockdiag import noderenderer
 from blockdiag.elements import DiagramNode
@@ -56,6 +57,14 @@ class EdgeLines(object):
 
         self.polylines[-1].append(elem)
 
+    def copy(self):
+        lines = EdgeLines()
+        lines.xy = self.xy
+        lines.stroking = self.stroking
+        lines.polylines = [list(line) for line in self.polylines]
+
+        return lines
+
     def lines(self):
         lines = []
         for line in self.polylines:
@@ -68,6 +77,10 @@ class EdgeLines(object):
 
 
 class AutoScaler(object):
+    """Proxy which scales values of metrics on each access
+
+    DiagramDraw no longer uses it; DiagramMetrics takes ``scale_ratio``.
+    """
     def __init__(self, subject, scale_ratio):
         self.subject = subject
         self.scale_ratio = scale_ratio
@@ -140,8 +153,11 @@ class DiagramMetrics(object):
     span_width = cellsize * 8
     span_height = cellsize * 5
 
-    def __init__(self, diagram, drawer=None, fontmap=None):
+    def __init__(self, diagram, drawer=None, fontmap=None, scale_ratio=1,
+                 original_ratio=1):
         self.drawer = drawer
+        self.scale_ratio = scale_ratio
+        self.clear_cache()
 
         if diagram.node_width is not None:
             self.node_width = diagram.node_width
@@ -166,41 +182,100 @@ class DiagramMetrics(object):
         if diagram.edge_layout is not None:
             self.edge_layout = diagram.edge_layout
 
+        # original_metrics: metrics of the output image (before supersampling)
+        if scale_ratio == original_ratio:
+            self.original_metrics = self
+        elif original_ratio == 1:
+            self.original_metrics = self.__class__(diagram, drawer=drawer,
+                                                   fontmap=fontmap)
+        else:
+            ratio = original_ratio
+            self.original_metrics = self.__class__(diagram, drawer=drawer,
+                                                   fontmap=fontmap,
+                                                   scale_ratio=ratio,
+                                                   original_ratio=ratio)
+
+        if scale_ratio != 1:
+            for name in ('cellsize', 'node_padding', 'line_spacing',
+                         'shadow_offset', 'page_margin', 'page_padding',
+                         'node_width', 'node_height',
+                         'span_width', 'span_height'):
+                setattr(self, name, self.scale(getattr(self, name)))
+
         # setup spreadsheet
         sheet = self.spreadsheet = SpreadSheetMetrics(self)
         nodes = [n for n in diagram.traverse_nodes() if n.drawable]
 
-        node_width = self.node_width
+        widths = defaultdict(int)
+        heights = defaultdict(int)
+        for node in nodes:
+            x, y = node.xy
+            widths[x] = max(widths[x], self.node_width_of(node))
+            heights[y] = max(heights[y], self.node_height_of(node))
+
         for x in range(diagram.colwidth):
-            widths = [n.width for n in nodes if n.xy.x == x]
-            if widths:
-                width = max(n or node_width for n in widths)
-                sheet.set_node_width(x, width)
+            if x in widths:
+                sheet.set_node_width(x, widths[x])
 
-        node_height = self.node_height
         for y in range(diagram.colheight):
-            heights = [n.height for n in nodes if n.xy.y == y]
-            if heights:
-                height = max(n or node_height for n in heights)
-                sheet.set_node_height(y, height)
+            if y in heights:
+                sheet.set_node_height(y, heights[y])
 
-    @property
-    def original_metrics(self):
-        return self
+    def scale(self, value):
+        """Scale the length (or XY, Size, Box and list of them) to the image
+
+        Scaled lengths are rounded to integers.
+        """
+        ratio = self.scale_ratio
+        if ratio == 1 or value is None:
+            return value
+        elif isinstance(value, (XY, Size)):
+            return value.__class__(*(self.scale(n) for n in value))
+        elif isinstance(value, Box):
+            return Box(*(self.scale(n) for n in value))
+        elif isinstance(value, (list, tuple)):
+            return value.__class__(self.scale(n) for n in value)
+        else:
+            return int(math.floor(value * ratio + 0.5))
+
+    def node_width_of(self, node):
+        return self.scale(node.width) or self.node_width
+
+    def node_height_of(self, node):
+        return self.scale(node.height) or self.node_height
 
     def shift(self, x, y):
+        """Returns metrics shifted by (x, y); not scaled by scale_ratio"""
         metrics = copy.copy(self)
-        metrics.spreadsheet = copy.copy(self.spreadsheet)
-        metrics.spreadsheet.metrics = metrics
-        metrics.page_margin = XY(x, y)
+        metrics.spreadsheet = self.spreadsheet.duplicate(metrics)
+        metrics.page_margin = self.scale(XY(x, y))
+        metrics.clear_cache()
+
+        if self.original_metrics is self:
+            metrics.original_metrics = metrics
+        else:
+            metrics.original_metrics = self.original_metrics.shift(x, y)
 
         return metrics
 
+    def clear_cache(self):
+        """Discard metrics of elements computed so far"""
+        self._cache = {}
+
+    def cached(self, key, func, *args):
+        if key not in self._cache:
+            self._cache[key] = func(*args)
+
+        return self._cache[key]
+
     def textsize(self, string, font=None, width=65535):
         return self.drawer.textsize(string, font, maxwidth=width)
 
     def node(self, node):
-        renderer = noderenderer.get(node.shape)
+        return self.cached(('node', node), self._node, node)
+
+    def _node(self, node):
+        renderer = noderenderer.get(node.shape, node.context.shape_namespace)
 
         if hasattr(renderer, 'render'):
             return renderer(node, self)
@@ -208,12 +283,17 @@ class DiagramMetrics(object):
             return self.cell(node)
 
     def cell(self, node, use_padding=True):
-        return self.spreadsheet.node(node, use_padding)
+        return self.cached(('cell', node, use_padding),
+                           self.spreadsheet.node, node, use_padding)
 
     def group(self, group):
-        return self.spreadsheet.node(group, use_padding=False)
+        return self.cached(('cell', group, False),
+                           self.spreadsheet.node, group, False)
 
     def edge(self, edge):
+        return self.cached(('edge', edge), self._edge, edge)
+
+    def _edge(self, edge):
         if self.edge_layout == 'flowchart':
             if edge.node1.group.orientation == 'landscape':
                 return FlowchartLandscapeEdgeMetrics(edge, self)
@@ -226,7 +306,17 @@ class DiagramMetrics(object):
                 return PortraitEdgeMetrics(edge, self)
 
     def font_for(self, element):
-        return self.fontmap.find(element)
+        # drawers may modify the font; return a copy of the cached one
+        font = self.cached(('font', element), self._font_for, element)
+        return font.duplicate()
+
+    def _font_for(self, element):
+        font = self.fontmap.find(element)
+        if self.scale_ratio != 1:
+            font = FontInfo(font.familyname, font.path,
+                            self.scale(font.size))
+
+        return font
 
     def pagesize(self, width, height):
         return self.spreadsheet.pagesize(width, height)
@@ -241,39 +331,102 @@ class SubMetrics(object):
         return getattr(self.metrics, name)
 
 
+def spreadsheet_property(name):
+    def getter(self):
+        return self.__dict__['_' + name]
+
+    def setter(self, value):
+        self.__dict__['_' + name] = value
+        self.invalidate(name)
+
+    return property(getter, setter)
+
+
 class SpreadSheetMetrics(SubMetrics):
+    node_width = spreadsheet_property('node_width')
+    node_height = spreadsheet_property('node_height')
+    span_width = spreadsheet_property('span_width')
+    span_height = spreadsheet_property('span_height')
+
     def __init__(self, metrics):
         self.metrics = metrics
+        self._offsets = {}
         self.node_width = defaultdict(lambda: metrics.node_width)
         self.node_height = defaultdict(lambda: metrics.node_height)
         self.span_width = defaultdict(lambda: metrics.span_width)
         self.span_height = defaultdict(lambda: metrics.span_height)
 
+    def duplicate(self, metrics):
+        """Returns a copy bound to metrics (sizes are copied, offsets are not)
+
+        Sizes are not shared; offsets cached by the copy are not stale even
+        if sizes of this instance are changed (and vice versa).
+        """
+        spreadsheet = copy.copy(self)
+        spreadsheet.metrics = metrics
+        spreadsheet._offsets = {}
+        for name in ('node_width', 'node_height', 'span_width', 'span_height'):
+            sizes = getattr(self, name)
+            setattr(spreadsheet, name,
+                    defaultdict(sizes.default_factory, sizes))
+
+        return spreadsheet
+
+    def invalidate(self, name=None):
+        if name is None:
+            self._offsets = {}
+        else:
+            self._offsets.pop(name, None)
+
+        self.metrics.clear_cache()
+
+    def offset(self, name, count):
+        """Returns sum of sizes of the first ``count`` rows (or columns)
+
+        The cumulative sums are cached and extended on demand;
+        they are invalidated when the sizes are changed via setters.
+        """
+        if count <= 0:
+            return 0
+
+        sizes = getattr(self, name)
+        offsets = self._offsets.setdefault(name, [0])
+        for i in range(len(offsets) - 1, count):
+            offsets.append(offsets[i] + sizes[i])
+
+        return offsets[count]
+
     def set_node_width(self, x, width):
         if (width is not None and 0 < width and
            (x not in self.node_width or self.node_width[x] < width)):
             self.node_width[x] = width
+            self.invalidate('node_width')
 
     def set_node_height(self, y, height):
         if (height is not None and 0 < height and
            (y not in self.node_height or self.node_height[y] < height)):
             self.node_height[y] = height
+            self.invalidate('node_height')
 
     def set_span_width(self, x, width):
         if (width is not None and 0 < width and
            (x not in self.span_width or self.span_width[x] < width)):
             self.span_width[x] = width
+            self.invalidate('span_width')
 
     def add_span_width(self, x, width):
         self.span_width[x] += width
+        self.invalidate('span_width')
 
     def set_span_height(self, y, height):
         if (height is not None and 0 < height and
            (y not in self.span_height or self.span_height[y] < height)):
             self.span_height[y] = height
+            self.invalidate('span_height')
 
     def add_span_height(self, y, height):
         self.span_height[y] += height
+        self.invalidate('span_height')
 
     def node(self, node, use_padding=True):
         x1, y1 = self._node_topleft(node, use_padding)
@@ -286,18 +439,18 @@ class SpreadSheetMetrics(SubMetrics):
         margin = self.page_margin
         padding = self.page_padding
 
-        node_width = sum(self.node_width[i] for i in range(x))
-        node_height = sum(self.node_height[i] for i in range(y))
-        span_width = sum(self.span_width[i] for i in range(x + 1))
-        span_height = sum(self.span_height[i] for i in range(y + 1))
+        node_width = self.offset('node_width', x)
+        node_height = self.offset('node_height', y)
+        span_width = self.offset('span_width', x + 1)
+        span_height = self.offset('span_height', y + 1)
 
         if use_padding:
-            width = node.width or self.metrics.node_width
+            width = self.metrics.node_width_of(node)
             xdiff = (self.node_width[x] - width) // 2
             if xdiff < 0:
                 xdiff = 0
 
-            height = node.height or self.metrics.node_height
+            height = self.metrics.node_height_of(node)
             ydiff = (self.node_height[y] - height) // 2
             if ydiff < 0:
                 ydiff = 0
@@ -316,18 +469,18 @@ class SpreadSheetMetrics(SubMetrics):
         margin = self.page_margin
         padding = self.page_padding
 
-        node_width = sum(self.node_width[i] for i in range(x + 1))
-        node_height = sum(self.node_height[i] for i in range(y + 1))
-        span_width = sum(self.span_width[i] for i in range(x + 1))
-        span_height = sum(self.span_height[i] for i in range(y + 1))
+        node_width = self.offset('node_width', x + 1)
+        node_height = self.offset('node_height', y + 1)
+        span_width = self.offset('span_width', x + 1)
+        span_height = self.offset('span_height', y + 1)
 
         if use_padding:
-            width = node.width or self.metrics.node_width
+            width = self.metrics.node_width_of(node)
             xdiff = (self.node_width[x] - width) // 2
             if xdiff < 0:
                 xdiff = 0
 
-            height = node.height or self.metrics.node_height
+            height = self.metrics.node_height_of(node)
             ydiff = (self.node_height[y] - height) // 2
             if ydiff < 0:
                 ydiff = 0
@@ -395,6 +548,7 @@ class EdgeMetrics(SubMetrics):
     def __init__(self, edge, metrics):
         self.metrics = metrics
         self.edge = edge
+        self._lines = None
 
     @property
     def headshapes(self):
@@ -486,6 +640,12 @@ class EdgeMetrics(SubMetrics):
 
     @property
     def shaft(self):
+        if self._lines is None:
+            self._lines = self._route()
+
+        return self._lines.copy()
+
+    def _route(self):
         cell = self.cellsize
         lines = self._shaft
         head1, head2 = self.headshapes
@@ -32,17 +32,18 @@ def install_renderer(name, renderer):
     renderers[name] = renderer
 
 
-def set_default_namespace(path):
-    searchpath[:] = []
+def set_default_namespace(path, namespace=searchpath):
+    namespace[:] = []
     for path in path.split(','):
-        searchpath.append(path)
+        if path:
+            namespace.append(path)
 
 
-def get(shape):
+def get(shape, namespace=searchpath):
     if not renderers:
         init_renderers()
 
-    for path in searchpath:
+    for path in namespace:
         name = "%s.%s" % (path, shape)
         if name in renderers:
             return renderers[name]
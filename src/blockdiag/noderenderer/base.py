@@ -52,8 +52,8 @@ class NodeShape(object):
             node.label = ""
             node.background = ""
             for i in range(2, 0, -1):
-                # use original_metrics FORCE
-                r = self.metrics.original_metrics.cellsize // 2 * i
+                # shift() takes unscaled length; use cellsize of the class
+                r = self.metrics.__class__.cellsize // 2 * i
                 metrics = self.metrics.shift(r, r)
 
                 self.__class__(node, metrics).render(drawer, _format,
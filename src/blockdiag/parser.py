@@ -36,16 +36,26 @@ At the moment, the parser builds only a parse tree, not an abstract syntax tree
 '''
 
 import io
-from re import MULTILINE, DOTALL
+import re
+import sys
+import pickle
+from hashlib import sha1
 from collections import namedtuple
-from funcparserlib.lexer import make_tokenizer, Token, LexerError
+from functools import partial
+from funcparserlib.lexer import Token, LexerError
 from funcparserlib.parser import (some, a, maybe, many, finished, skip,
                                   forward_decl)
+from blockdiag import __version__
+from blockdiag.utils import LRUCache
 from blockdiag.utils.compat import u
+from blockdiag.utils.rendercache import RenderCache
 
 
 ENCODING = 'utf-8'
 
+# cache of parse trees (see enable_cache())
+cache = None
+
 Diagram = namedtuple('Diagram', 'id stmts')
 Group = namedtuple('Group', 'id stmts')
 Node = namedtuple('Node', 'id attrs')
@@ -59,23 +69,85 @@ class ParseException(Exception):
     pass
 
 
+# token specifications (tried in order); DOTALL of String is given by [\s\S]
+TOKEN_SPECS = [                                                           # NOQA
+    ('Comment', r'/\*(.|[\r\n])*?\*/'),                                   # NOQA
+    ('Comment', r'(//|#).*'),                                             # NOQA
+    ('NL',      r'[\r\n]+'),                                              # NOQA
+    ('Space',   r'[ \t\r\n]+'),                                           # NOQA
+    ('Name',    u('[A-Za-z_0-9\u0080-\uffff]') +                          # NOQA
+                u('[A-Za-z_\\-.0-9\u0080-\uffff]*')),                     # NOQA
+    ('Op',      r'[{};,=\[\]]|(<->)|(<-)|(--)|(->)|(>-<)|(-<)|(>-)'),     # NOQA
+    ('Number',  r'-?(\.[0-9]+)|([0-9]+(\.[0-9]*)?)'),                     # NOQA
+    ('String',  r'(?P<quote>"|\')[\s\S]*?(?<!\\)(?P=quote)'),             # NOQA
+]                                                                         # NOQA
+USELESS_TOKENS = ('Comment', 'NL', 'Space')
+
+
+def make_token_pattern(specs, useless):
+    """Compile token specs to one regexp; returns (regexp, types of groups)
+
+    Useless tokens (they should be placed at head of specs) are skipped by
+    the regexp itself; group "skip" matches them greedily and atomically
+    (emulated by lookahead and backreference).  Then one of other tokens
+    follows (optional at end of the string).
+    """
+    skips = []
+    patterns = []
+    types = {}
+    for i, (_type, pattern) in enumerate(specs):
+        if _type in useless:
+            skips.append(pattern)
+        else:
+            name = 'T%d' % i
+            patterns.append(u('(?P<%s>%s)') % (name, pattern))
+            types[name] = _type
+
+    pattern = (u('(?=(?P<skip>(?:%s)*))(?P=skip)(?:%s)?') %
+               (u('|').join(skips), u('|').join(patterns)))
+    return re.compile(pattern), types
+
+
+token_pattern, token_types = make_token_pattern(TOKEN_SPECS, USELESS_TOKENS)
+
+
 def tokenize(string):
     """str -> Sequence(Token)"""
-    # flake8: NOQA
-    specs = [                                                                 # NOQA
-        ('Comment', (r'/\*(.|[\r\n])*?\*/', MULTILINE)),                      # NOQA
-        ('Comment', (r'(//|#).*',)),                                          # NOQA
-        ('NL',      (r'[\r\n]+',)),                                           # NOQA
-        ('Space',   (r'[ \t\r\n]+',)),                                        # NOQA
-        ('Name',    (u('[A-Za-z_0-9\u0080-\uffff]') +                         # NOQA
-                     u('[A-Za-z_\\-.0-9\u0080-\uffff]*'),)),                  # NOQA
-        ('Op',      (r'[{};,=\[\]]|(<->)|(<-)|(--)|(->)|(>-<)|(-<)|(>-)',)),  # NOQA
-        ('Number',  (r'-?(\.[0-9]+)|([0-9]+(\.[0-9]*)?)',)),                  # NOQA
-        ('String',  (r'(?P<quote>"|\').*?(?<!\\)(?P=quote)', DOTALL)),        # NOQA
-    ]
-    useless = ['Comment', 'NL', 'Space']
-    t = make_tokenizer(specs)
-    return [x for x in t(string) if x.type not in useless]
+    match = token_pattern.match
+    tokens = []
+    length = len(string)
+    line = 1
+    linestart = 0  # offset of current line
+    i = 0
+    while i < length:
+        m = match(string, i)
+        start = m.end('skip')
+        if start != i:
+            newlines = string.count('\n', i, start)
+            if newlines:
+                line += newlines
+                linestart = string.rfind('\n', i, start) + 1
+
+        _type = token_types.get(m.lastgroup)
+        if _type is None:
+            if start < length:
+                errline = string.splitlines()[line - 1]
+                raise LexerError((line, start - linestart + 1), errline)
+            break
+
+        end = m.end()
+        value = string[start:end]
+        position = (line, start - linestart + 1)
+        newlines = value.count('\n')
+        if newlines:
+            line += newlines
+            linestart = string.rfind('\n', start, end) + 1
+
+        tokens.append(Token(_type, value, position, (line, end - linestart)))
+
+        i = end
+
+    return tokens
 
 
 def create_mapper(fn, default_value=None):
@@ -233,6 +305,183 @@ def parse(seq):
     return dotfile.parse(seq)
 
 
+class FastParser(object):
+    """Hand-written parser for the grammar of parse(); builds the same tree.
+
+    Statements are parsed iteratively (groups are kept in a stack) with
+    one or two tokens of lookahead instead of backtracking combinators.
+    Every input which parse() rejects, this parser rejects too.
+    """
+    ID_TYPES = ('Name', 'Number', 'String')
+    EDGE_RELATIONS = ('->', '--', '<-', '<->', '>-', '-<', '>-<')
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        if index < len(self.tokens):
+            return self.tokens[index]
+        else:
+            return None
+
+    def error(self, expected):
+        token = self.peek()
+        if token is None:
+            msg = "got unexpected end of input, expected: %s" % expected
+        else:
+            msg = ("%d,%d-%d,%d: got unexpected token: '%s', expected: %s" %
+                   (token.start + token.end + (token.value, expected)))
+        raise ParseException(msg)
+
+    def is_id(self, offset=0):
+        token = self.peek(offset)
+        return token is not None and token.type in self.ID_TYPES
+
+    def is_op(self, value, offset=0):
+        token = self.peek(offset)
+        return (token is not None and token.type == 'Op' and
+                token.value == value)
+
+    def is_keyword(self, names, offset=0):
+        token = self.peek(offset)
+        return token is not None and token.type == 'Name' and \
+            token.value in names
+
+    def is_edge_relation(self):
+        token = self.peek()
+        return (token is not None and token.type == 'Op' and
+                token.value in self.EDGE_RELATIONS)
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token.value
+
+    def take_id(self):
+        if not self.is_id():
+            self.error('id')
+        return self.take()
+
+    def take_op(self, value):
+        if not self.is_op(value):
+            self.error("'%s'" % value)
+        return self.take()
+
+    def parse(self):
+        if self.is_keyword(('diagram', 'blockdiag')):
+            diagram_id = [self.take()]
+            if self.is_id():
+                diagram_id.append(self.take())
+            else:
+                diagram_id.append(None)
+        else:
+            diagram_id = None
+
+        self.take_op('{')
+        stmts = self.statements()
+        if self.peek() is not None:
+            self.error('end of input')
+
+        return Diagram(diagram_id, stmts)
+
+    def statements(self):
+        groups = []  # stack of (id of group, statements of outer group)
+        stmts = []
+        while True:
+            if self.is_op('}'):
+                self.pos += 1
+                if not groups:
+                    return stmts
+
+                group_id, outer = groups.pop()
+                outer.append(Group(group_id, stmts))
+                stmts = outer
+            elif not self.is_id():
+                self.error("'}'")
+            elif (not groups and self.is_keyword(('class', 'plugin')) and
+                  self.is_id(1)):
+                stmts.append(Extension(self.take(), self.take(),
+                                       self.option_list()))
+            else:
+                start = self.pos
+                node_list = self.node_list()
+                if self.is_edge_relation():
+                    stmts.append(self.edge_stmt(node_list))
+                elif self.is_keyword(('group',), start - self.pos) and \
+                        self.is_group_stmt(start):
+                    self.pos = start + 1
+                    if self.is_id():
+                        group_id = self.take()
+                    else:
+                        group_id = None
+                    self.take_op('{')
+
+                    groups.append((group_id, stmts))
+                    stmts = []
+                    continue
+                elif (len(node_list) == 1 and self.is_op('=') and
+                      self.is_id(1)):
+                    self.pos += 1
+                    stmts.append(Attr(node_list[0], self.take()))
+                else:
+                    attrs = self.option_list()
+                    stmts.append(Statements([Node(node, attrs)
+                                             for node in node_list]))
+
+            if self.is_op(';'):
+                self.pos += 1
+
+    def is_group_stmt(self, start):
+        offset = start - self.pos + 1
+        if self.is_op('{', offset):
+            return True
+        else:
+            return self.is_id(offset) and self.is_op('{', offset + 1)
+
+    def node_list(self):
+        nodes = [self.take_id()]
+        while self.is_op(',') and self.is_id(1):
+            self.pos += 1
+            nodes.append(self.take())
+
+        return nodes
+
+    def edge_stmt(self, first):
+        node_lists = [first]
+        edge_types = []
+        while self.is_edge_relation():
+            edge_types.append(self.take())
+            node_lists.append(self.node_list())
+
+        attrs = self.option_list()
+        edges = [Edge(node_lists[i], edge_type, node_lists[i + 1], attrs)
+                 for i, edge_type in enumerate(edge_types)]
+        return Statements(edges)
+
+    def option_list(self):
+        if not self.is_op('['):
+            return []
+
+        self.pos += 1
+        attrs = [self.option_stmt()]
+        while self.is_op(','):
+            self.pos += 1
+            attrs.append(self.option_stmt())
+        self.take_op(']')
+
+        return attrs
+
+    def option_stmt(self):
+        name = self.take_id()
+        if self.is_op('='):
+            self.pos += 1
+            return Attr(name, self.take_id())
+        else:
+            return Attr(name, None)
+
+
 def sort_tree(tree):
     def weight(node):
         if isinstance(node, (Attr, Extension)):
@@ -248,17 +497,83 @@ def sort_tree(tree):
     return tree
 
 
-def parse_string(string):
+class ParseCache(object):
+    """Cache of parse trees keyed by hash of source string.
+
+    Trees are kept as pickles in memory (and in directory if given), so
+    every call returns a fresh copy of the tree; DiagramTreeBuilder
+    modifies statements of the tree.
+    """
+    def __init__(self, maxsize=256, directory=None):
+        self.trees = LRUCache(maxsize)
+        if directory:
+            self.store = RenderCache(directory)
+        else:
+            self.store = None
+
+    def key(self, string):
+        seed = u("%s:%s:%d:") % (__name__, __version__, sys.version_info[0])
+        return sha1((seed + string).encode('utf-8')).hexdigest()
+
+    def get(self, string, parser):
+        key = self.key(string)
+        data = self.trees.get(key)
+        if data is None and self.store:
+            data = self.store.read(key, 'pickle')
+
+        if data is None:
+            tree = parser(string)
+            data = pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+            if self.store:
+                self.store.store(key, 'pickle', content=data)
+        else:
+            tree = pickle.loads(data)
+
+        self.trees.set(key, data)
+        return tree
+
+
+def enable_cache(maxsize=256, directory=None):
+    """Cache parse trees of parse_string() (on memory, and in directory)"""
+    global cache
+    cache = ParseCache(maxsize, directory)
+
+
+def disable_cache():
+    global cache
+    cache = None
+
+
+ENGINES = {
+    'funcparserlib': parse,
+    'fast': lambda tokens: FastParser(tokens).parse(),
+}
+
+
+def parse_string(string, engine='funcparserlib'):
+    """Parse diagram source; engine is one of 'funcparserlib' and 'fast'"""
+    if engine not in ENGINES:
+        raise ValueError("unknown parser engine: %s" % engine)
+
+    if cache is not None:
+        return cache.get(string, partial(_parse_string, engine=engine))
+    else:
+        return _parse_string(string, engine)
+
+
+def _parse_string(string, engine='funcparserlib'):
     try:
-        tree = parse(tokenize(string))
+        tree = ENGINES[engine](tokenize(string))
         return sort_tree(tree)
     except LexerError as e:
         message = "Got unexpected token at line %d column %d" % e.place
         raise ParseException(message)
+    except ParseException:
+        raise
     except Exception as e:
         raise ParseException(str(e))
 
 
-def parse_file(path):
+def parse_file(path, engine='funcparserlib'):
     code = io.open(path, 'r', encoding='utf-8-sig').read()
-    return parse_string(code)
+    return parse_string(code, engine)
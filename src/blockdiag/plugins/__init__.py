@@ -13,25 +13,50 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import threading
 from pkg_resources import iter_entry_points
 from blockdiag.utils.logging import warning
 
-loaded_plugins = []
-node_handlers = []
-general_handlers = {}
+
+class Registry(object):
+    """Loaded plugins and their handlers"""
+    def __init__(self):
+        self.loaded_plugins = []
+        self.node_handlers = []
+        self.general_handlers = {}
+
+
+# global registry (for diagrams built without elements.Context)
+registry = Registry()
+loaded_plugins = registry.loaded_plugins
+node_handlers = registry.node_handlers
+general_handlers = registry.general_handlers
+
+# registry of the plugin being loaded in each thread
+_loading = threading.local()
+
+
+def get_registry():
+    return getattr(_loading, 'registry', None) or registry
 
 
 def load(plugins, diagram, **kwargs):
+    registry = diagram.context.plugins
     for name in plugins:
-        if name in loaded_plugins:
+        if name in registry.loaded_plugins:
             warning('plugin "%s" is already loaded. ignored.', name)
             return
 
         for ep in iter_entry_points('blockdiag_plugins', name):
             module = ep.load()
-            loaded_plugins.append(name)
+            registry.loaded_plugins.append(name)
             if hasattr(module, 'setup'):
-                module.setup(module, diagram, **kwargs)
+                loading = get_registry()
+                try:
+                    _loading.registry = registry
+                    module.setup(module, diagram, **kwargs)
+                finally:
+                    _loading.registry = loading
             break
         else:
             msg = "unknown plugin: %s" % name
@@ -39,6 +64,7 @@ def load(plugins, diagram, **kwargs):
 
 
 def install_general_handler(name, handler):
+    general_handlers = get_registry().general_handlers
     if name not in general_handlers:
         general_handlers[name] = []
 
@@ -46,17 +72,23 @@ def install_general_handler(name, handler):
 
 
 def fire_general_event(name, *args):
-    handlers = general_handlers.get(name, [])
+    return _fire_general_event(get_registry(), name, *args)
+
+
+def _fire_general_event(registry, name, *args):
+    handlers = registry.general_handlers.get(name, [])
     return all(handler(*args) for handler in handlers)
 
 
 def install_node_handler(handler):
+    node_handlers = get_registry().node_handlers
     if handler not in node_handlers:
         node_handlers.append(handler)
 
 
 def fire_node_event(node, name, *args):
-    return all(handler.fire(name, node, *args) for handler in node_handlers)
+    handlers = node.context.plugins.node_handlers
+    return all(handler.fire(name, node, *args) for handler in handlers)
 
 
 class NodeHandler(object):
@@ -80,17 +112,18 @@ class NodeHandler(object):
         return True
 
 
-def cleanup():
-    fire_general_event('cleanup')
+def cleanup(registry=registry):
+    _fire_general_event(registry, 'cleanup')
 
-    for name in list(general_handlers.keys()):
-        del general_handlers[name]
+    handlers = registry.general_handlers
+    for name in list(handlers.keys()):
+        del handlers[name]
 
-    for handler in node_handlers[:]:
-        node_handlers.remove(handler)
+    for handler in registry.node_handlers[:]:
+        registry.node_handlers.remove(handler)
 
-    for plugin in loaded_plugins[:]:
-        loaded_plugins.remove(plugin)
+    for plugin in registry.loaded_plugins[:]:
+        registry.loaded_plugins.remove(plugin)
 
 
 def setup(app):
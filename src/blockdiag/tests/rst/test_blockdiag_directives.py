@@ -14,7 +14,9 @@
 #  limitations under the License.
 
 import os
+import re
 import sys
+import types
 from docutils import nodes
 from docutils.core import publish_doctree
 from docutils.parsers.rst import directives as docutils
@@ -161,6 +163,111 @@ class TestRstDirectives(unittest.TestCase):
                          "<!DOCTYPE ", doctree[0][0][:49])
         self.assertEqual(0, len(os.listdir(self.tmpdir)))
 
+    def test_setup_cachedir(self):
+        cachedir = os.path.join(self.tmpdir, 'cache')
+        outputdir = os.path.join(self.tmpdir, 'output')
+        os.mkdir(outputdir)
+
+        directives.setup(format='SVG', outputdir=outputdir, cachedir=cachedir)
+        text = (".. blockdiag::\n"
+                "\n"
+                "   A -> B")
+        doctree = publish_doctree(text)
+        self.assertEqual(1, len(os.listdir(cachedir)))
+        self.assertEqual(dict(hits=0, misses=1),
+                         directives.rendercache.stats())
+
+        # image is copied from cache
+        os.remove(doctree[0]['uri'])
+        doctree = publish_doctree(text)
+        self.assertTrue(os.path.exists(doctree[0]['uri']))
+        self.assertEqual(dict(hits=1, misses=1),
+                         directives.rendercache.stats())
+
+        # inline SVG is also cached
+        directives.setup(format='SVG', outputdir=outputdir, cachedir=cachedir,
+                         inline_svg=True)
+        doctree1 = publish_doctree(text)
+        doctree2 = publish_doctree(text)
+        self.assertEqual(doctree1[0][0], doctree2[0][0])
+        self.assertEqual(dict(hits=1, misses=1),
+                         directives.rendercache.stats())
+
+    def test_setup_inline_svg_is_true_and_compact(self):
+        directives.setup(format='SVG', outputdir=self.tmpdir,
+                         inline_svg=True, compact=True)
+        text = (".. blockdiag::\n"
+                "\n"
+                "   A -> B\n"
+                "\n"
+                ".. blockdiag::\n"
+                "\n"
+                "   C -> D [color = blue]")
+        doctree = publish_doctree(text)
+        self.assertEqual(2, len(doctree))
+
+        selectors = [re.findall(r'^\.(\w+){', node[0], re.M)
+                     for node in doctree]
+        self.assertTrue(selectors[0])
+        self.assertTrue(selectors[1])
+        self.assertFalse(set(selectors[0]) & set(selectors[1]))
+
+    def test_setup_cachedir_does_not_build_cached_diagrams(self):
+        cachedir = os.path.join(self.tmpdir, 'cache')
+        built = []
+        to_diagram = directives.blockdiag_node.to_diagram
+
+        def counting_to_diagram(node):
+            built.append(node['code'])
+            return to_diagram(node)
+
+        try:
+            directives.blockdiag_node.to_diagram = counting_to_diagram
+            for inline_svg in (False, True):
+                directives.setup(format='SVG', outputdir=self.tmpdir,
+                                 cachedir=cachedir, inline_svg=inline_svg)
+                text = (".. blockdiag::\n"
+                        "\n"
+                        "   A -> B")
+                doctree = publish_doctree(text)
+                if not inline_svg:
+                    os.remove(doctree[0]['uri'])
+                publish_doctree(text)
+                self.assertEqual(dict(hits=1, misses=1),
+                                 directives.rendercache.stats())
+        finally:
+            directives.blockdiag_node.to_diagram = to_diagram
+
+        self.assertEqual(2, len(built))  # only on cache misses
+
+    def test_setup_cachedir_with_other_processor_version(self):
+        import blockdiag
+        cachedir = os.path.join(self.tmpdir, 'cache')
+        processor = types.ModuleType('seqdiag')
+        for name in ('parser', 'builder', 'drawer'):
+            setattr(processor, name, getattr(blockdiag, name))
+
+        try:
+            directives.blockdiag_node.processor = processor
+            directives.setup(format='SVG', outputdir=self.tmpdir,
+                             cachedir=cachedir, inline_svg=True)
+            text = (".. blockdiag::\n"
+                    "\n"
+                    "   A -> B")
+            processor.__version__ = '1.0.0'
+            publish_doctree(text)
+            publish_doctree(text)
+            self.assertEqual(dict(hits=1, misses=1),
+                             directives.rendercache.stats())
+
+            # upgraded
+            processor.__version__ = '1.1.0'
+            publish_doctree(text)
+            self.assertEqual(dict(hits=1, misses=2),
+                             directives.rendercache.stats())
+        finally:
+            directives.blockdiag_node.processor = blockdiag
+
     def test_setup_inline_svg_is_false(self):
         directives.setup(format='SVG', outputdir=self.tmpdir, inline_svg=False)
         text = (".. blockdiag::\n"
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import random
+import sys
+from blockdiag.builder import (Coordinates, DiagramLayoutManager,
+                               DiagramTreeBuilder, EdgeLayoutManager,
+                               ScreenNodeBuilder)
+from blockdiag.elements import Diagram, DiagramEdge, DiagramNode, NodeGroup
+from blockdiag.parser import parse_file, parse_string
+from blockdiag.utils import XY
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+def build(code):
+    DiagramNode.clear()
+    DiagramEdge.clear()
+    NodeGroup.clear()
+    Diagram.clear()
+
+    diagram = DiagramTreeBuilder().build(parse_string(code), None)
+    manager = DiagramLayoutManager(diagram)
+    manager.edges = DiagramEdge.find_by_level(diagram.level)
+
+    nodes = dict((node.id, node) for node in diagram.traverse_nodes())
+    return manager, nodes
+
+
+def ids(nodes):
+    return [node.id for node in nodes]
+
+
+def key(node):
+    # anonymous groups are named by uuid; use their members instead
+    if isinstance(node, NodeGroup):
+        return str(sorted(key(n) for n in node.nodes))
+    else:
+        return node.id
+
+
+def get_diagram_files():
+    diagramsdir = os.path.join(os.path.dirname(__file__), 'diagrams')
+    for filename in sorted(os.listdir(diagramsdir)):
+        if filename.endswith('.diag'):
+            yield os.path.join(diagramsdir, filename)
+
+
+class RecordingLayoutManager(DiagramLayoutManager):
+    circulars_log = []
+
+    def detect_circulars(self):
+        super(RecordingLayoutManager, self).detect_circulars()
+        circulars = set(frozenset(key(n) for n in c) for c in self.circulars)
+        self.circulars_log.append((key(self.diagram), circulars))
+
+
+class LegacyLayoutManager(RecordingLayoutManager):
+    """Enumerates all simple cycles (implementation of blockdiag-1.5)"""
+    def detect_circulars(self):
+        for node in self.diagram.nodes:
+            if not [x for x in self.circulars if node in x]:
+                self.detect_circulars_sub(node, [node])
+
+        # remove part of other circular
+        for c1 in self.circulars[:]:
+            for c2 in self.circulars:
+                intersect = set(c1) & set(c2)
+
+                if c1 != c2 and set(c1) == intersect:
+                    if c1 in self.circulars:
+                        self.circulars.remove(c1)
+                    break
+
+                if c1 != c2 and intersect:
+                    if c1 in self.circulars:
+                        self.circulars.remove(c1)
+                    self.circulars.remove(c2)
+                    self.circulars.append(c1 + c2)
+                    break
+
+        circulars = set(frozenset(key(n) for n in c) for c in self.circulars)
+        self.circulars_log.append((key(self.diagram), circulars))
+
+    def detect_circulars_sub(self, node, parents):
+        for child in self.get_child_nodes(node):
+            if child in parents:
+                i = parents.index(child)
+                if parents[i:] not in self.circulars:
+                    self.circulars.append(parents[i:])
+            else:
+                self.detect_circulars_sub(child, parents + [child])
+
+
+class DifferentialLayoutManager(LegacyLayoutManager):
+    """Lays out with current circulars; records where legacy ones disagree"""
+    disagreements = []
+    legacy_circulars_log = []
+
+    def detect_circulars(self):
+        super(DifferentialLayoutManager, self).detect_circulars()
+        self.legacy_circulars = self.circulars
+        self.circulars = []
+        DiagramLayoutManager.detect_circulars(self)
+        self.legacy_circulars_log.append((self.legacy_circulars,
+                                          self.circulars))
+
+    def is_circular_ref(self, node1, node2):
+        base = super(DifferentialLayoutManager, self)
+        ret = base.is_circular_ref(node1, node2)
+
+        circulars = self.circulars
+        try:
+            self.circulars = self.legacy_circulars
+            expected = base.is_circular_ref(node1, node2)
+        finally:
+            self.circulars = circulars
+
+        if ret != expected:
+            self.disagreements.append((node1.id, node2.id))
+        return ret
+
+
+def random_diagrams(count, seed=0):
+    rand = random.Random(seed)
+    for _ in range(count):
+        nodes = rand.randint(2, 8)
+        edges = ["N%d -> N%d" % (rand.randrange(nodes), rand.randrange(nodes))
+                 for _ in range(rand.randint(1, nodes * 2))]
+        yield "{ %s }" % "; ".join(edges)
+
+
+def layout(path, manager):
+    return layout_tree(parse_file(path), manager)
+
+
+def layout_tree(tree, manager):
+    diagram = ScreenNodeBuilder.build(tree, layout=False)
+    manager.circulars_log = []
+    manager(diagram).run()
+
+    positions = dict((key(n), (n.xy, n.colwidth, n.colheight))
+                     for n in diagram.traverse_nodes())
+    return positions, manager.circulars_log
+
+
+class TestNodeRelations(unittest.TestCase):
+    def test_related_nodes(self):
+        manager, nodes = build("""{ A; B; C; D;
+                                   A -> D; A -> C; A -> B; A -> A;
+                                   B -> A; C -> A }""")
+
+        self.assertEqual(['B', 'C', 'D'],
+                         ids(manager.get_child_nodes(nodes['A'])))
+        self.assertEqual(['B', 'C'],
+                         ids(manager.get_parent_nodes(nodes['A'])))
+        self.assertEqual(['A'], ids(manager.get_parent_nodes(nodes['D'])))
+        self.assertEqual([], ids(manager.get_child_nodes(nodes['D'])))
+        self.assertEqual(['B', 'C', 'D'],
+                         ids(manager.get_related_nodes(nodes['A'],
+                                                       parent=True,
+                                                       child=True)))
+
+    def test_related_nodes_ignores_folded_edges(self):
+        manager, nodes = build("{ A -> B; A -> C [folded] }")
+
+        self.assertEqual(['B'], ids(manager.get_child_nodes(nodes['A'])))
+        self.assertEqual([], ids(manager.get_parent_nodes(nodes['C'])))
+
+    def test_related_nodes_in_other_groups(self):
+        manager, nodes = build("{ A -> B; A -> C; group G { C } }")
+
+        # C is represented by its group in the top level layout
+        self.assertEqual(['B', 'G'],
+                         ids(manager.get_child_nodes(nodes['A'])))
+        self.assertEqual([], ids(manager.get_parent_nodes(nodes['C'])))
+
+    def test_related_nodes_returns_copy(self):
+        manager, nodes = build("{ A -> B; A -> C }")
+
+        manager.get_child_nodes(nodes['A']).reverse()
+        self.assertEqual(['B', 'C'],
+                         ids(manager.get_child_nodes(nodes['A'])))
+
+    def test_invalidate_relations(self):
+        manager, nodes = build("{ A -> B; A -> C }")
+        self.assertEqual(['B', 'C'],
+                         ids(manager.get_child_nodes(nodes['A'])))
+
+        nodes['B'].order, nodes['C'].order = nodes['C'].order, 1
+        manager.invalidate_relations()
+        self.assertEqual(['C', 'B'],
+                         ids(manager.get_child_nodes(nodes['A'])))
+
+    def test_relations_follow_edges(self):
+        manager, nodes = build("{ A -> B; A -> C }")
+        self.assertEqual(['B', 'C'],
+                         ids(manager.get_child_nodes(nodes['A'])))
+
+        manager.edges = [e for e in manager.edges if e.node2.id != 'B']
+        self.assertEqual(['C'], ids(manager.get_child_nodes(nodes['A'])))
+
+
+class TestCoordinates(unittest.TestCase):
+    def test_coordinates(self):
+        coordinates = Coordinates()
+        self.assertEqual(0, len(coordinates))
+        self.assertEqual(None, coordinates.max_y())
+
+        coordinates.append(XY(0, 0))
+        coordinates.append(XY(1, 3))
+        coordinates.append(XY(2, 1))
+
+        self.assertEqual(3, len(coordinates))
+        self.assertIn(XY(1, 3), coordinates)
+        self.assertIn((2, 1), coordinates)
+        self.assertNotIn(XY(1, 0), coordinates)
+        self.assertEqual([(0, 0), (1, 3), (2, 1)], list(coordinates))
+
+        self.assertEqual(3, coordinates.max_y())
+        self.assertEqual(3, coordinates.max_y(1))
+        self.assertEqual(1, coordinates.max_y(2))
+        self.assertEqual(None, coordinates.max_y(3))
+
+    def test_mark_xy(self):
+        manager, nodes = build("{ A }")
+        manager.mark_xy(XY(1, 2), 2, 3)
+
+        self.assertEqual(6, len(manager.coordinates))
+        self.assertIn(XY(2, 4), manager.coordinates)
+        self.assertEqual(4, manager.coordinates.max_y())
+
+
+class TestEdgeLayoutManager(unittest.TestCase):
+    def test_cells(self):
+        tree = parse_string("{ A -> B -> C; A -> C; group { D; E } }")
+        diagram = ScreenNodeBuilder.build(tree)
+        cells = EdgeLayoutManager(diagram).cells
+
+        self.assertEqual(['A', 'B', 'C', 'D', 'E'],
+                         sorted(node.id for node in cells.values()))
+        for node in cells.values():
+            self.assertIs(node, cells[node.xy])
+
+        edges = dict((e.node1.id + e.node2.id, e) for e in diagram.edges)
+        self.assertTrue(edges['AC'].skipped)
+        self.assertFalse(edges['AB'].skipped)
+        self.assertFalse(edges['BC'].skipped)
+
+
+class TestDetectCirculars(unittest.TestCase):
+    def test_detect_circulars(self):
+        manager, nodes = build("{ A -> B -> C -> A; C -> D -> E -> D; F }")
+        manager.detect_circulars()
+
+        self.assertEqual([['A', 'B', 'C'], ['D', 'E']],
+                         [ids(c) for c in manager.circulars])
+
+    def test_detect_circulars_having_multiple_entries(self):
+        manager, nodes = build("{ A -> B -> C -> D -> B; A -> C }")
+        manager.detect_circulars()
+
+        self.assertEqual([['C', 'D', 'B']],
+                         [ids(c) for c in manager.circulars])
+
+    def test_detect_circulars_on_long_circular(self):
+        count = sys.getrecursionlimit() * 2
+        chain = " -> ".join("N%d" % i for i in range(count))
+        manager, nodes = build("{ %s -> N0 }" % chain)
+        manager.detect_circulars()
+
+        self.assertEqual(1, len(manager.circulars))
+        self.assertEqual(["N%d" % i for i in range(count)],
+                         ids(manager.circulars[0]))
+
+    def test_detect_circulars_on_dense_graph(self):
+        count = 40
+        edges = ["N%d -> N%d" % (i, j)
+                 for i in range(count) for j in range(i + 1, count)]
+        edges.append("N%d -> N0" % (count - 1))
+        manager, nodes = build("{ %s }" % "; ".join(edges))
+        manager.detect_circulars()
+
+        self.assertEqual([["N%d" % i for i in range(count)]],
+                         [ids(c) for c in manager.circulars])
+
+    def test_compatibility_with_legacy_implementation(self):
+        for path in get_diagram_files():
+            expected = layout(path, LegacyLayoutManager)
+            actual = layout(path, RecordingLayoutManager)
+
+            self.assertEqual(expected, actual,
+                             "layout differs: %s" % os.path.basename(path))
+
+    def test_differential_with_legacy_implementation(self):
+        for code in random_diagrams(500):
+            DifferentialLayoutManager.disagreements = []
+            DifferentialLayoutManager.legacy_circulars_log = []
+            actual = layout_tree(parse_string(code), DifferentialLayoutManager)
+
+            log = DifferentialLayoutManager.legacy_circulars_log
+            for legacy, circulars in log:
+                self.assertEqual([ids(c) for c in legacy],
+                                 [ids(c) for c in circulars], code)
+            self.assertEqual([], DifferentialLayoutManager.disagreements, code)
+
+            expected = layout_tree(parse_string(code), LegacyLayoutManager)
+            self.assertEqual(expected[0], actual[0], code)
+
+    def test_layout_of_circulars_having_multiple_parents(self):
+        code = "{ N0 -> N1; N1 -> N0; N2 -> N0; N2 -> N1 }"
+        positions, _ = layout_tree(parse_string(code), DiagramLayoutManager)
+        self.assertEqual(XY(1, 1), positions['N1'][0])
+
+    def test_detect_circulars_over_scan_limit(self):
+        manager, nodes = build("{ A -> B -> C -> A; C -> D -> C }")
+        circulars = manager.scan_circulars(set(nodes.values()), 3)
+        self.assertIsNone(circulars)
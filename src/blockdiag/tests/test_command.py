@@ -14,8 +14,11 @@
 #  limitations under the License.
 
 import os
+import shutil
 import sys
+from PIL import Image
 from blockdiag.command import BlockdiagApp
+from blockdiag.utils import images
 from blockdiag.tests.utils import TemporaryDirectory
 
 if sys.version_info < (2, 7):
@@ -78,3 +81,333 @@ class TestBlockdiagApp(unittest.TestCase):
             self.assertFalse(plugins.loaded_plugins)  # and unloaded finally
         finally:
             tmpdir.clean()
+
+    def test_app_renders_diagrams_in_batch(self):
+        testdir = os.path.dirname(__file__)
+        diagrams = [os.path.join(testdir, 'diagrams', name)
+                    for name in ('plugin_autoclass.diag',
+                                 'node_shape_namespace.diag',
+                                 'single_node.diag')]
+
+        try:
+            tmpdir = TemporaryDirectory()
+
+            args = ['-T', 'SVG', '-o', tmpdir.name, '--batch'] + diagrams
+            app = BlockdiagApp()
+            app.parse_options(args)
+            app.create_fontmap()
+
+            # shape_namespace of node_shape_namespace.diag is not inherited
+            code = '{ A [shape = "condition"] }'
+            output = os.path.join(tmpdir.name, 'string.svg')
+            results = list(app.render_batch(diagrams + [(code, output)]))
+            self.assertEqual([0, 0, 0, -1], [r.status for r in results])
+            self.assertEqual('<string>', results[3].input)
+            self.assertEqual("unknown node shape: condition",
+                             results[3].error)
+
+            for result in results:
+                self.assertTrue(result.elapsed >= 0)
+                if result.status == 0:
+                    self.assertTrue(os.path.exists(result.output))
+                    self.assertEqual(tmpdir.name,
+                                     os.path.dirname(result.output))
+
+            # states of diagrams are cleaned up on each diagram
+            from blockdiag import noderenderer, plugins
+            self.assertFalse(plugins.loaded_plugins)
+            self.assertFalse(app.cleanup_handlers)
+            self.assertEqual([], noderenderer.searchpath)
+        finally:
+            tmpdir.clean()
+
+    def test_batch_option(self):
+        testdir = os.path.dirname(__file__)
+        diagpath = os.path.join(testdir, 'diagrams', 'single_node.diag')
+
+        try:
+            tmpdir = TemporaryDirectory()
+            fd, tmpfile = tmpdir.mkstemp()
+            os.close(fd)
+
+            args = ['-T', 'SVG', '-o', tmpdir.name, '--batch', diagpath]
+            self.assertEqual(0, BlockdiagApp().run(args))
+            self.assertTrue(os.path.exists(os.path.join(tmpdir.name,
+                                                        'single_node.svg')))
+
+            # -o option should be a directory
+            args = ['-T', 'SVG', '-o', tmpfile, '--batch', diagpath]
+            self.assertEqual(-1, BlockdiagApp().run(args))
+        finally:
+            tmpdir.clean()
+
+    def test_jobs_option(self):
+        testdir = os.path.dirname(__file__)
+        diagrams = [os.path.join(testdir, 'diagrams', name)
+                    for name in ('single_node.diag',
+                                 'errors/unknown_node_shape.diag',
+                                 'branched.diag')]
+
+        try:
+            tmpdir = TemporaryDirectory()
+
+            args = ['-T', 'SVG', '-o', tmpdir.name, '-j', '2'] + diagrams
+            self.assertEqual(-1, BlockdiagApp().run(args))
+            for name in ('single_node.svg', 'branched.svg'):
+                path = os.path.join(tmpdir.name, name)
+                self.assertTrue(os.path.exists(path))
+
+            args = ['-T', 'SVG', '-o', tmpdir.name, '-j', '0'] + diagrams
+            self.assertEqual(-1, BlockdiagApp().run(args))
+        finally:
+            tmpdir.clean()
+
+    def test_render_parallel(self):
+        testdir = os.path.dirname(__file__)
+        diagrams = [os.path.join(testdir, 'diagrams', name)
+                    for name in ('single_node.diag',
+                                 'errors/unknown_node_shape.diag',
+                                 'branched.diag')]
+
+        try:
+            tmpdir = TemporaryDirectory()
+
+            args = ['-T', 'SVG', '-o', tmpdir.name, '-j', '2'] + diagrams
+            app = BlockdiagApp()
+            app.parse_options(args)
+            app.create_fontmap()
+
+            results = list(app.render_parallel(diagrams, 2))
+            self.assertEqual(diagrams, [r.input for r in results])
+            self.assertEqual([0, -1, 0], [r.status for r in results])
+            self.assertEqual("unknown node shape: test_unknown_shape",
+                             results[1].error)
+        finally:
+            tmpdir.clean()
+
+    def test_cache_dir_option(self):
+        testdir = os.path.dirname(__file__)
+        diagpath = os.path.join(testdir, 'diagrams', 'single_node.diag')
+
+        try:
+            tmpdir = TemporaryDirectory()
+            cachedir = os.path.join(tmpdir.name, 'cache')
+            output = os.path.join(tmpdir.name, 'output.svg')
+
+            args = ['-T', 'SVG', '-o', output, '--cache-dir', cachedir,
+                    diagpath]
+            app = BlockdiagApp()
+            self.assertEqual(0, app.run(args))
+            self.assertEqual(dict(hits=0, misses=1), app.rendercache.stats())
+            self.assertEqual(1, len(os.listdir(cachedir)))
+            image = open(output, 'rb').read()
+
+            os.remove(output)
+            app = BlockdiagApp()
+            self.assertEqual(0, app.run(args))
+            self.assertEqual(dict(hits=1, misses=0), app.rendercache.stats())
+            self.assertEqual(image, open(output, 'rb').read())
+
+            # rendering options are part of cache key
+            app = BlockdiagApp()
+            self.assertEqual(0, app.run(args + ['--nodoctype']))
+            self.assertEqual(dict(hits=0, misses=1), app.rendercache.stats())
+
+            args = ['-T', 'SVG', '--cache-size', '0', diagpath]
+            self.assertEqual(-1, BlockdiagApp().run(args))
+        finally:
+            tmpdir.clean()
+
+    def test_cache_dir_option_with_icons(self):
+        testdir = os.path.dirname(__file__)
+        iconpath = os.path.join(testdir, 'diagrams', 'white.gif')
+
+        try:
+            tmpdir = TemporaryDirectory()
+            cachedir = os.path.join(tmpdir.name, 'cache')
+            output = os.path.join(tmpdir.name, 'output.svg')
+            icon = os.path.join(tmpdir.name, 'icon.gif')
+            diagpath = os.path.join(tmpdir.name, 'icon.diag')
+            shutil.copy(iconpath, icon)
+            with open(diagpath, 'w') as fd:
+                fd.write('{ A [icon = "%s"]; }' % icon)
+
+            args = ['-T', 'SVG', '-o', output, '--cache-dir', cachedir,
+                    diagpath]
+            app = BlockdiagApp()
+            self.assertEqual(0, app.run(args))
+            self.assertEqual(dict(hits=0, misses=1), app.rendercache.stats())
+
+            # icon is modified
+            with open(icon, 'ab') as fd:
+                fd.write(b'\0')
+            app = BlockdiagApp()
+            self.assertEqual(0, app.run(args))
+            self.assertEqual(dict(hits=0, misses=1), app.rendercache.stats())
+
+            app = BlockdiagApp()
+            self.assertEqual(0, app.run(args))
+            self.assertEqual(dict(hits=1, misses=0), app.rendercache.stats())
+        finally:
+            tmpdir.clean()
+
+    def test_compact_option(self):
+        testdir = os.path.dirname(__file__)
+        diagpath = os.path.join(testdir, 'diagrams', 'single_edge.diag')
+
+        try:
+            tmpdir = TemporaryDirectory()
+            output = os.path.join(tmpdir.name, 'output.svg')
+
+            args = ['-T', 'SVG', '-o', output, '--compact', diagpath]
+            self.assertEqual(0, BlockdiagApp().run(args))
+            self.assertIn('<style', open(output).read())
+
+            args = ['-T', 'PNG', '-o', output, '--compact', diagpath]
+            self.assertEqual(-1, BlockdiagApp().run(args))
+        finally:
+            tmpdir.clean()
+
+    def test_tile_size_option(self):
+        testdir = os.path.dirname(__file__)
+        diagpath = os.path.join(testdir, 'diagrams', 'single_edge.diag')
+
+        try:
+            tmpdir = TemporaryDirectory()
+            output = os.path.join(tmpdir.name, 'output.png')
+
+            args = ['-T', 'PNG', '-o', output, '--tile-size', '64', diagpath]
+            self.assertEqual(0, BlockdiagApp().run(args))
+            with open(output, 'rb') as fd:
+                self.assertEqual(b'\x89PNG', fd.read(4))
+
+            args = ['-T', 'SVG', '-o', output, '--tile-size', '64', diagpath]
+            self.assertEqual(-1, BlockdiagApp().run(args))
+
+            args = ['-T', 'PNG', '-o', output, '--tile-size', '0', diagpath]
+            self.assertEqual(-1, BlockdiagApp().run(args))
+
+            args = ['-T', 'PNG', '-o', output, '--tile-size', '64',
+                    '--size', '320x240', diagpath]
+            self.assertEqual(-1, BlockdiagApp().run(args))
+        finally:
+            tmpdir.clean()
+
+    def test_image_cache_dir_option(self):
+        testdir = os.path.dirname(__file__)
+        diagpath = os.path.join(testdir, 'diagrams', 'single_edge.diag')
+
+        try:
+            tmpdir = TemporaryDirectory()
+            output = os.path.join(tmpdir.name, 'output.svg')
+            cachedir = os.path.join(tmpdir.name, 'images')
+
+            args = ['-o', output, '--image-cache-dir', cachedir, diagpath]
+            self.assertEqual(0, BlockdiagApp().run(args))
+            self.assertEqual(cachedir, images.cache.directory)
+            self.assertTrue(os.path.isdir(cachedir))
+        finally:
+            images.disable_cache()
+            tmpdir.clean()
+
+    def test_scale_option(self):
+        testdir = os.path.dirname(__file__)
+        diagpath = os.path.join(testdir, 'diagrams', 'single_edge.diag')
+
+        try:
+            tmpdir = TemporaryDirectory()
+            output = os.path.join(tmpdir.name, 'output.png')
+
+            args = ['-T', 'PNG', '-o', output, diagpath]
+            self.assertEqual(0, BlockdiagApp().run(args))
+            width, height = Image.open(output).size
+
+            self.assertEqual(0, BlockdiagApp().run(args + ['--scale', '2']))
+            self.assertEqual((width * 2, height * 2), Image.open(output).size)
+
+            self.assertEqual(-1, BlockdiagApp().run(args + ['--scale', '0']))
+        finally:
+            tmpdir.clean()
+
+    def test_watch(self):
+        try:
+            tmpdir = TemporaryDirectory()
+            diagram1 = os.path.join(tmpdir.name, 'diagram1.diag')
+            diagram2 = os.path.join(tmpdir.name, 'diagram2.diag')
+            with open(diagram1, 'w') as fd:
+                fd.write('{ A -> B }')
+            with open(diagram2, 'w') as fd:
+                fd.write('{ A -> B -> C }')
+
+            app = BlockdiagApp()
+            app.parse_options(['-T', 'SVG', '--watch', tmpdir.name])
+            app.create_fontmap()
+            watcher = app.watch(tmpdir.name, interval=0)
+
+            # render all diagrams at first
+            results = next(watcher)
+            self.assertEqual([diagram1, diagram2], [r.input for r in results])
+            self.assertEqual([0, 0], [r.status for r in results])
+            self.assertTrue(os.path.exists(results[0].output))
+
+            # nothing modified
+            self.assertEqual([], next(watcher))
+
+            # touched, but content is not changed
+            os.utime(diagram1, (0, 0))
+            self.assertEqual([], next(watcher))
+
+            # modified
+            with open(diagram2, 'w') as fd:
+                fd.write('{ A -> B -> C -> D }')
+            os.utime(diagram2, (0, 0))
+            results = next(watcher)
+            self.assertEqual([diagram2], [r.input for r in results])
+            self.assertEqual([0], [r.status for r in results])
+
+            # rewritten within the granularity of mtime
+            with open(diagram2, 'w') as fd:
+                fd.write('{ A -> B -> C -> D -> E }')
+            os.utime(diagram2, (0, 0))
+            results = next(watcher)
+            self.assertEqual([diagram2], [r.input for r in results])
+            self.assertEqual([0], [r.status for r in results])
+
+            # errors are reported as results
+            with open(diagram1, 'w') as fd:
+                fd.write('{ A -> ')
+            results = next(watcher)
+            self.assertEqual([diagram1], [r.input for r in results])
+            self.assertEqual([-1], [r.status for r in results])
+
+            # broken (not UTF-8) file does not stop watching
+            with open(diagram2, 'wb') as fd:
+                fd.write(b'{ A -> \xff }')
+            results = next(watcher)
+            self.assertEqual([diagram2], [r.input for r in results])
+            self.assertEqual([-1], [r.status for r in results])
+            self.assertEqual([], next(watcher))
+
+            # removed after the failure
+            os.remove(diagram2)
+            self.assertEqual([], next(watcher))
+
+            with open(diagram1, 'w') as fd:
+                fd.write('{ A -> B }')
+            results = next(watcher)
+            self.assertEqual([diagram1], [r.input for r in results])
+            self.assertEqual([0], [r.status for r in results])
+        finally:
+            tmpdir.clean()
+
+    def test_watch_option(self):
+        testdir = os.path.dirname(__file__)
+        diagpath = os.path.join(testdir, 'diagrams', 'single_node.diag')
+
+        # --watch option should be a directory
+        args = ['-T', 'SVG', '--watch', diagpath]
+        self.assertEqual(-1, BlockdiagApp().run(args))
+
+        # -o option should be a directory
+        args = ['-T', 'SVG', '-o', diagpath, '--watch', testdir]
+        self.assertEqual(-1, BlockdiagApp().run(args))
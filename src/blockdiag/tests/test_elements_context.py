@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import sys
+from multiprocessing.pool import ThreadPool
+from blockdiag import plugins
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.elements import Context, DiagramNode, Diagram
+from blockdiag.parser import parse_string
+from blockdiag.tests.utils import render
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+SOURCES = [
+    """{ default_node_color = red; default_shape = roundedbox;
+         A -> B -> C; B -> D; }""",
+    """{ default_linecolor = blue; default_textcolor = green;
+         class emphasis [color = yellow, style = dashed];
+         A [class = emphasis]; A -> B, C; C -> D [folded]; }""",
+    """{ shape_namespace = flowchart; default_group_color = gray;
+         A [shape = condition]; B [shape = database];
+         group { A; B; } A -> C; }""",
+    """{ plugin attributes [status]; default_label_orientation = vertical;
+         A [status = done]; A -> B -> C -> D; }""",
+    """{ plugins = autoclass; class red [color = red];
+         A_red -> B -> C_red; group { orientation = portrait; D; E; } }""",
+    """{ node_width = 64; default_fontsize = 9; default_node_style = dotted;
+         A -> B; A -> C; B -> D; C -> D; D -> E; }""",
+]
+
+
+def build(source, context=None):
+    tree = parse_string(source)
+    return ScreenNodeBuilder.build(tree, context=context)
+
+
+def render_isolated(source):
+    context = Context()
+    try:
+        return render(source, context=context)
+    finally:
+        context.cleanup()
+
+
+class TestContext(unittest.TestCase):
+    def test_scoped_classes(self):
+        context = Context()
+        self.assertTrue(issubclass(context.DiagramNode, DiagramNode))
+        self.assertTrue(issubclass(context.Diagram, Diagram))
+        self.assertIs(context, context.DiagramNode.context)
+        self.assertIs(context.DiagramNode, context.Diagram._DiagramNode)
+        self.assertEqual('DiagramNode', context.DiagramNode.__name__)
+
+    def test_isolated_defaults(self):
+        context1 = Context()
+        context2 = Context()
+        diagram1 = build('{ default_node_color = red; A; }', context1)
+        diagram2 = build('{ A; }', context2)
+
+        self.assertEqual((255, 0, 0), diagram1.nodes[0].color)
+        self.assertEqual((255, 255, 255), diagram2.nodes[0].color)
+        self.assertEqual((255, 255, 255), DiagramNode.basecolor)
+
+    def test_isolated_classes(self):
+        context = Context()
+        build('{ class emphasis [color = red]; A [class = emphasis]; }',
+              context)
+
+        self.assertIn('emphasis', context.Diagram.classes)
+        self.assertNotIn('emphasis', Diagram.classes)
+        with self.assertRaises(AttributeError):
+            build('{ A [class = emphasis]; }', Context())
+
+    def test_isolated_shape_namespace(self):
+        context = Context()
+        diagram = build('{ shape_namespace = flowchart; A [shape = loopin]; }',
+                        context)
+
+        self.assertEqual(['flowchart'], context.shape_namespace)
+        self.assertEqual('loopin', diagram.nodes[0].shape)
+        with self.assertRaises(AttributeError):
+            build('{ A [shape = loopin]; }', Context())
+
+    def test_isolated_plugins(self):
+        context = Context()
+        build('{ plugins = autoclass; class red [color = red]; A_red; }',
+              context)
+
+        self.assertEqual(['autoclass'], context.plugins.loaded_plugins)
+        self.assertEqual(1, len(context.plugins.node_handlers))
+        self.assertEqual([], plugins.loaded_plugins)
+        self.assertEqual([], plugins.node_handlers)
+
+        context.cleanup()
+        self.assertEqual([], context.plugins.loaded_plugins)
+        self.assertEqual([], context.plugins.node_handlers)
+
+    def test_build_in_threads(self):
+        expected = [render_isolated(source) for source in SOURCES]
+
+        pool = ThreadPool(4)
+        try:
+            sources = SOURCES * 8
+            results = pool.map(render_isolated, sources, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(expected * 8, results)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import io
+import os
+import sys
+from PIL import Image, ImageDraw
+from blockdiag.imagedraw import png
+from blockdiag.imagedraw.utils import clear_caches
+from blockdiag.imagedraw.utils.pngwriter import PNGWriter
+from blockdiag.utils import Box, Size
+from blockdiag.utils.fontmap import FontInfo
+from blockdiag.tests.utils import render
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestShadows(unittest.TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def tearDown(self):
+        png.SHADOW_CACHE_AREA = 256 * 256
+
+    def test_shared_shadows(self):
+        source = '{ A; B; C; D [shape = diamond]; E [shape = diamond]; }'
+        render(source, 'PNG')
+        self.assertEqual(2, png.cached_shadow.cache.misses)
+        self.assertEqual(3, png.cached_shadow.cache.hits)
+
+    def test_shared_shadows_are_same_as_blurred_one_by_one(self):
+        source = ('{ A -> B -> C; A -> D; E [shape = ellipse]; '
+                  '  F [shape = diamond]; G [shape = diamond]; '
+                  '  H [shape = cloud]; group { I; J; } group { K; } }')
+        for options in ({}, {'antialias': True}):
+            png.SHADOW_CACHE_AREA = 256 * 256
+            image = render(source, 'PNG', **options)
+
+            png.SHADOW_CACHE_AREA = 0
+            self.assertEqual(image, render(source, 'PNG', **options))
+
+
+class TestText(unittest.TestCase):
+    def test_text(self):
+        fontpath = os.path.join(os.path.dirname(__file__), 'VLGothic',
+                                'VL-Gothic-Regular.ttf')
+        font = FontInfo('serif', fontpath, 11)
+        ttfont = png.ttfont_for(font)
+
+        drawer = png.ImageDrawEx(None)
+        drawer.set_canvas_size((200, 100))
+        drawer.text((10, 20), 'blockdiag', font, fill=(255, 0, 0))
+
+        # same as pasting color through the mask of text
+        image = Image.new('RGB', (200, 100), (255, 255, 255))
+        mask = Image.new('1', ttfont.getsize('blockdiag'))
+        ImageDraw.Draw(mask).text((0, 0), 'blockdiag', fill='white',
+                                  font=ttfont)
+        image.paste(Image.new('RGB', mask.size, (255, 0, 0)), (10, 20), mask)
+        self.assertEqual(image.tobytes(), drawer._image.tobytes())
+
+    def test_is_bitmap_font(self):
+        self.assertFalse(png.is_bitmap_font(FontInfo('serif', 'a.ttf', 11)))
+        self.assertFalse(png.is_bitmap_font(FontInfo('serif', 'a.ttc:1', 11)))
+        self.assertTrue(png.is_bitmap_font(FontInfo('serif', 'a.bdf', 11)))
+        self.assertTrue(png.is_bitmap_font(FontInfo('serif', 'a.pcf.gz', 11)))
+
+
+class TestAntialias(unittest.TestCase):
+    def test_supersampling_ratio(self):
+        source = '{ A -> B -> C; B -> D [label = "edge"]; group { C; D } }'
+        image = Image.open(io.BytesIO(render(source, 'PNG')))
+        for ratio in (True, 2, 3):
+            antialiased = render(source, 'PNG', antialias=ratio)
+            self.assertEqual(image.size,
+                             Image.open(io.BytesIO(antialiased)).size)
+
+            # tiled drawer supports any ratio too
+            tiled = render(source, 'PNG', antialias=ratio, tile_size=64)
+            self.assertEqual(Image.open(io.BytesIO(antialiased)).tobytes(),
+                             Image.open(io.BytesIO(tiled)).tobytes())
+
+    def test_non_integer_ratio(self):
+        source = '{ A -> B }'
+        for ratio in (1.5, 2.5, -2):
+            with self.assertRaises(ValueError):
+                render(source, 'PNG', antialias=ratio)
+
+    def test_scale(self):
+        source = '{ A -> B -> C; B -> D [label = "edge"]; group { C; D } }'
+        width, height = Image.open(io.BytesIO(render(source, 'PNG'))).size
+        for scale in (1.5, 3):
+            expected = (int(width * scale + 0.5), int(height * scale + 0.5))
+            scaled = render(source, 'PNG', scale=scale)
+            self.assertEqual(expected, Image.open(io.BytesIO(scaled)).size)
+
+            # supersampled at the output scale
+            antialiased = render(source, 'PNG', scale=scale, antialias=True)
+            self.assertEqual(expected,
+                             Image.open(io.BytesIO(antialiased)).size)
+
+            tiled = render(source, 'PNG', scale=scale, antialias=True,
+                           tile_size=64)
+            self.assertEqual(Image.open(io.BytesIO(antialiased)).tobytes(),
+                             Image.open(io.BytesIO(tiled)).tobytes())
+
+        with self.assertRaises(ValueError):
+            render(source, 'PNG', scale=-1)
+
+
+class TestTiles(unittest.TestCase):
+    def assertImageEqual(self, expected, actual):
+        expected = Image.open(io.BytesIO(expected))
+        actual = Image.open(io.BytesIO(actual))
+        self.assertEqual(expected.mode, actual.mode)
+        self.assertEqual(expected.size, actual.size)
+        self.assertEqual(expected.tobytes(), actual.tobytes())
+
+    def test_tiled_drawer(self):
+        drawer = png.create(None, tile_size=64)
+        self.assertIsInstance(drawer, png.TiledImageDrawEx)
+        self.assertIsInstance(png.create(None), png.ImageDrawEx)
+        self.assertNotIsInstance(png.create(None), png.TiledImageDrawEx)
+
+        # canvas is not allocated for the page
+        drawer.set_canvas_size(Size(2000, 1000))
+        self.assertEqual((1, 1), drawer._image.size)
+
+    def test_tiles_are_same_as_full_canvas(self):
+        source = ('{ A -> B -> C; A -> D -> E; B -> E [folded]; '
+                  '  F [shape = ellipse]; G [shape = diamond]; '
+                  '  H [shape = cloud, label = "long long label"]; '
+                  '  A -> F [label = "edge", thick]; C -> G -> H; '
+                  '  group { I; J [color = red]; } '
+                  '  group { shape = line; K -> L; } }')
+        for options in ({}, {'antialias': True},
+                        {'transparency': False},
+                        {'antialias': True, 'transparency': False}):
+            image = render(source, 'PNG', **options)
+            for tile_size in (37, 64, 4096):
+                tiled = render(source, 'PNG', tile_size=tile_size, **options)
+                self.assertImageEqual(image, tiled)
+
+    def test_tiles_are_culled(self):
+        drawer = png.create(None, tile_size=64)
+        drawer.set_canvas_size(Size(640, 640))
+        drawer.rectangle(Box(400, 400, 420, 420), fill='red')
+
+        rendered = []
+        render_tile = drawer.render_tile
+
+        def spy(region, operations):
+            if operations:
+                rendered.append(region)
+            return render_tile(region, operations)
+
+        drawer.render_tile = spy
+        drawer.save(None, None, 'PNG')
+        self.assertEqual(9, len(rendered))
+
+    def test_resizing_is_not_supported(self):
+        drawer = png.create(None, tile_size=64)
+        drawer.set_canvas_size(Size(640, 480))
+        drawer.save(None, (640, 480), 'PNG')
+        with self.assertRaises(ValueError):
+            drawer.save(None, (320, 240), 'PNG')
+
+
+class TestPNGWriter(unittest.TestCase):
+    def test_write(self):
+        for mode in ('RGB', 'RGBA'):
+            image = Image.new(mode, (50, 30), 'white')
+            ImageDraw.Draw(image).ellipse((5, 5, 40, 25), fill='red')
+
+            stream = io.BytesIO()
+            writer = PNGWriter(stream, image.size, mode)
+            for y in (0, 7, 14, 21, 28):
+                height = min(7, 30 - y)
+                writer.write(image.crop((0, y, 50, y + height)))
+            writer.close()
+
+            written = Image.open(io.BytesIO(stream.getvalue()))
+            self.assertEqual(mode, written.mode)
+            self.assertEqual(image.tobytes(), written.tobytes())
+
+    def test_write_errors(self):
+        writer = PNGWriter(io.BytesIO(), (50, 30), 'RGB')
+        with self.assertRaises(ValueError):
+            writer.write(Image.new('RGB', (40, 10)))
+        with self.assertRaises(ValueError):
+            writer.write(Image.new('RGBA', (50, 10)))
+        with self.assertRaises(ValueError):
+            writer.write(Image.new('RGB', (50, 40)))
+
+        writer.write(Image.new('RGB', (50, 10)))
+        with self.assertRaises(ValueError):
+            writer.close()  # too few rows
+
+        with self.assertRaises(ValueError):
+            PNGWriter(io.BytesIO(), (50, 30), 'P')
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import io
+import os
+import re
+import sys
+import gzip
+from xml.dom import minidom
+from blockdiag.imagedraw.svg import Compactor, classprefix
+from blockdiag.imagedraw.simplesvg import svg, writer, g, a, rect, title
+from blockdiag.tests.utils import TemporaryDirectory, render
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestSimpleSVGWriter(unittest.TestCase):
+    def test_writer(self):
+        root = svg(0, 0, 100, 100)
+        root.addElement(title('test'))
+        tree = svg(0, 0, 100, 100)
+        tree.addElement(title('test'))
+
+        output = io.StringIO()
+        stream = writer(root, output)
+        for parent in (tree, stream):
+            parent.addElement(rect(0, 0, 10, 10))
+            group = parent.addElement(g())
+            group.addElement(rect(1, 1, 10, 10))
+            anchor = group.addElement(a())
+            anchor.addElement(rect(2, 2, 10, 10))
+            group.addElement(rect(3, 3, 10, 10))
+            parent.addElement(g())
+            parent.addElement(rect(4, 4, 10, 10))
+        stream.finish()
+
+        self.assertEqual(tree.to_xml(), output.getvalue())
+
+    def test_writer_reopens_closed_containers(self):
+        output = io.StringIO()
+        stream = writer(svg(0, 0, 100, 100), output)
+        group = stream.addElement(g(id='group'))
+        group.addElement(rect(0, 0, 10, 10))
+        stream.addElement(rect(1, 1, 10, 10))
+        group.addElement(rect(2, 2, 10, 10))
+        stream.finish()
+
+        self.assertEqual(2, output.getvalue().count('<g id="group">'))
+        with self.assertRaises(ValueError):
+            stream.addElement(rect(3, 3, 10, 10))
+
+
+class TestSVGImageDraw(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.clean()
+
+    def test_stream(self):
+        basedir = os.path.join(os.path.dirname(__file__), 'diagrams')
+        for name in ('single_edge.diag', 'node_attribute.diag',
+                     'group_attribute.diag', 'node_rotated_labels.diag',
+                     'node_link.diag', 'edge_label.diag'):
+            source = io.open(os.path.join(basedir, name)).read()
+            for options in ({}, {'compact': True, 'code': source}):
+                self.assertEqual(render(source, **options),
+                                 render(source, stream=True, **options))
+
+    def test_stream_to_file(self):
+        source = '{ A -> B -> C; group { C; D [href = "#"] } }'
+        filename = os.path.join(self.tmpdir.name, 'output.svg')
+        image = render(source, size=(320, 240))
+        self.assertEqual(None, render(source, filename=filename,
+                                      size=(320, 240), stream=True))
+        with io.open(filename, encoding='utf-8') as fd:
+            self.assertEqual(image, fd.read())
+
+    def test_svgz(self):
+        source = '{ A -> B -> C; }'
+        image = render(source)
+        for options in ({}, {'stream': True}):
+            filename = os.path.join(self.tmpdir.name, 'output.svgz')
+            render(source, filename=filename, **options)
+            with gzip.open(filename) as fd:
+                self.assertEqual(image, fd.read().decode('utf-8'))
+
+    def test_compact(self):
+        source = ('{ A -> B -> C [style = dashed]; A -> D -> E; '
+                  'B -> E [label = "label"]; F [href = "#"]; }')
+        image = render(source, compact=True, code=source)
+        dom = minidom.parseString(image.encode('utf-8'))
+
+        # presentation attributes are replaced by classes
+        styles = dom.getElementsByTagName('style')[0].firstChild.data
+        classes = re.findall(r'\.(\w+){', styles)
+        for elem in dom.getElementsByTagName('*'):
+            self.assertFalse(elem.hasAttribute('stroke'))
+            self.assertFalse(elem.hasAttribute('font-family'))
+            if elem.hasAttribute('class'):
+                self.assertIn(elem.getAttribute('class'), classes)
+        self.assertEqual(len(classes), len(set(classes)))
+        self.assertNotIn('rgb(', styles)
+
+        # segments of edges are merged
+        paths = dom.getElementsByTagName('path')
+        self.assertLess(len(paths), render(source).count('<path'))
+
+        # styles are written at the end (also in streaming mode)
+        streamed = render(source, compact=True, stream=True, code=source)
+        self.assertEqual(image, streamed)
+        self.assertTrue(streamed.endswith('</style>\n</svg>\n'))
+
+    def test_compact_prefixes_class_names(self):
+        source = '{ A -> B; }'
+        image = render(source, compact=True, code=source)
+        classes = re.findall(r'\.(\w+){', image)
+        self.assertTrue(classes)
+        for name in classes:
+            self.assertTrue(name.startswith(classprefix(code=source)))
+
+        # unique to each image if code is not given
+        image1 = render(source, compact=True)
+        image2 = render(source, compact=True)
+        self.assertNotEqual(re.findall(r'\.(\w+){', image1),
+                            re.findall(r'\.(\w+){', image2))
+
+        image = render(source, compact=True, classprefix='diagram1-')
+        self.assertIn('.diagram1-0{', image)
+
+    def test_compact_rounds_numbers(self):
+        compactor = Compactor()
+        self.assertEqual('1.23', compactor.round(1.2345))
+        self.assertEqual('1.5', compactor.round(1.5))
+        self.assertEqual('2', compactor.round(2.0))
+        self.assertEqual(3, compactor.round(3))
+        self.assertEqual('M 1.5 2 L 0.33 4',
+                         compactor.round_numbers('M 1.50 2.0 L 0.333 4'))
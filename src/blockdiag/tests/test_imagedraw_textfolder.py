@@ -14,6 +14,7 @@
 #  limitations under the License.
 
 import sys
+from blockdiag.imagedraw.textfolder import fitting_length
 from blockdiag.imagedraw.textfolder import splitlabel
 from blockdiag.imagedraw.textfolder import splittext
 from blockdiag.imagedraw.textfolder import truncate_text
@@ -36,6 +37,40 @@ class Metrics(object):
         return Size(CHAR_WIDTH * length, CHAR_HEIGHT)
 
 
+class VariableWidthMetrics(object):
+    def textsize(self, text):
+        width = sum(CHAR_WIDTH * 2 if c.isupper() else CHAR_WIDTH
+                    for c in text)
+        return Size(width, CHAR_HEIGHT)
+
+
+def legacy_splittext(metrics, text, bound, measure='width'):
+    folded = []
+    if text == '':
+        folded.append(u(' '))
+
+    for i in range(len(text), 0, -1):
+        textsize = metrics.textsize(text[0:i])
+
+        if getattr(textsize, measure) <= bound:
+            folded.append(text[0:i])
+            if text[i:]:
+                folded += legacy_splittext(metrics, text[i:], bound, measure)
+            break
+
+    return folded
+
+
+def legacy_truncate_text(metrics, text, bound, measure='width'):
+    for i in range(len(text), 0, -1):
+        textsize = metrics.textsize(text[0:i] + ' ...')
+
+        if getattr(textsize, measure) <= bound:
+            return text[0:i] + ' ...'
+
+    return text
+
+
 class TestTextFolder(unittest.TestCase):
     def test_splitlabel(self):
         # single line text
@@ -117,3 +152,25 @@ class TestTextFolder(unittest.TestCase):
         text = "abcdef"
         ret = truncate_text(metrics, text, CHAR_WIDTH * 4)
         self.assertEqual("abcdef", ret)
+
+    def test_fitting_length(self):
+        metrics = Metrics()
+
+        self.assertEqual(3, fitting_length(metrics, "abc", CHAR_WIDTH * 3))
+        self.assertEqual(3, fitting_length(metrics, "abcdef", CHAR_WIDTH * 3))
+        self.assertEqual(2, fitting_length(metrics, "abcdef",
+                                           CHAR_WIDTH * 3 - 1))
+        self.assertEqual(0, fitting_length(metrics, "abcdef", CHAR_WIDTH - 1))
+        self.assertEqual(1, fitting_length(metrics, "abcdef", CHAR_WIDTH * 5,
+                                           suffix=' ...'))
+
+    def test_compatibility_with_legacy_folding(self):
+        metrics = VariableWidthMetrics()
+        texts = ["", "a", "aBc", "aBcDeFgHiJ" * 5, "ABCDEFG" * 3, "ab" * 40]
+
+        for text in texts:
+            for bound in range(0, CHAR_WIDTH * 12, 5):
+                self.assertEqual(legacy_splittext(metrics, text, bound),
+                                 splittext(metrics, text, bound))
+                self.assertEqual(legacy_truncate_text(metrics, text, bound),
+                                 truncate_text(metrics, text, bound))
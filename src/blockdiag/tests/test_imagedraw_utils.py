@@ -13,10 +13,11 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import os
 import sys
 from blockdiag.imagedraw.utils import (
     is_zenkaku, zenkaku_len, hankaku_len,
-    string_width, textsize
+    string_width, textsize, memoize, clear_caches
 )
 from blockdiag.utils.compat import u
 
@@ -75,3 +76,72 @@ class TestUtils(unittest.TestCase):
         # あいう
         font = FontInfo('serif', None, 18)
         self.assertEqual((54, 18), textsize(u("\u3042\u3044\u3046"), font))
+
+
+class TestMemoize(unittest.TestCase):
+    def test_memoize(self):
+        calls = []
+
+        @memoize
+        def func(x, y=None):
+            calls.append(x)
+            return x * 2
+
+        self.assertEqual(2, func(1))
+        self.assertEqual(2, func(1))
+        self.assertEqual(4, func(2))
+        self.assertEqual(2, func(1, y=1))
+        self.assertEqual([1, 2, 1], calls)
+        self.assertEqual((1, 3), (func.cache.hits, func.cache.misses))
+
+    def test_memoize_with_key(self):
+        calls = []
+
+        @memoize(key=lambda obj, x: x, maxsize=2)
+        def func(obj, x):
+            calls.append(x)
+            return x * 2
+
+        self.assertEqual(2, func(object(), 1))
+        self.assertEqual(2, func(object(), 1))  # shared between objects
+        self.assertEqual(4, func(object(), 2))
+        self.assertEqual(6, func(object(), 3))
+        self.assertEqual(2, func(object(), 1))  # discarded by LRU
+        self.assertEqual([1, 2, 3, 1], calls)
+        self.assertEqual(2, len(func.cache))
+
+        clear_caches()
+        self.assertEqual(0, len(func.cache))
+
+    def test_textlinesize(self):
+        from blockdiag.imagedraw.png import ImageDrawEx
+        from blockdiag.utils.fontmap import FontInfo
+        font = FontInfo('serif', None, 11)
+
+        ImageDrawEx.textlinesize.cache.clear()
+        size = ImageDrawEx(None).textlinesize(u("abc"), font)
+        self.assertEqual(size, ImageDrawEx(None).textlinesize(u("abc"), font))
+        self.assertEqual(1, ImageDrawEx.textlinesize.cache.hits)
+        self.assertEqual(1, ImageDrawEx.textlinesize.cache.misses)
+
+    def test_truetype(self):
+        from blockdiag.imagedraw.png import ImageDrawEx, truetype
+        from blockdiag.utils.fontmap import FontInfo
+        fontpath = os.path.join(os.path.dirname(__file__),
+                                'VLGothic', 'VL-Gothic-Regular.ttf')
+        font1 = FontInfo('serif', fontpath, 11)
+        font2 = FontInfo('serif', fontpath, 20)
+
+        truetype.cache.clear()
+        ImageDrawEx.textlinesize.cache.clear()
+
+        drawer = ImageDrawEx(None)
+        for string in (u("abc"), u("def"), u("ghi")):
+            drawer.textlinesize(string, font1)
+            drawer.textlinesize(string, font2)
+
+        # fonts are loaded only once per size
+        self.assertEqual(2, truetype.cache.misses)
+        self.assertIs(truetype(fontpath, None, 11),
+                      truetype(fontpath, None, 11))
+        self.assertEqual(2, truetype.cache.misses)
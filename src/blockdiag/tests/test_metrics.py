@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import sys
+from collections import defaultdict
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.elements import DiagramNode
+from blockdiag.metrics import DiagramMetrics
+from blockdiag.parser import parse_string
+from blockdiag.utils import XY
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+def get_metrics(code):
+    diagram = ScreenNodeBuilder.build(parse_string(code))
+    return DiagramMetrics(diagram)
+
+
+def dummy_node(x, y):
+    node = DiagramNode(None)
+    node.xy = XY(x, y)
+    return node
+
+
+class TestSpreadSheetMetrics(unittest.TestCase):
+    def test_offset(self):
+        sheet = get_metrics("{ A -> B -> C }").spreadsheet
+        sheet.set_node_width(1, 200)
+        sheet.set_span_width(2, 100)
+
+        self.assertEqual(0, sheet.offset('node_width', 0))
+        self.assertEqual(0, sheet.offset('node_width', -1))
+        self.assertEqual(128, sheet.offset('node_width', 1))
+        self.assertEqual(328, sheet.offset('node_width', 2))
+        self.assertEqual(584, sheet.offset('node_width', 4))
+        self.assertEqual(64, sheet.offset('span_width', 1))
+        self.assertEqual(228, sheet.offset('span_width', 3))
+
+        for x in range(10):
+            expected = sum(sheet.node_width[i] for i in range(x))
+            self.assertEqual(expected, sheet.offset('node_width', x))
+
+    def test_offset_invalidation(self):
+        sheet = get_metrics("{ A -> B -> C }").spreadsheet
+        self.assertEqual(192, sheet.offset('span_width', 3))
+        self.assertEqual(120, sheet.offset('node_height', 3))
+
+        sheet.set_span_width(1, 100)
+        self.assertEqual(228, sheet.offset('span_width', 3))
+
+        sheet.add_span_width(2, 10)
+        self.assertEqual(238, sheet.offset('span_width', 3))
+
+        sheet.set_node_height(0, 80)
+        self.assertEqual(160, sheet.offset('node_height', 3))
+
+        sheet.add_span_height(0, 10)
+        self.assertEqual(130, sheet.offset('span_height', 3))
+
+        sheet.node_width = defaultdict(lambda: 10)
+        self.assertEqual(30, sheet.offset('node_width', 3))
+
+    def test_node(self):
+        sheet = get_metrics("{ A -> B -> C }").spreadsheet
+        node = sheet.node(dummy_node(2, 0))
+        self.assertEqual((448, 40, 576, 80), tuple(node.box))
+
+        sheet.set_node_width(0, 256)
+        node = sheet.node(dummy_node(2, 0))
+        self.assertEqual((576, 40, 704, 80), tuple(node.box))
+
+    def test_shift(self):
+        metrics = get_metrics("{ A -> B -> C }")
+        shifted = metrics.shift(10, 20)
+
+        node = shifted.cell(dummy_node(1, 0))
+        self.assertEqual((266, 60, 394, 100), tuple(node.box))
+
+        node = metrics.cell(dummy_node(1, 0))
+        self.assertEqual((256, 40, 384, 80), tuple(node.box))
+
+    def test_shift_after_offsets_computed(self):
+        metrics = get_metrics("{ A -> B -> C }")
+        sheet = metrics.spreadsheet
+        self.assertEqual(256, sheet.offset('node_width', 2))
+        shifted = metrics.shift(10, 20)
+        self.assertEqual(256, shifted.spreadsheet.offset('node_width', 2))
+
+        # sizes are not shared; offsets of both are kept up to date
+        shifted.spreadsheet.set_node_width(0, 256)
+        self.assertEqual(384, shifted.spreadsheet.offset('node_width', 2))
+        self.assertEqual(256, sheet.offset('node_width', 2))
+
+        sheet.set_node_width(1, 200)
+        self.assertEqual(328, sheet.offset('node_width', 2))
+        self.assertEqual(384, shifted.spreadsheet.offset('node_width', 2))
+
+        duplicated = sheet.duplicate(metrics)
+        self.assertEqual(328, duplicated.offset('node_width', 2))
+        duplicated.add_span_width(1, 10)
+        self.assertEqual(202, duplicated.offset('span_width', 3))
+        self.assertEqual(192, sheet.offset('span_width', 3))
+
+
+class TestDiagramMetrics(unittest.TestCase):
+    def test_cached_metrics(self):
+        metrics = get_metrics("{ A -> B; group { C } }")
+        sheet = metrics.spreadsheet
+        node = dummy_node(0, 0)
+
+        self.assertIs(metrics.cell(node), metrics.cell(node))
+        self.assertIsNot(metrics.cell(node),
+                         metrics.cell(node, use_padding=False))
+        self.assertIs(metrics.node(node), metrics.node(node))
+
+        cell = metrics.cell(node)
+        metrics.clear_cache()
+        self.assertIsNot(cell, metrics.cell(node))
+        self.assertEqual(cell.box, metrics.cell(node).box)
+
+        cell = metrics.cell(node)
+        sheet.set_node_width(0, 256)
+        self.assertIsNot(cell, metrics.cell(node))
+        self.assertEqual((128, 40, 256, 80), tuple(metrics.cell(node).box))
+
+    def test_cached_edge_metrics(self):
+        diagram = ScreenNodeBuilder.build(parse_string("{ A -> B -> C }"))
+        metrics = DiagramMetrics(diagram)
+        edge = diagram.edges[0]
+
+        m = metrics.edge(edge)
+        self.assertIs(m, metrics.edge(edge))
+
+        # shaft returns a copy of routing on each access
+        shaft = m.shaft
+        self.assertEqual(shaft.polylines, m.shaft.polylines)
+        shaft.polylines[0].pop()
+        self.assertNotEqual(shaft.polylines, m.shaft.polylines)
+        self.assertEqual([[(192, 60), (248, 60)]], m.shaft.polylines)
+
+    def test_font_for_returns_copy(self):
+        diagram = ScreenNodeBuilder.build(parse_string("{ A -> B }"))
+        metrics = DiagramMetrics(diagram)
+        node = diagram.nodes[0]
+
+        # drawers may shrink the font (ex. PDFImageDraw.textarea)
+        font = metrics.font_for(node)
+        font.size = 1
+        self.assertEqual(11, metrics.font_for(node).size)
+
+    def test_shifted_metrics(self):
+        metrics = get_metrics("{ A -> B -> C }")
+        node = dummy_node(0, 0)
+        cell = metrics.cell(node)
+
+        shifted = metrics.shift(10, 20)
+        self.assertIsNot(cell, shifted.cell(node))
+        self.assertEqual((74, 60, 202, 100), tuple(shifted.cell(node).box))
+        self.assertIs(cell, metrics.cell(node))
+
+
+class TestScaledMetrics(unittest.TestCase):
+    def test_scaled_metrics(self):
+        code = "{ A -> B; C [width = 100, height = 50]; group { D } }"
+        diagram = ScreenNodeBuilder.build(parse_string(code))
+        metrics = DiagramMetrics(diagram)
+        scaled = DiagramMetrics(diagram, scale_ratio=2)
+
+        self.assertIs(metrics, metrics.original_metrics)
+        self.assertIsNot(scaled, scaled.original_metrics)
+        self.assertEqual(1, scaled.original_metrics.scale_ratio)
+
+        self.assertEqual(metrics.cellsize * 2, scaled.cellsize)
+        self.assertEqual(tuple(n * 2 for n in metrics.pagesize(3, 3)),
+                         scaled.pagesize(3, 3))
+        for node in diagram.traverse_nodes():
+            expected = [n * 2 for n in metrics.cell(node).box]
+            self.assertEqual(expected, scaled.cell(node).box)
+
+        for group in diagram.traverse_groups():
+            expected = [n * 2 for n in metrics.group(group).marginbox]
+            self.assertEqual(expected, scaled.group(group).marginbox)
+
+        edge = diagram.edges[0]
+        expected = [[XY(x * 2, y * 2) for x, y in line]
+                    for line in metrics.edge(edge).shaft.polylines]
+        self.assertEqual(expected, scaled.edge(edge).shaft.polylines)
+
+        node = diagram.nodes[0]
+        self.assertEqual(metrics.font_for(node).size * 2,
+                         scaled.font_for(node).size)
+
+    def test_fractional_scale_ratio(self):
+        metrics = get_metrics("{ A -> B }")
+        diagram = ScreenNodeBuilder.build(parse_string("{ A -> B }"))
+        scaled = DiagramMetrics(diagram, scale_ratio=1.5)
+
+        self.assertEqual(12, scaled.cellsize)
+        self.assertEqual(XY(5, 9), scaled.shadow_offset)  # (4.5, 9) rounded
+        self.assertEqual((96, 60, 288, 120),
+                         tuple(scaled.cell(dummy_node(0, 0)).box))
+        self.assertEqual(11, metrics.font_for(diagram.nodes[0]).size)
+        self.assertEqual(17, scaled.font_for(diagram.nodes[0]).size)
+
+    def test_original_ratio(self):
+        diagram = ScreenNodeBuilder.build(parse_string("{ A -> B }"))
+        scaled = DiagramMetrics(diagram, scale_ratio=3, original_ratio=1.5)
+        original = scaled.original_metrics
+
+        self.assertEqual(24, scaled.cellsize)
+        self.assertEqual(12, original.cellsize)
+        self.assertIs(original, original.original_metrics)
+        expected = DiagramMetrics(diagram, scale_ratio=1.5).pagesize(2, 1)
+        self.assertEqual(expected, original.pagesize(2, 1))
+
+    def test_shift_scaled_metrics(self):
+        diagram = ScreenNodeBuilder.build(parse_string("{ A -> B -> C }"))
+        scaled = DiagramMetrics(diagram, scale_ratio=2)
+
+        # shift() takes lengths of original metrics
+        shifted = scaled.shift(10, 20)
+        self.assertEqual((148, 120, 404, 200),
+                         tuple(shifted.cell(dummy_node(0, 0)).box))
+        self.assertEqual((74, 60, 202, 100),
+                         tuple(shifted.original_metrics
+                               .cell(dummy_node(0, 0)).box))
@@ -14,9 +14,18 @@
 #  limitations under the License.
 from __future__ import print_function
 
+import io
+import os
+import re
+import random
 import sys
-from blockdiag.parser import parse_string, ParseException
+from funcparserlib.lexer import make_tokenizer, LexerError
+from blockdiag import parser
+from blockdiag.parser import parse_string, tokenize, ParseException
 from blockdiag.parser import Diagram, Group, Statements, Node, Edge
+from blockdiag.parser import ParseCache
+from blockdiag.tests.utils import TemporaryDirectory
+from blockdiag.utils.compat import u
 
 if sys.version_info < (2, 7):
     import unittest2 as unittest
@@ -159,3 +168,150 @@ class TestParser(unittest.TestCase):
         with self.assertRaises(ParseException):
             code = ""
             parse_string(code)
+
+
+def legacy_tokenize(string):
+    """tokenize() of blockdiag-1.5 (using funcparserlib.lexer)"""
+    specs = [(_type, (pattern,)) for _type, pattern in parser.TOKEN_SPECS]
+    specs[0] = ('Comment', (r'/\*(.|[\r\n])*?\*/', re.MULTILINE))
+    specs[7] = ('String', (r'(?P<quote>"|\').*?(?<!\\)(?P=quote)', re.DOTALL))
+    t = make_tokenizer(specs)
+    return [x for x in t(string) if x.type not in parser.USELESS_TOKENS]
+
+
+class TestTokenizer(unittest.TestCase):
+    def assertTokenize(self, string):
+        def tokens(func):
+            try:
+                return [(t.type, t.value, t.start, t.end)
+                        for t in func(string)]
+            except LexerError as exc:
+                return (exc.place, exc.msg)
+
+        self.assertEqual(tokens(legacy_tokenize), tokens(tokenize))
+
+    def test_tokenize(self):
+        self.assertTokenize('{ A -> B, C [label = "foo", color=red] }')
+        self.assertTokenize('{ A -< B; B >-< C; C <-> D; D -- E; E <- F; }')
+        self.assertTokenize('{ A [label = "\\"quoted\\"", width = -1.5]; }')
+        self.assertTokenize('{\r\n  // comment\r\n  A; # comment\n  B; }')
+        self.assertTokenize('{ /* multi\nline\n comment */ A; }')
+        self.assertTokenize("{ A [label = 'multi\nline']; B; }")
+        self.assertTokenize(u('{ \u3042 -> \u3044 [label = "\u3046"]; }'))
+
+    def test_tokenize_errors(self):
+        self.assertTokenize('{ A -> B; }\n{ A ! B }')
+        self.assertTokenize('{ A [label = "unterminated]; }')
+        self.assertTokenize('{ A ->\n\n  @ }')
+
+        with self.assertRaises(LexerError):
+            tokenize('{ A & B }')
+
+    def test_tokenize_diagrams(self):
+        diagdir = os.path.join(os.path.dirname(__file__), 'diagrams')
+        for name in os.listdir(diagdir):
+            if name.endswith('.diag'):
+                path = os.path.join(diagdir, name)
+                self.assertTokenize(io.open(path, encoding='utf-8-sig').read())
+
+
+class TestFastParser(unittest.TestCase):
+    def assertParse(self, string):
+        def parse(engine):
+            try:
+                return parse_string(string, engine=engine)
+            except ParseException:
+                return ParseException
+
+        self.assertEqual(parse('funcparserlib'), parse('fast'))
+
+    def test_parse(self):
+        self.assertParse('{}')
+        self.assertParse('diagram {}')
+        self.assertParse('blockdiag test { A; }')
+        self.assertParse('{ A -> B, C -> D [label = "foo", folded]; }')
+        self.assertParse('{ A, B, C [color = red]; D = E; F = 1 }')
+        self.assertParse('{ A -< B; B >-< C; C <-> D; D -- E; E <- F }')
+        self.assertParse('{ class emphasis [color = red]; plugin attributes }')
+        self.assertParse('{ group { A; group foo { B -> C } ; }; D }')
+        self.assertParse('{ group -> A; group = foo; class -> B; group }')
+        self.assertParse('{ group { class emphasis [color = red]; } }')
+        self.assertParse('{ A [label] [color = red]; }')
+
+    def test_parse_errors(self):
+        self.assertParse('')
+        self.assertParse('{')
+        self.assertParse('{ A;; }')
+        self.assertParse('{ A -> ; }')
+        self.assertParse('{ A, B = C; }')
+        self.assertParse('{ A [color = ]; }')
+        self.assertParse('{ A [color = red }')
+        self.assertParse('{ group A; }')
+        self.assertParse('{ group { plugin attributes; } }')
+        self.assertParse('{ A; } B')
+        self.assertParse('{ A; };')
+        self.assertParse('diagram A B { }')
+
+        with self.assertRaises(ValueError):
+            parse_string('{ A; }', engine='unknown')
+
+    def test_parse_diagrams(self):
+        diagdir = os.path.join(os.path.dirname(__file__), 'diagrams')
+        for dirpath, _, filenames in os.walk(diagdir):
+            for name in filenames:
+                if name.endswith('.diag'):
+                    path = os.path.join(dirpath, name)
+                    code = io.open(path, encoding='utf-8-sig').read()
+                    self.assertParse(code)
+
+    def test_parse_random_statements(self):
+        tokens = ['A', 'B', 'group', 'class', 'plugin', '"C"', '1',
+                  '->', '<-', '--', '=', ',', ';', '[', ']', '{', '}']
+        rand = random.Random(0)
+        for _ in range(2000):
+            body = [rand.choice(tokens) for _ in range(rand.randint(1, 8))]
+            self.assertParse('{ %s }' % ' '.join(body))
+
+
+class TestParseCache(unittest.TestCase):
+    def tearDown(self):
+        parser.disable_cache()
+
+    def test_parse_string(self):
+        code = "{ A -> B; group { C [color = red, group = foo]; } }"
+        parser.enable_cache()
+        tree1 = parse_string(code)
+        tree2 = parse_string(code)
+
+        self.assertEqual(tree1, tree2)
+        self.assertEqual(1, parser.cache.trees.hits)
+        self.assertEqual(1, parser.cache.trees.misses)
+
+        # cached trees are not affected by modification of the tree
+        tree1.stmts[1].stmts[0].stmts[0].attrs.pop()
+        self.assertNotEqual(tree1, tree2)
+        self.assertEqual(tree2, parse_string(code))
+
+    def test_errors_are_not_cached(self):
+        parser.enable_cache()
+        for _ in range(2):
+            with self.assertRaises(ParseException):
+                parse_string("{ A -> ")
+
+        self.assertEqual(0, len(parser.cache.trees))
+
+    def test_store_to_directory(self):
+        try:
+            tmpdir = TemporaryDirectory()
+            code = "{ A -> B -> C; }"
+
+            tree = ParseCache(directory=tmpdir.name).get(code, parse_string)
+            self.assertEqual(1, len(os.listdir(tmpdir.name)))
+
+            def failed(string):
+                raise AssertionError('should not be called')
+
+            cache = ParseCache(directory=tmpdir.name)
+            self.assertEqual(tree, cache.get(code, failed))
+        finally:
+            tmpdir.clean()
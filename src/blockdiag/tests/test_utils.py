@@ -14,7 +14,7 @@
 #  limitations under the License.
 
 import sys
-from blockdiag.utils import Size, unquote
+from blockdiag.utils import LRUCache, Size, unquote
 
 if sys.version_info < (2, 7):
     import unittest2 as unittest
@@ -57,3 +57,22 @@ class TestUtils(unittest.TestCase):
         self.assertEqual('test', unquote("'test'"))
         self.assertEqual("'half quoted", unquote("'half quoted"))
         self.assertEqual('"half quoted', unquote('"half quoted'))
+
+    def test_lrucache(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(None, cache.get('c'))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+        # 'b' is least recently used item
+        cache.set('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual((0, 0), (cache.hits, cache.misses))
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import io
+import os
+import sys
+import threading
+from PIL import Image
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.parser import parse_string
+from blockdiag.utils import images
+from blockdiag.utils.compat import HTTPError
+from blockdiag.utils.imagecache import ImageCache
+from blockdiag.tests.utils import TemporaryDirectory
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+if sys.version_info[0] == 2:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class ImageServer(HTTPServer):
+    """Local HTTP server serving images with ETag (stand-in of web)"""
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), ImageRequestHandler)
+        self.contents = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], path)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path,
+                                    self.headers.get('If-None-Match')))
+
+        if self.path not in server.contents:
+            self.send_error(404)
+            return
+
+        content = server.contents[self.path]
+        etag = '"%d"' % hash(content)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(content)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.cachedir = os.path.join(self.tmpdir.name, 'cache')
+        self.server = ImageServer()
+        self.server.contents['/a.png'] = b'image A' * 100
+        self.server.contents['/b.png'] = b'image B' * 100
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmpdir.clean()
+
+    def test_fetch(self):
+        cache = ImageCache(self.cachedir)
+        url = self.server.url('/a.png')
+        path = cache.fetch(url)
+        with io.open(path, 'rb') as fd:
+            self.assertEqual(b'image A' * 100, fd.read())
+        self.assertEqual(dict(hits=0, misses=1, revalidated=0), cache.stats())
+
+        # cached (within ttl); no requests are sent
+        self.assertEqual(path, cache.fetch(url))
+        self.assertEqual(dict(hits=1, misses=1, revalidated=0), cache.stats())
+        self.assertEqual(1, len(self.server.requests))
+
+        # shared between instances (and processes)
+        cache = ImageCache(self.cachedir)
+        self.assertEqual(path, cache.fetch(url))
+        self.assertEqual(dict(hits=1, misses=0, revalidated=0), cache.stats())
+
+    def test_fetch_revalidates_expired_images(self):
+        cache = ImageCache(self.cachedir, ttl=0)
+        url = self.server.url('/a.png')
+        cache.fetch(url)
+
+        # not modified (304)
+        path = cache.fetch(url)
+        self.assertEqual(dict(hits=0, misses=1, revalidated=1), cache.stats())
+        self.assertIsNotNone(self.server.requests[-1][1])  # If-None-Match
+        with io.open(path, 'rb') as fd:
+            self.assertEqual(b'image A' * 100, fd.read())
+
+        # modified
+        self.server.contents['/a.png'] = b'new image A'
+        path = cache.fetch(url)
+        self.assertEqual(dict(hits=0, misses=2, revalidated=1), cache.stats())
+        with io.open(path, 'rb') as fd:
+            self.assertEqual(b'new image A', fd.read())
+
+    def test_fetch_not_found(self):
+        cache = ImageCache(self.cachedir)
+        with self.assertRaises(HTTPError):
+            cache.fetch(self.server.url('/unknown.png'))
+        self.assertEqual([], os.listdir(self.cachedir))
+
+    def test_evict(self):
+        cache = ImageCache(self.cachedir, maxsize=1000)
+        path_a = cache.fetch(self.server.url('/a.png'))
+        os.utime(path_a, (0, 0))  # least recently used
+        path_b = cache.fetch(self.server.url('/b.png'))
+
+        self.assertFalse(os.path.exists(path_a))
+        self.assertFalse(os.path.exists(path_a + '.json'))
+        self.assertTrue(os.path.exists(path_b))
+        self.assertTrue(os.path.exists(path_b + '.json'))
+
+    def test_evict_does_not_scan_on_every_fetch(self):
+        cache = ImageCache(self.cachedir, maxsize=2000, ttl=0)
+        scans = []
+        evict = cache.evict
+        cache.evict = lambda: scans.append(1) or evict()
+
+        cache.fetch(self.server.url('/a.png'))
+        self.assertEqual(1, len(scans))  # only at the first fetch
+        self.assertEqual(700, cache.total)
+
+        cache.fetch(self.server.url('/a.png'))  # revalidated
+        cache.fetch(self.server.url('/b.png'))
+        self.assertEqual(1, len(scans))
+        self.assertEqual(1400, cache.total)
+
+        # over maxsize; evicted under 90% of maxsize
+        self.server.contents['/c.png'] = b'image C' * 100
+        cache.fetch(self.server.url('/c.png'))
+        self.assertEqual(2, len(scans))
+        self.assertEqual(1400, cache.total)
+
+    def test_clear(self):
+        cache = ImageCache(self.cachedir)
+        cache.fetch(self.server.url('/a.png'))
+        cache.clear()
+        self.assertEqual([], os.listdir(self.cachedir))
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.server = ImageServer()
+        for i in range(10):
+            content = ('image %d' % i).encode('utf-8')
+            self.server.contents['/%d.png' % i] = content
+
+    def tearDown(self):
+        images.disable_cache()
+        images.cleanup()
+        self.server.stop()
+        self.tmpdir.clean()
+
+    def test_prefetch(self):
+        urls = [self.server.url('/%d.png' % i) for i in range(10)]
+        images.prefetch(urls + urls + ['/path/to/local.png'])
+
+        self.assertEqual(set(urls), set(images.urlopen_cache))
+        self.assertEqual(10, len(self.server.requests))
+        for i, url in enumerate(urls):
+            with images.urlopen(url) as fd:
+                self.assertEqual(('image %d' % i).encode('utf-8'), fd.read())
+        self.assertEqual(10, len(self.server.requests))
+
+    def test_prefetch_ignores_errors(self):
+        urls = [self.server.url('/0.png'), self.server.url('/unknown.png')]
+        images.prefetch(urls)
+        self.assertEqual(set(urls[:1]), set(images.urlopen_cache))
+
+    def test_prefetch_records_failures(self):
+        url = self.server.url('/unknown.png')
+        images.prefetch([url, self.server.url('/0.png')])
+        self.assertIn(url, images.urlopen_failures)
+        self.assertEqual(2, len(self.server.requests))
+
+        # failed URLs are not requested again during the render
+        images.prefetch([url])
+        with self.assertRaises(HTTPError):
+            images.urlopen(url)
+        self.assertEqual(2, len(self.server.requests))
+
+        images.cleanup()
+        self.assertEqual({}, images.urlopen_failures)
+
+    def test_prefetch_retries_failures_after_ttl(self):
+        url = self.server.url('/0.png')
+        del self.server.contents['/0.png']
+        images.prefetch([url])
+        self.assertIn(url, images.urlopen_failures)
+
+        # recovered; retried after FAILURE_TTL
+        self.server.contents['/0.png'] = b'image 0'
+        images.prefetch([url])
+        self.assertEqual(1, len(self.server.requests))
+
+        exc, failed_at = images.urlopen_failures[url]
+        failed_at -= images.FAILURE_TTL
+        images.urlopen_failures[url] = (exc, failed_at)
+        images.prefetch([url])
+        self.assertEqual(2, len(self.server.requests))
+        self.assertNotIn(url, images.urlopen_failures)
+        self.assertIn(url, images.urlopen_cache)
+
+    def test_prefetch_with_cache(self):
+        images.enable_cache(os.path.join(self.tmpdir.name, 'cache'))
+        urls = [self.server.url('/%d.png' % i) for i in range(10)]
+        images.prefetch(urls)
+        self.assertEqual(10, images.cache.misses)
+
+        # next process (urlopen_cache is cleared)
+        images.cleanup()
+        images.prefetch(urls)
+        self.assertEqual(10, images.cache.hits)
+        self.assertEqual(10, len(self.server.requests))
+
+    def test_decodes_images_refetched_after_ttl(self):
+        def png(size):
+            stream = io.BytesIO()
+            Image.new('RGB', size).save(stream, 'PNG')
+            return stream.getvalue()
+
+        images.enable_cache(os.path.join(self.tmpdir.name, 'cache'), ttl=0)
+        url = self.server.url('/icon.png')
+        self.server.contents['/icon.png'] = png((16, 16))
+        self.assertEqual((16, 16), images.load(url).size)
+        images.cleanup()  # end of render
+
+        self.server.contents['/icon.png'] = png((32, 32))
+        self.assertEqual((32, 32), images.load(url).size)
+        self.assertEqual(2, images.cache.misses)
+
+    def test_builder_prefetches_images(self):
+        source = ('{ A [icon = "%s"]; B [background = "%s"]; '
+                  '  C [icon = "%s"]; }' %
+                  (self.server.url('/0.png'), self.server.url('/1.png'),
+                   self.server.url('/0.png')))
+        ScreenNodeBuilder.build(parse_string(source))
+        self.assertEqual(set([self.server.url('/0.png'),
+                              self.server.url('/1.png')]),
+                         set(images.urlopen_cache))
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import io
+import os
+import re
+import shutil
+import sys
+from base64 import b64decode
+from PIL import Image
+from blockdiag import drawer
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.parser import parse_string
+from blockdiag.utils import images
+from blockdiag.utils.images import DecodedImageCache
+from blockdiag.tests.utils import TemporaryDirectory
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+DIAGRAMS = os.path.join(os.path.dirname(__file__), 'diagrams')
+LOGO = os.path.join(DIAGRAMS, 'debian-logo-256color-palettealpha.png')
+WHITE = os.path.join(DIAGRAMS, 'white.gif')
+
+
+class TestDecodedImageCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+
+    def tearDown(self):
+        images.cleanup()
+        self.tmpdir.clean()
+
+    def test_get(self):
+        cache = DecodedImageCache()
+        entry = cache.get(LOGO)
+        self.assertEqual(entry.image.size, entry.size)
+        self.assertIs(entry, cache.get(LOGO))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+        self.assertIsNot(entry, cache.get(WHITE))
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+
+    def test_get_modified_file(self):
+        path = os.path.join(self.tmpdir.name, 'logo.png')
+        shutil.copy(LOGO, path)
+        os.utime(path, (0, 0))
+
+        cache = DecodedImageCache()
+        entry = cache.get(path)
+        os.utime(path, None)
+        self.assertIsNot(entry, cache.get(path))
+
+    def test_get_unknown_file(self):
+        cache = DecodedImageCache()
+        with self.assertRaises(IOError):
+            cache.get(os.path.join(self.tmpdir.name, 'unknown.png'))
+        self.assertEqual(0, len(cache))
+
+    def test_resize(self):
+        entry = DecodedImageCache().get(LOGO)
+        width, height = entry.size
+
+        image = entry.resize((width // 2, height))
+        self.assertEqual(width // 2, image.size[0])
+        self.assertIs(image, entry.resize((width // 2, height)))
+        self.assertEqual((width, height), entry.image.size)  # not modified
+
+        # not enlarged
+        self.assertIs(entry.image, entry.resize((width * 2, height * 2)))
+
+    def test_data_uri(self):
+        entry = DecodedImageCache().get(WHITE)
+        datauri = entry.data_uri()
+        self.assertTrue(datauri.startswith('data:;base64,'))
+        self.assertIs(datauri, entry.data_uri())
+
+        data = b64decode(datauri[len('data:;base64,'):])
+        self.assertEqual(b'\x89PNG', data[:4])
+
+    def test_evict(self):
+        cache = DecodedImageCache(maxsize=1)
+        cache.get(LOGO)
+        cache.get(WHITE)
+        self.assertEqual(1, len(cache))  # the latest one is kept
+        self.assertIs(cache.get(WHITE), cache.get(WHITE))
+
+        # total size is counted on insert, resize and data_uri
+        cache = DecodedImageCache()
+        entry = cache.get(LOGO)
+        nbytes = entry.nbytes
+        self.assertEqual(nbytes, cache.total)
+        entry.resize((entry.size[0] // 2, entry.size[1] // 2))
+        self.assertLess(nbytes, entry.nbytes)
+        entry.data_uri()
+        self.assertEqual(entry.nbytes, cache.total)
+
+        cache.maxsize = entry.nbytes
+        white = cache.get(WHITE)
+        self.assertEqual(1, len(cache))
+        self.assertEqual(white.nbytes, cache.total)
+        self.assertIsNone(entry.cache)  # discarded
+
+        # discarded entries are not counted
+        entry.resize((entry.size[0] // 3, entry.size[1] // 3))
+        self.assertEqual(white.nbytes, cache.total)
+
+    def test_get_closes_file(self):
+        fd, path = self.tmpdir.mkstemp()
+        os.close(fd)
+        shutil.copy(LOGO, path)
+
+        opened = []
+        orig_open = io.open
+
+        def fake_open(*args, **kwargs):
+            stream = orig_open(*args, **kwargs)
+            opened.append(stream)
+            return stream
+
+        try:
+            images.io.open = fake_open
+            DecodedImageCache().get(path)
+        finally:
+            images.io.open = orig_open
+
+        self.assertEqual(1, len(opened))
+        self.assertTrue(opened[0].closed)
+
+    def test_load_does_not_cache_image_objects(self):
+        image = images.load(LOGO).image
+        entry = images.load(image)
+        self.assertIs(image, entry.image)
+        self.assertIsNone(entry.cache)
+
+    def test_shared_icons(self):
+        lines = ['{']
+        for i in range(30):
+            icon = (LOGO, WHITE)[i % 2]
+            lines.append('  N%d [icon = "%s", background = "%s"];' %
+                         (i, icon, WHITE))
+        lines.append('}')
+        diagram = ScreenNodeBuilder.build(parse_string('\n'.join(lines)))
+
+        images.decoded_cache.clear()
+        for _format in ('PNG', 'SVG'):
+            filename = os.path.join(self.tmpdir.name, 'output')
+            draw = drawer.DiagramDraw(_format, diagram, filename)
+            draw.draw()
+            draw.save()
+
+        self.assertEqual(2, images.decoded_cache.misses)
+
+    def test_cleanup_keeps_decoded_images(self):
+        images.decoded_cache.clear()
+        entry = images.load(LOGO)
+
+        fd, path = self.tmpdir.mkstemp()
+        os.close(fd)
+        images.urlopen_cache['http://example.com/logo.png'] = path
+
+        images.cleanup()
+        self.assertFalse(os.path.exists(path))  # temporary files are removed
+        self.assertEqual({}, images.urlopen_cache)
+        self.assertIs(entry, images.load(LOGO))  # reused by next render
+        self.assertEqual(1, images.decoded_cache.hits)
+
+    def test_svg_embeds_bmp_icons(self):
+        icon = os.path.join(self.tmpdir.name, 'icon.bmp')
+        Image.new('RGB', (32, 32), (255, 0, 0)).save(icon)
+
+        source = '{ A [icon = "%s"]; }' % icon
+        diagram = ScreenNodeBuilder.build(parse_string(source))
+        draw = drawer.DiagramDraw('SVG', diagram, None)
+        draw.draw()
+        svg = draw.save()
+
+        href = re.search(' xlink:href="data:;base64,([^"]*)"', svg).group(1)
+        image = Image.open(io.BytesIO(b64decode(href)))
+        self.assertEqual('PNG', image.format)
+        self.assertEqual((32, 32), image.size)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import sys
+from blockdiag.parser import parse_string
+from blockdiag.utils.fontmap import FontMap
+from blockdiag.utils.rendercache import (RenderCache, CACHE_DIR_ENV,
+                                         referenced_images)
+from blockdiag.tests.utils import TemporaryDirectory
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.cachedir = os.path.join(self.tmpdir.name, 'cache')
+
+    def tearDown(self):
+        self.tmpdir.clean()
+
+    def test_key(self):
+        key = RenderCache.key('A -> B', type='PNG', antialias=False)
+        self.assertEqual(key, RenderCache.key('A -> B', antialias=False,
+                                              type='PNG'))
+        self.assertNotEqual(key, RenderCache.key('A -> C', type='PNG',
+                                                 antialias=False))
+        self.assertNotEqual(key, RenderCache.key('A -> B', type='PNG',
+                                                 antialias=True))
+
+    def test_key_with_fonts(self):
+        fd, fontpath = self.tmpdir.mkstemp()
+        os.write(fd, b'font data')
+        os.close(fd)
+
+        fontmap = FontMap()
+        fontmap.set_default_font(fontpath)
+        key = RenderCache.key('A -> B', fontmap)
+        self.assertEqual(key, RenderCache.key('A -> B', fontmap))
+        self.assertNotEqual(key, RenderCache.key('A -> B'))
+
+        # content of font file changed
+        with open(fontpath, 'wb') as fd:
+            fd.write(b'another font data')
+        os.utime(fontpath, (0, 0))
+        self.assertNotEqual(key, RenderCache.key('A -> B', fontmap))
+
+    def test_store_and_fetch(self):
+        cache = RenderCache(self.cachedir)
+        filename = os.path.join(self.tmpdir.name, 'output.svg')
+
+        self.assertFalse(cache.fetch('key', 'SVG', filename))
+        self.assertEqual(None, cache.read('key', 'SVG'))
+        self.assertFalse(os.path.exists(filename))
+
+        cache.store('key', 'SVG', content='<svg />')
+        self.assertTrue(cache.fetch('key', 'SVG', filename))
+        self.assertEqual(b'<svg />', open(filename, 'rb').read())
+        self.assertEqual(b'<svg />', cache.read('key', 'SVG'))
+        self.assertEqual(None, cache.read('key', 'PNG'))
+        self.assertEqual(dict(hits=2, misses=3), cache.stats())
+        self.assertEqual(['key.svg'], os.listdir(self.cachedir))
+
+    def test_key_with_images(self):
+        fd, imagepath = self.tmpdir.mkstemp()
+        os.write(fd, b'image data')
+        os.close(fd)
+
+        key = RenderCache.key('A -> B', images=[imagepath])
+        self.assertEqual(key, RenderCache.key('A -> B', images=[imagepath]))
+        self.assertNotEqual(key, RenderCache.key('A -> B'))
+
+        # remote images and unknown files do not affect to the key
+        images = ['http://example.com/icon.png', '/path/to/unknown.png']
+        self.assertEqual(RenderCache.key('A -> B'),
+                         RenderCache.key('A -> B', images=images))
+
+        # content of image file changed
+        with open(imagepath, 'wb') as fd:
+            fd.write(b'another image data')
+        os.utime(imagepath, (0, 0))
+        self.assertNotEqual(key, RenderCache.key('A -> B',
+                                                 images=[imagepath]))
+
+    def test_referenced_images(self):
+        tree = parse_string('{ A [icon = "a.png", background = b.png];'
+                            '  group { B [icon = "c.png"]; }'
+                            '  C -> D [label = "icon"]; }')
+        self.assertEqual(['a.png', 'b.png', 'c.png'],
+                         sorted(referenced_images(tree)))
+
+    def test_eviction(self):
+        cache = RenderCache(self.cachedir, maxsize=25)
+        cache.store('key1', 'png', content=b'0123456789')
+        os.utime(cache.path('key1', 'png'), (1, 1))
+        cache.store('key2', 'png', content=b'0123456789')
+        os.utime(cache.path('key2', 'png'), (2, 2))
+
+        # key1 is used recently; key2 will be evicted
+        self.assertTrue(cache.get('key1', 'png'))
+        cache.store('key3', 'png', content=b'0123456789')
+        self.assertEqual(['key1.png', 'key3.png'],
+                         sorted(os.listdir(self.cachedir)))
+
+    def test_eviction_does_not_scan_on_every_store(self):
+        cache = RenderCache(self.cachedir, maxsize=100)
+        scans = []
+        evict = cache.evict
+        cache.evict = lambda: scans.append(1) or evict()
+
+        for i in range(10):
+            cache.store('key%d' % i, 'png', content=b'0123456789')
+        self.assertEqual(1, len(scans))  # only at the first store
+        self.assertEqual(100, cache.total)
+
+        # over maxsize; evicted under 90% of maxsize
+        cache.store('key10', 'png', content=b'0123456789')
+        self.assertEqual(2, len(scans))
+        self.assertEqual(90, cache.total)
+        self.assertEqual(9, len(os.listdir(self.cachedir)))
+
+    def test_from_environ(self):
+        environ = dict(os.environ)
+        try:
+            os.environ.pop(CACHE_DIR_ENV, None)
+            self.assertEqual(None, RenderCache.from_environ())
+
+            cache = RenderCache.from_environ(self.cachedir)
+            self.assertEqual(self.cachedir, cache.directory)
+
+            os.environ[CACHE_DIR_ENV] = self.cachedir
+            cache = RenderCache.from_environ()
+            self.assertEqual(self.cachedir, cache.directory)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
@@ -20,8 +20,9 @@ import sys
 import functools
 from shutil import rmtree
 from tempfile import mkdtemp, mkstemp
+from blockdiag import drawer
 from blockdiag.builder import ScreenNodeBuilder
-from blockdiag.parser import parse_file
+from blockdiag.parser import parse_file, parse_string
 
 if sys.version_info < (2, 7):
     import unittest2 as unittest
@@ -92,6 +93,14 @@ def capture_stderr(func):
 stderr_wrapper = capture_stderr   # FIXME: deprecated
 
 
+def render(source, _format='SVG', filename=None, size=None, context=None,
+           **kwargs):
+    diagram = ScreenNodeBuilder.build(parse_string(source), context=context)
+    draw = drawer.DiagramDraw(_format, diagram, filename, **kwargs)
+    draw.draw()
+    return draw.save(size)
+
+
 class TemporaryDirectory(object):
     def __init__(self, suffix='', prefix='tmp', dir=None):
         self.name = mkdtemp(suffix, prefix, dir)
@@ -16,6 +16,12 @@
 from __future__ import division
 import re
 import math
+import threading
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict  # for Python2.6
 
 
 class XY(tuple):
@@ -185,3 +191,44 @@ def is_Pillow_available():
         return True
     except ImportError:
         return False
+
+
+class LRUCache(object):
+    """Bounded mapping which discards least recently used items"""
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.items[key] = value  # mark as most recently used
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = value
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.hits = 0
+            self.misses = 0
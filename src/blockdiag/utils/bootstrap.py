@@ -13,23 +13,44 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import copy
 import os
 import re
 import sys
+import time
 import traceback
+from collections import namedtuple
+from functools import partial
+from hashlib import sha1
 from optparse import OptionParser, SUPPRESS_HELP
 from blockdiag import imagedraw
+from blockdiag import noderenderer
 from blockdiag import plugins
 from blockdiag.utils import images
-from blockdiag.utils.compat import codecs
+from blockdiag.utils.compat import codecs, string_types
 from blockdiag.utils.config import ConfigParser
 from blockdiag.utils.fontmap import parse_fontpath, FontMap
+from blockdiag.utils.imagecache import IMAGE_CACHE_DIR_ENV
 from blockdiag.utils.logging import warning, error
+from blockdiag.utils.rendercache import (RenderCache, CACHE_DIR_ENV,
+                                         DEFAULT_MAXSIZE, referenced_images)
+
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+BatchResult = namedtuple('BatchResult',
+                         'input output status elapsed error cached')
+
+# interval of polling on --watch option (in seconds)
+WATCH_INTERVAL = 1.0
 
 
 class Application(object):
     module = None
     options = None
+    rendercache = None
 
     def __init__(self):
         self.cleanup_handlers = []
@@ -48,6 +69,13 @@ class Application(object):
         try:
             self.parse_options(args)
             self.create_fontmap()
+            self.create_rendercache()
+            self.create_imagecache()
+            if self.options.watch:
+                return self.run_watch()
+            elif self.options.batch:
+                return self.run_batch()
+
             self.setup()
 
             parsed = self.parse_diagram()
@@ -66,12 +94,203 @@ class Application(object):
         finally:
             self.cleanup()
 
+    def run_batch(self):
+        inputs = self.options.inputs
+        if self.options.jobs > 1:
+            results = self.render_parallel(inputs, self.options.jobs)
+        else:
+            results = self.render_batch(inputs)
+
+        failures = 0
+        hits = 0
+        for result in results:
+            self.report(result)
+            if result.status != 0:
+                failures += 1
+            elif result.cached:
+                hits += 1
+
+        if self.rendercache:
+            sys.stdout.write("render cache: %d hits, %d misses\n" %
+                             (hits, len(inputs) - failures - hits))
+
+        if failures:
+            error("%d of %d diagrams failed", failures, len(inputs))
+            return -1
+        else:
+            return 0
+
+    def run_watch(self):
+        sys.stdout.write("watching %s ... (press Ctrl+C to quit)\n" %
+                         self.options.watch)
+        try:
+            for results in self.watch(self.options.watch):
+                for result in results:
+                    self.report(result)
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+
+        return 0
+
+    def report(self, result):
+        if result.status != 0:
+            error("%s: %s", result.input, result.error)
+        elif result.cached:
+            sys.stdout.write("%s -> %s (cached)\n" %
+                             (result.input, result.output))
+        else:
+            sys.stdout.write("%s -> %s (%.3f sec)\n" %
+                             (result.input, result.output, result.elapsed))
+
+    def watch(self, directory, interval=WATCH_INTERVAL):
+        """Poll diagrams (*.diag) in directory and render modified ones.
+
+        Yields a list of BatchResult on each poll (empty if nothing was
+        modified).  Diagrams are re-rendered only when their content is
+        changed; fontmap, noderenderers and imagedrawers are kept loaded.
+        """
+        stamps = {}
+        digests = {}
+        while True:
+            modified = []
+            for path in find_diagrams(directory):
+                try:
+                    stamp = file_stamp(path)
+                    if stamps.get(path) == stamp:
+                        continue
+
+                    with codecs.open(path, 'r', 'utf-8-sig') as fp:
+                        code = fp.read()
+                except (IOError, OSError):  # removed while polling
+                    continue
+                except ValueError as exc:  # not UTF-8 (or being saved)
+                    stamps[path] = stamp
+                    digests.pop(path, None)
+                    modified.append((path, None, exc))
+                    continue
+
+                stamps[path] = stamp
+                digest = sha1(code.encode('utf-8')).hexdigest()
+                if digests.get(path) != digest:
+                    digests[path] = digest
+                    modified.append((path, code, None))
+
+            for path in list(stamps):
+                if not os.path.exists(path):
+                    stamps.pop(path)
+                    digests.pop(path, None)
+
+            results = []
+            for path, code, exc in modified:
+                output = output_filename(path, self.options.type,
+                                         self.options.output)
+                if exc is None:
+                    results.append(self.render_item(path, output, code))
+                else:
+                    results.append(BatchResult(path, output, -1, 0,
+                                               "%s" % exc, False))
+
+            yield results
+            time.sleep(interval)
+
+    def render_parallel(self, inputs, jobs):
+        """Render diagrams in worker processes; yields BatchResult for each
+        input in order of inputs (see also render_batch()).
+        """
+        initargs = (self.__class__, self.options, self.fontmap)
+        if sys.version_info < (3, 7):
+            # initializer is not supported; workers are set up lazily
+            executor = futures.ProcessPoolExecutor(jobs)
+        else:
+            executor = futures.ProcessPoolExecutor(jobs,
+                                                   initializer=init_worker,
+                                                   initargs=initargs)
+
+        with executor:
+            render = partial(render_in_worker, *initargs)
+            for result in executor.map(render, inputs):
+                yield result
+
+    def render_batch(self, inputs):
+        """Render diagrams one by one; yields BatchResult for each input.
+
+        Each item of inputs is a filename or a pair of diagram source
+        and output filename.  Options, fontmap, noderenderers and
+        imagedrawers are shared by all diagrams.
+        """
+        for item in inputs:
+            if isinstance(item, string_types):
+                code = None
+                inputfile = item
+                outdir = self.options.output
+                output = output_filename(item, self.options.type, outdir)
+            else:
+                code, output = item
+                inputfile = '<string>'
+
+            yield self.render_item(inputfile, output, code)
+
+    def render_item(self, inputfile, output, code=None):
+        """Render a diagram like render(); returns BatchResult"""
+        started = time.time()
+        hits = self.rendercache and self.rendercache.hits
+        try:
+            self.render(inputfile, output, code)
+            status, message = 0, None
+        except UnicodeEncodeError:
+            status = -1
+            message = "UnicodeEncodeError caught (check your font settings)"
+        except Exception as exc:
+            if self.options.debug:
+                traceback.print_exc()
+
+            status, message = -1, "%s" % exc
+
+        cached = bool(self.rendercache and self.rendercache.hits != hits)
+        return BatchResult(inputfile, output, status,
+                           time.time() - started, message, cached)
+
+    def render(self, inputfile, output, code=None):
+        """Render a diagram with options of the application.
+
+        The diagram is read from inputfile, or parsed from code if given.
+        Plugins and images loaded by the diagram are cleaned up after
+        rendering.
+        """
+        options = self.options
+        try:
+            self.options = copy.copy(options)
+            self.options.input = inputfile
+            self.options.output = output
+            self.setup()
+
+            if code is None:
+                parsed = self.parse_diagram()
+            else:
+                self.code = code
+                parsed = self.module.parser.parse_string(code)
+
+            return self.build_diagram(parsed)
+        finally:
+            self.cleanup()
+            self.options = options
+
     def parse_options(self, args):
         self.options = Options(self.module).parse(args)
 
     def create_fontmap(self):
         self.fontmap = create_fontmap(self.options)
 
+    def create_rendercache(self):
+        self.rendercache = create_rendercache(self.options)
+
+    def create_imagecache(self):
+        directory = (self.options.image_cache_dir or
+                     os.environ.get(IMAGE_CACHE_DIR_ENV))
+        if directory:
+            images.enable_cache(directory)
+
     def setup(self):
         images.setup(self)
         plugins.setup(self)
@@ -86,7 +305,33 @@ class Application(object):
 
         return self.module.parser.parse_string(self.code)
 
+    def cache_key(self, tree=None):
+        """Returns a key of the diagram in render cache"""
+        if tree is None:
+            images = None
+        else:
+            images = referenced_images(tree)
+
+        return RenderCache.key(self.code, self.fontmap, images=images,
+                               module=self.module.__name__,
+                               version=self.module.__version__,
+                               type=self.options.type,
+                               antialias=self.options.antialias,
+                               nodoctype=self.options.nodoctype,
+                               compact=self.options.compact,
+                               transparency=self.options.transparency,
+                               size=self.options.size,
+                               scale=self.options.scale,
+                               tile_size=self.options.tile_size,
+                               svgz=is_svgz(self.options.output))
+
     def build_diagram(self, tree):
+        if self.rendercache:
+            key = self.cache_key(tree)
+            if self.rendercache.fetch(key, self.options.type,
+                                      self.options.output):
+                return 0
+
         ScreenNodeBuilder = self.module.builder.ScreenNodeBuilder
         try:
             diagram = ScreenNodeBuilder.build(tree, self.options)
@@ -98,7 +343,11 @@ class Application(object):
                              self.options.output, fontmap=self.fontmap,
                              code=self.code, antialias=self.options.antialias,
                              nodoctype=self.options.nodoctype,
-                             transparency=self.options.transparency)
+                             compact=self.options.compact,
+                             transparency=self.options.transparency,
+                             scale=self.options.scale,
+                             tile_size=self.options.tile_size,
+                             stream=True)
         drawer.draw()
 
         if self.options.size:
@@ -106,6 +355,9 @@ class Application(object):
         else:
             drawer.save()
 
+        if self.rendercache:
+            self.rendercache.store(key, self.options.type, self.options.output)
+
         return 0
 
     def cleanup(self):
@@ -132,49 +384,105 @@ class Options(object):
 
     def build_parser(self):
         version = "%%prog %s" % self.module.__version__
-        usage = "usage: %prog [options] infile"
+        usage = ("usage: %prog [options] infile\n"
+                 "       %prog [options] --batch infile ...\n"
+                 "       %prog [options] --watch DIR")
         self.parser = p = OptionParser(usage=usage, version=version)
         p.add_option('-a', '--antialias', action='store_true',
                      help='Pass diagram image to anti-alias filter')
+        p.add_option('--batch', action='store_true',
+                     help='Render multiple diagrams in one process')
+        p.add_option('--cache-dir', dest='cache_dir',
+                     help='Cache rendered diagrams to DIR '
+                          '(default: $%s)' % CACHE_DIR_ENV, metavar='DIR')
+        p.add_option('--cache-size', dest='cache_size', type='int',
+                     default=DEFAULT_MAXSIZE // (1024 * 1024),
+                     help='Limit size of render cache to SIZE MB '
+                          '(default: %default)', metavar='SIZE')
+        p.add_option('--compact', action='store_true',
+                     help='Output compact images using shared styles '
+                          '(SVG only)')
         p.add_option('-c', '--config',
                      help='read configurations from FILE', metavar='FILE')
         p.add_option('--debug', action='store_true',
                      help='Enable debug mode')
         p.add_option('-o', dest='output',
                      help='write diagram to FILE', metavar='FILE')
+        p.add_option('-j', '--jobs', type='int',
+                     help='Render multiple diagrams in N processes '
+                          '(implies --batch)', metavar='N')
         p.add_option('-f', '--font', default=[], action='append',
                      help='use FONT to draw diagram', metavar='FONT')
         p.add_option('--fontmap',
                      help='use FONTMAP file to draw diagram', metavar='FONT')
+        p.add_option('--image-cache-dir', dest='image_cache_dir',
+                     help='Cache remote images (icons and backgrounds) to '
+                          'DIR (default: $%s)' % IMAGE_CACHE_DIR_ENV,
+                     metavar='DIR')
         p.add_option('--ignore-pil', dest='ignore_pil',
                      default=False, action='store_true', help=SUPPRESS_HELP)
         p.add_option('--no-transparency', dest='transparency',
                      default=True, action='store_false',
                      help='do not make transparent background of diagram ' +
                           '(PNG only)')
+        p.add_option('--scale', type='float',
+                     help='Scale diagram by RATIO without resampling '
+                          '(ex. 1.5 for high-DPI displays)', metavar='RATIO')
         p.add_option('--size',
                      help='Size of diagram (ex. 320x240)')
+        p.add_option('--tile-size', dest='tile_size', type='int',
+                     help='Render image in tiles of SIZE pixels to bound '
+                          'memory usage (PNG only)', metavar='SIZE')
         p.add_option('-T', dest='type', default='PNG',
                      help='Output diagram as TYPE format')
         p.add_option('--nodoctype', action='store_true',
                      help='Do not output doctype definition tags (SVG only)')
+        p.add_option('--watch', metavar='DIR',
+                     help='Watch diagrams in DIR and render modified ones')
 
         return p
 
     def validate(self):
-        if len(self.args) == 0:
+        if self.options.watch:
+            self.options.input = None
+        elif len(self.args) == 0:
             self.parser.print_help()
             sys.exit(0)
+        else:
+            self.options.input = self.args.pop(0)
+
+        if self.options.jobs is not None:
+            self.options.batch = True
+            if self.options.jobs < 1:
+                msg = "-j option must be a positive number."
+                raise RuntimeError(msg)
+            elif self.options.jobs > 1 and futures is None:
+                msg = "could not run parallel jobs; Install futures."
+                raise RuntimeError(msg)
+        else:
+            self.options.jobs = 1
 
-        self.options.input = self.args.pop(0)
-        if self.options.output:
+        if self.options.watch:
+            if not os.path.isdir(self.options.watch):
+                msg = "--watch option must be a directory."
+                raise RuntimeError(msg)
+            elif (self.options.output and
+                  not os.path.isdir(self.options.output)):
+                msg = "-o option must be a directory with --watch option."
+                raise RuntimeError(msg)
+        elif self.options.batch:
+            self.options.inputs = [self.options.input] + self.args
+            if (self.options.output and
+               not os.path.isdir(self.options.output)):
+                msg = "-o option must be a directory with --batch option."
+                raise RuntimeError(msg)
+        elif self.options.output:
             pass
         elif self.options.output == '-':
             self.options.output = 'output.' + self.options.type.lower()
         else:
-            basename = os.path.splitext(self.options.input)[0]
-            ext = '.%s' % self.options.type.lower()
-            self.options.output = basename + ext
+            self.options.output = output_filename(self.options.input,
+                                                  self.options.type)
 
         self.options.type = self.options.type.upper()
         try:
@@ -207,6 +515,25 @@ class Options(object):
             msg = "--nodoctype option work in SVG images."
             raise RuntimeError(msg)
 
+        if self.options.compact and self.options.type != 'SVG':
+            msg = "--compact option work in SVG images."
+            raise RuntimeError(msg)
+
+        if self.options.tile_size is not None:
+            if self.options.type != 'PNG':
+                msg = "--tile-size option work in PNG images."
+                raise RuntimeError(msg)
+            elif self.options.tile_size < 1:
+                msg = "--tile-size option must be a positive number."
+                raise RuntimeError(msg)
+            elif self.options.size:
+                msg = "--tile-size option can not be used with --size."
+                raise RuntimeError(msg)
+
+        if self.options.scale is not None and self.options.scale <= 0:
+            msg = "--scale option must be a positive number."
+            raise RuntimeError(msg)
+
         if self.options.transparency is False and self.options.type != 'PNG':
             msg = "--no-transparency option work in PNG images."
             raise RuntimeError(msg)
@@ -215,6 +542,10 @@ class Options(object):
             msg = "config file is not found: %s" % self.options.config
             raise RuntimeError(msg)
 
+        if self.options.cache_size < 1:
+            msg = "--cache-size option must be a positive number."
+            raise RuntimeError(msg)
+
         if self.options.fontmap and not os.path.isfile(self.options.fontmap):
             msg = "fontmap file is not found: %s" % self.options.fontmap
             raise RuntimeError(msg)
@@ -251,6 +582,61 @@ class Options(object):
                 self.options.fontmap = configpath
 
 
+# application object of worker process (for Application.render_parallel)
+worker = None
+
+
+def init_worker(app_class, options, fontmap):
+    """Set up an application in worker process; load fonts and plugins"""
+    global worker
+    worker = app_class()
+    worker.options = options
+    worker.fontmap = fontmap
+    worker.create_rendercache()
+    worker.create_imagecache()
+
+    noderenderer.init_renderers()
+    imagedraw.init_imagedrawers(debug=options.debug)
+
+
+def render_in_worker(app_class, options, fontmap, item):
+    if worker is None:
+        init_worker(app_class, options, fontmap)
+
+    return next(worker.render_batch([item]))
+
+
+def find_diagrams(directory):
+    """Returns paths of diagram files (*.diag) in directory"""
+    return [os.path.join(directory, name)
+            for name in sorted(os.listdir(directory))
+            if name.endswith('.diag')]
+
+
+def file_stamp(path):
+    """Returns (mtime, size) of the file to detect modifications
+
+    mtime is taken in nanoseconds if available; the size also catches
+    rewrites within the granularity of mtime.
+    """
+    stat = os.stat(path)
+    return (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size)
+
+
+def output_filename(inputfile, _type, directory=None):
+    """Returns default output filename for inputfile"""
+    basename = os.path.splitext(inputfile)[0]
+    if directory:
+        basename = os.path.join(directory, os.path.basename(basename))
+
+    return '%s.%s' % (basename, _type.lower())
+
+
+def is_svgz(filename):
+    """Returns True if filename is of gzipped SVG (written compressed)"""
+    return bool(filename) and filename.lower().endswith('.svgz')
+
+
 def detectfont(options):
     import glob
     fontdirs = [
@@ -294,6 +680,11 @@ def detectfont(options):
     return fontpath
 
 
+def create_rendercache(options):
+    maxsize = options.cache_size * 1024 * 1024
+    return RenderCache.from_environ(options.cache_dir, maxsize)
+
+
 def create_fontmap(options):
     fontmap = FontMap(options.fontmap)
     if fontmap.find().path is None or options.font:
@@ -19,9 +19,14 @@ import codecs
 if sys.version_info[0] == 2:
     string_types = (str, unicode)  # NOQA: pyflakes complains to unicode in py3
     from urllib import urlopen  # NOQA: exporting for common interface
+    from urllib2 import HTTPError, Request  # NOQA
+    from urllib2 import urlopen as urlopen_request  # NOQA
 else:
     string_types = (str,)
     from urllib.request import urlopen  # NOQA: exporting for common interface
+    from urllib.error import HTTPError  # NOQA
+    from urllib.request import Request  # NOQA
+    urlopen_request = urlopen  # accepts Request objects
 
 
 def u(string):
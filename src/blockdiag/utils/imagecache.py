@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import os
+import threading
+import time
+from hashlib import sha1
+from tempfile import mkstemp
+from blockdiag.utils.compat import HTTPError, Request, urlopen_request
+from blockdiag.utils.rendercache import EVICTION_RATIO, replace
+
+# path to cache directory given by environment
+IMAGE_CACHE_DIR_ENV = 'BLOCKDIAG_IMAGE_CACHE_DIR'
+
+# default limit of total size of cached images (in bytes)
+DEFAULT_MAXSIZE = 64 * 1024 * 1024
+
+# default lifetime of cached images (in seconds); revalidated after that
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class ImageCache(object):
+    """Cache of remote images (icons and backgrounds) on disk.
+
+    Content of the URL is stored as ``<directory>/<digest of URL>`` with
+    its ETag and Last-Modified headers (``<digest>.json``).  Images older
+    than ttl are revalidated by conditional requests.  Total size of the
+    directory is bounded by maxsize; least recently used images are
+    evicted first.  The directory can be shared by processes.
+
+    As RenderCache, the total size is tracked in memory; the directory is
+    scanned only when it exceeds maxsize.
+    """
+    def __init__(self, directory, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.total = None  # estimated size of the directory (None: unknown)
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.lock = threading.Lock()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, url):
+        digest = sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def read_headers(self, path):
+        try:
+            with open(path + '.json') as fd:
+                return json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def write(self, path, content):
+        fd, tmpname = mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            try:
+                os.write(fd, content)
+            finally:
+                os.close(fd)
+
+            os.chmod(tmpname, 0o644)
+            replace(tmpname, path)
+        except:
+            os.remove(tmpname)
+            raise
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def fetch(self, url):
+        """Returns path to the content of URL (downloads it if needed)"""
+        path = self.path(url)
+        headers = self.read_headers(path)
+        if headers is not None and not os.path.exists(path):
+            headers = None  # evicted by other process
+
+        if headers and time.time() - headers['fetched'] < self.ttl:
+            os.utime(path, None)  # mark as recently used
+            self.count('hits')
+            return path
+
+        request = Request(url)
+        if headers and headers.get('etag'):
+            request.add_header('If-None-Match', headers['etag'])
+        if headers and headers.get('last_modified'):
+            request.add_header('If-Modified-Since', headers['last_modified'])
+
+        try:
+            response = urlopen_request(request)
+            content = response.read()
+            info = response.info()
+            headers = dict(url=url,
+                           etag=info.get('ETag'),
+                           last_modified=info.get('Last-Modified'))
+            response.close()
+            self.write(path, content)
+            self.count('misses')
+        except HTTPError as exc:
+            if exc.code != 304 or headers is None:
+                raise
+
+            os.utime(path, None)
+            self.count('revalidated')
+            content = None
+
+        headers['fetched'] = time.time()
+        self.write(path + '.json', json.dumps(headers).encode('utf-8'))
+
+        if content is not None:
+            with self.lock:
+                if self.total is not None:
+                    self.total += len(content)
+                full = self.total is None or self.total > self.maxsize
+
+            if full:
+                self.evict()
+
+        return path
+
+    def evict(self):
+        """Removes least recently used images if the total is over maxsize"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp') or name.endswith('.json'):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+            except OSError:
+                pass
+
+        total = sum(entry[1] for entry in entries)
+        if total > self.maxsize:
+            for _, size, name in sorted(entries):
+                if total <= self.maxsize * EVICTION_RATIO:
+                    break
+
+                path = os.path.join(self.directory, name)
+                for filename in (path + '.json', path):
+                    try:
+                        os.remove(filename)
+                    except OSError:
+                        pass
+                total -= size
+
+        with self.lock:
+            self.total = total
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        self.total = 0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    revalidated=self.revalidated)
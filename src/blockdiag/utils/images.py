@@ -17,31 +17,305 @@ from __future__ import division
 import io
 import os
 import re
+import time
+import threading
+from base64 import b64encode
 from PIL import Image
 from tempfile import NamedTemporaryFile
 from blockdiag.utils import urlutil
 from blockdiag.utils.compat import u
+from blockdiag.utils.imagecache import ImageCache
 from blockdiag.utils.logging import warning
 
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict  # for Python2.6
+
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
 urlopen_cache = {}
+urlopen_failures = {}  # url -> (error, time); not retried for a while
+urlopen_lock = threading.Lock()
+
+# persistent cache of remote images (see enable_cache())
+cache = None
+
+# lifetime of failures of URLs (in seconds); retried after that
+FAILURE_TTL = 60
+
+# number of threads to download images on prefetch()
+PREFETCH_THREADS = 8
+
+# memory budget of decoded images (in bytes; see DecodedImageCache)
+DECODED_CACHE_SIZE = 32 * 1024 * 1024
+
+
+def enable_cache(directory, **kwargs):
+    """Store remote images to the directory to reuse them between processes
+
+    Options (``maxsize`` and ``ttl``) are passed to ImageCache.
+    """
+    global cache
+    cache = ImageCache(directory, **kwargs)
+
+
+def disable_cache():
+    global cache
+    cache = None
 
 
 def urlopen(url, *args, **kwargs):
     """ auto caching urlopen() (using tempfile) """
     from blockdiag.utils.compat import urlopen as orig_urlopen
 
+    exc = urlopen_failure(url)
+    if exc is not None:
+        raise exc
+
     if url not in urlopen_cache:
+        try:
+            if cache:
+                with io.open(cache.fetch(url), 'rb') as fd:
+                    content = fd.read()
+            else:
+                content = orig_urlopen(url, *args, **kwargs).read()
+        except Exception as exc:
+            with urlopen_lock:
+                urlopen_failures[url] = (exc, time.time())
+            raise
+
         with NamedTemporaryFile(delete=False) as tmpfile:
-            tmpfile.write(orig_urlopen(url, *args, **kwargs).read())
+            tmpfile.write(content)
             tmpfile.flush()
-            urlopen_cache[url] = tmpfile.name
+
+        with urlopen_lock:
+            if url in urlopen_cache:  # fetched by other thread
+                os.remove(tmpfile.name)
+            else:
+                urlopen_cache[url] = tmpfile.name
 
     return io.open(urlopen_cache[url], 'rb')
 
 
+def urlopen_failure(url):
+    """Returns the error of url if it failed within FAILURE_TTL"""
+    with urlopen_lock:
+        exc, failed_at = urlopen_failures.get(url, (None, None))
+        if exc is not None and time.time() - failed_at >= FAILURE_TTL:
+            del urlopen_failures[url]
+            exc = None
+
+    return exc
+
+
+def prefetch(urls):
+    """Download remote images concurrently (before they are opened)
+
+    Errors are ignored here; they are reported when the image is opened
+    (failed URLs are not requested again for FAILURE_TTL seconds).
+    """
+    urls = set(url for url in urls
+               if urlutil.isurl(url) and url not in urlopen_cache and
+               urlopen_failure(url) is None)
+
+    def fetch(url):
+        try:
+            urlopen(url).close()
+        except Exception:
+            pass
+
+    if futures is None or len(urls) < 2:
+        for url in urls:
+            fetch(url)
+    else:
+        threads = min(PREFETCH_THREADS, len(urls))
+        with futures.ThreadPoolExecutor(threads) as executor:
+            list(executor.map(fetch, urls))
+
+
+def image_nbytes(image):
+    """Returns approximate size of the decoded image (in bytes)"""
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+
+class DecodedImage(object):
+    """Decoded image with its resized variants and data URI
+
+    The image and its variants are shared between nodes and drawers;
+    callers should not modify them.
+    """
+    def __init__(self, url, image, cache=None):
+        self.url = url
+        self.image = image
+        self.size = image.size
+        self.cache = cache  # set to None when discarded from the cache
+        self.variants = {}
+        self.datauri = None
+        self.nbytes = image_nbytes(image)
+        self.lock = threading.Lock()
+
+    def grow(self, nbytes):
+        if self.cache:
+            self.cache.grow(self, nbytes)
+        else:
+            self.nbytes += nbytes
+
+    def resize(self, size):
+        """Returns the image shrunk to fit in size (keeps aspect ratio)"""
+        if size[0] >= self.size[0] and size[1] >= self.size[1]:
+            return self.image  # thumbnail() does not enlarge images
+
+        created = False
+        with self.lock:
+            image = self.variants.get(tuple(size))
+            if image is None:
+                image = self.image.copy()
+                image.thumbnail(size, Image.ANTIALIAS)
+                self.variants[tuple(size)] = image
+                created = True
+
+        if created:
+            self.grow(image_nbytes(image))
+        return image
+
+    def data_uri(self):
+        """Returns the image as data URI (converted to PNG)"""
+        created = False
+        with self.lock:
+            if self.datauri is None:
+                try:
+                    png_image = io.BytesIO()
+                    self.image.save(png_image, 'PNG')
+                except Exception:
+                    warning(u("Could not convert image: %s"), self.url)
+                    raise IOError
+
+                data = b64encode(png_image.getvalue()).decode('ascii')
+                self.datauri = "data:;base64," + data
+                created = True
+
+        if created:
+            self.grow(len(self.datauri))
+        return self.datauri
+
+
+class DecodedImageCache(object):
+    """Decoded images keyed by path (and its mtime) or URL
+
+    Total size of decoded images (including resized variants and data
+    URIs) is bounded by maxsize; least recently used images are
+    discarded first.
+    """
+    def __init__(self, maxsize=DECODED_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def key(self, url):
+        if urlutil.isurl(url):
+            return url
+        else:
+            try:
+                return (url, os.stat(url).st_mtime)
+            except OSError:
+                return None
+
+    def get(self, url):
+        key = self.key(url)
+        if key is None:
+            return DecodedImage(url, open(url))
+
+        with self.lock:
+            entry = self.items.pop(key, None)
+            if entry is not None:
+                self.hits += 1
+                self.items[key] = entry  # mark as most recently used
+                return entry
+
+        if urlutil.isurl(url):
+            image = open(url)  # read from the memory
+            image.load()
+        else:
+            with io.open(url, 'rb') as stream:
+                image = open(stream)
+                image.load()  # decode it before closing the file
+
+        entry = DecodedImage(url, image, self)
+        with self.lock:
+            self.misses += 1
+            previous = self.items.pop(key, None)  # loaded by other thread
+            if previous is not None:
+                self.discard(previous)
+            self.items[key] = entry
+            self.total += entry.nbytes
+            self.shrink()
+
+        return entry
+
+    def grow(self, entry, nbytes):
+        """Counts variants (or data URI) created on the entry"""
+        with self.lock:
+            entry.nbytes += nbytes
+            if entry.cache is self:
+                self.total += nbytes
+                self.shrink()
+
+    def discard(self, entry):
+        self.total -= entry.nbytes
+        entry.cache = None
+
+    def shrink(self):
+        # should be called with the lock
+        while len(self.items) > 1 and self.total > self.maxsize:
+            _, entry = self.items.popitem(last=False)
+            self.discard(entry)
+
+    def discard_remote_images(self):
+        """Discards remote images; they are revalidated on next render"""
+        with self.lock:
+            for key in list(self.items):
+                if not isinstance(key, tuple):  # keys of local files
+                    self.discard(self.items.pop(key))
+
+    def clear(self):
+        with self.lock:
+            for entry in self.items.values():
+                entry.cache = None
+            self.items.clear()
+            self.total = 0
+            self.hits = 0
+            self.misses = 0
+
+
+decoded_cache = DecodedImageCache()
+
+
+def load(url):
+    """Returns DecodedImage of url (shared through decoded_cache)
+
+    Streams and Image objects are not cached.
+    """
+    if hasattr(url, 'read') or isinstance(url, Image.Image):
+        return DecodedImage(url, open(url))
+    else:
+        return decoded_cache.get(url)
+
+
 def get_image_size(image):
     if isinstance(image, Image.Image):
         return image.size
+    elif not hasattr(image, 'read'):
+        return load(image).size
     else:
         stream = None
         try:
@@ -138,6 +412,10 @@ def open(url, mode='Pillow'):
 
 
 def cleanup():
+    # local images in decoded_cache are reused by next renders (--batch,
+    # --watch); remote ones are fetched again (see ImageCache)
+    decoded_cache.discard_remote_images()
+    urlopen_failures.clear()
     for url in list(urlopen_cache.keys()):
         path = urlopen_cache.pop(url)
         try:
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import shutil
+import threading
+from hashlib import sha1
+from tempfile import mkstemp
+from blockdiag.utils import unquote, urlutil
+from blockdiag.utils.fontmap import parse_fontpath
+
+# path to cache directory given by environment
+CACHE_DIR_ENV = 'BLOCKDIAG_CACHE_DIR'
+
+# default limit of total size of cached images (in bytes)
+DEFAULT_MAXSIZE = 256 * 1024 * 1024
+
+# eviction removes images until the total size goes under this ratio of
+# maxsize; the directory is not scanned again until it exceeds maxsize
+EVICTION_RATIO = 0.9
+
+_file_digests = {}
+
+
+if hasattr(os, 'replace'):
+    replace = os.replace
+else:
+    def replace(src, dst):
+        try:
+            os.rename(src, dst)
+        except OSError:  # Windows does not overwrite files
+            os.remove(dst)
+            os.rename(src, dst)
+
+
+def file_digest(path):
+    """Returns SHA1 digest of content of the file (memoized by mtime)"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    if key not in _file_digests:
+        with open(path, 'rb') as fd:
+            _file_digests[key] = sha1(fd.read()).hexdigest()
+
+    return _file_digests[key]
+
+
+def fontmap_digest(fontmap):
+    """Returns digest of fonts in the fontmap (including content of files)"""
+    fonts = []
+    for name in sorted(fontmap.fonts):
+        path = fontmap.fonts[name].path
+        fontpath, _ = parse_fontpath(path)
+        if fontpath and os.path.isfile(fontpath):
+            fonts.append((name, path, file_digest(fontpath)))
+        else:
+            fonts.append((name, path, None))
+
+    aliases = sorted(fontmap.aliases.items())
+    return sha1(repr((fonts, aliases)).encode('utf-8')).hexdigest()
+
+
+def images_digest(paths):
+    """Returns digests of local image files (remote images are ignored)"""
+    files = []
+    for path in sorted(set(p for p in paths if p)):
+        if not urlutil.isurl(path) and os.path.isfile(path):
+            files.append((path, file_digest(path)))
+
+    return files
+
+
+def referenced_images(tree):
+    """Returns values of icon and background attributes in the parse tree"""
+    images = []
+    items = [tree]
+    while items:
+        item = items.pop()
+        if not isinstance(item, (list, tuple)):
+            continue
+        elif getattr(item, 'name', None) in ('icon', 'background'):
+            images.append(unquote(getattr(item, 'value', None)))
+        else:
+            items.extend(item)
+
+    return images
+
+
+class RenderCache(object):
+    """Content-addressed cache of rendered images on disk.
+
+    Images are stored as ``<directory>/<key>.<ext>``.  Total size of the
+    directory is bounded by maxsize; least recently used images are
+    evicted first (modified time of files is updated on every hit).
+    The directory can be shared by processes; all writes are atomic.
+
+    The total size is tracked in memory (counting images stored by this
+    instance); the directory is scanned only when it exceeds maxsize.
+    """
+    def __init__(self, directory, maxsize=DEFAULT_MAXSIZE):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.total = None  # estimated size of the directory (None: unknown)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @classmethod
+    def from_environ(cls, directory=None, maxsize=DEFAULT_MAXSIZE):
+        """Returns a cache of directory (or $BLOCKDIAG_CACHE_DIR) or None"""
+        directory = directory or os.environ.get(CACHE_DIR_ENV)
+        if directory:
+            return cls(directory, maxsize)
+        else:
+            return None
+
+    @staticmethod
+    def key(code, fontmap=None, images=None, **options):
+        """Returns a key for the diagram source and rendering options
+
+        images is a list of icons and backgrounds used in the diagram;
+        the key changes when the content of the local files changes.
+        """
+        from blockdiag import __version__
+
+        if fontmap is not None:
+            options['fontmap'] = fontmap_digest(fontmap)
+        if images:
+            digests = images_digest(images)
+            if digests:
+                options['images'] = digests
+
+        seed = repr((__version__, code, sorted(options.items())))
+        return sha1(seed.encode('utf-8')).hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, '%s.%s' % (key, ext.lower()))
+
+    def get(self, key, ext):
+        """Returns path to the cached image, or None if not cached"""
+        path = self.path(key, ext)
+        try:
+            os.utime(path, None)  # mark as recently used
+        except OSError:
+            path = None
+
+        with self.lock:
+            if path:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return path
+
+    def fetch(self, key, ext, filename):
+        """Copies the cached image to filename; returns False if not cached"""
+        path = self.get(key, ext)
+        if path is None:
+            return False
+
+        try:
+            shutil.copyfile(path, filename)
+            return True
+        except (IOError, OSError):  # evicted by other process
+            return False
+
+    def read(self, key, ext):
+        """Returns content of the cached image, or None if not cached"""
+        path = self.get(key, ext)
+        if path is None:
+            return None
+
+        try:
+            with open(path, 'rb') as fd:
+                return fd.read()
+        except (IOError, OSError):  # evicted by other process
+            return None
+
+    def store(self, key, ext, filename=None, content=None):
+        """Stores an image file (or content of image) to the cache"""
+        if content is None:
+            with open(filename, 'rb') as fd:
+                content = fd.read()
+        elif not isinstance(content, bytes):
+            content = content.encode('utf-8')
+
+        fd, tmpname = mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            try:
+                os.write(fd, content)
+            finally:
+                os.close(fd)
+
+            os.chmod(tmpname, 0o644)
+            replace(tmpname, self.path(key, ext))
+        except:
+            os.remove(tmpname)
+            raise
+
+        with self.lock:
+            if self.total is not None:
+                self.total += len(content)
+            full = self.total is None or self.total > self.maxsize
+
+        if full:
+            self.evict()
+
+    def evict(self):
+        """Removes least recently used images if the total is over maxsize"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp'):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+            except OSError:
+                pass
+
+        total = sum(entry[1] for entry in entries)
+        if total > self.maxsize:
+            for _, size, name in sorted(entries):
+                if total <= self.maxsize * EVICTION_RATIO:
+                    break
+
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    total -= size
+                except OSError:
+                    pass
+
+        with self.lock:
+            self.total = total
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        self.total = 0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
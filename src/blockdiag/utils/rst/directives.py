@@ -23,8 +23,11 @@ from docutils.parsers import rst
 from docutils.parsers.rst.roles import set_classes
 from docutils.statemachine import ViewList
 
+from blockdiag.imagedraw.svg import classprefix
 from blockdiag.utils.bootstrap import create_fontmap, Application
 from blockdiag.utils.compat import string_types
+from blockdiag.utils.rendercache import (RenderCache, DEFAULT_MAXSIZE,
+                                         referenced_images)
 from blockdiag.utils.rst.nodes import blockdiag as blockdiag_node
 
 directive_options_default = dict(format='PNG',
@@ -33,8 +36,12 @@ directive_options_default = dict(format='PNG',
                                  outputdir=None,
                                  nodoctype=False,
                                  noviewbox=False,
-                                 inline_svg=False)
+                                 compact=False,
+                                 inline_svg=False,
+                                 cachedir=None,
+                                 cachesize=DEFAULT_MAXSIZE)
 directive_options = {}
+rendercache = None
 
 
 def relfn2path(env, filename):
@@ -168,14 +175,18 @@ class BlockdiagDirective(BlockdiagDirectiveBase):
             return results
 
         try:
-            diagram = self.node2diagram(node)
+            tree = self.node2tree(node)
+            if 'desctable' in node['options'] or figwidth == 'image':
+                diagram = self.node2diagram(node)
+            else:
+                diagram = None  # built only if the image is not cached
         except Exception as e:
             raise self.warning(str(e))
 
         if 'desctable' in node['options']:
             results += self.description_tables(diagram)
 
-        results[0] = self.node2image(node, diagram)
+        results[0] = self.node2image(node, diagram, tree)
         self.add_name(results[0])
 
         if node.get('caption'):
@@ -209,19 +220,42 @@ class BlockdiagDirective(BlockdiagDirectiveBase):
     def global_options(self):
         return directive_options
 
-    def node2diagram(self, node):
-        if hasattr(node, 'to_diagram'):
-            return node.to_diagram()
+    def node2tree(self, node):
+        if hasattr(node, 'to_tree'):
+            return node.to_tree()
         else:
             try:
-                tree = self.processor.parser.parse_string(node['code'])
+                return self.processor.parser.parse_string(node['code'])
             except:
                 code = '%s { %s }' % (self.name, node['code'])
                 tree = self.processor.parser.parse_string(code)
                 node['code'] = code  # replace if succeeded
+                return tree
 
+    def node2diagram(self, node):
+        if hasattr(node, 'to_diagram'):
+            return node.to_diagram()
+        else:
+            tree = self.node2tree(node)
             return self.processor.builder.ScreenNodeBuilder.build(tree)
 
+    def node2drawer(self, _format, node, diagram, filename):
+        """Returns a drawer of the node (builds the diagram if not given)"""
+        fontmap = self.create_fontmap()
+        options = self.drawer_options(node)
+        try:
+            if hasattr(node, 'to_drawer'):
+                return node.to_drawer(_format, filename, fontmap, **options)
+            else:
+                if diagram is None:
+                    diagram = self.node2diagram(node)
+
+                DiagramDraw = self.processor.drawer.DiagramDraw
+                return DiagramDraw(_format, diagram, filename,
+                                   fontmap=fontmap, **options)
+        except Exception as e:
+            raise self.warning(str(e))
+
     def get_actual_width(self, node, diagram):
         fontmap = self.create_fontmap()
         if hasattr(node, 'to_drawer'):
@@ -233,44 +267,47 @@ class BlockdiagDirective(BlockdiagDirectiveBase):
 
         return drawer.pagesize()[0]
 
-    def node2image(self, node, diagram):
+    def node2image(self, node, diagram, tree=None):
         _format = self.global_options['format'].lower()
         if _format == 'svg' and self.global_options['inline_svg'] is True:
-            return self.node2image_inline_svg(node, diagram)
+            return self.node2image_inline_svg(node, diagram, tree)
 
         filename = self.image_filename(node)
-        fontmap = self.create_fontmap()
-        if hasattr(node, 'to_drawer'):
-            drawer = node.to_drawer(_format, filename, fontmap,
-                                    **self.global_options)
-        else:
-            drawer = self.processor.drawer.DiagramDraw(_format, diagram,
-                                                       filename,
-                                                       fontmap=fontmap,
-                                                       **self.global_options)
-
         if not os.path.isfile(filename):
-            drawer.draw()
-            drawer.save()
+            # look up the cache before building and drawing the diagram
+            key = self.cache_key(node, tree) if rendercache else None
+            if key is None or not rendercache.fetch(key, _format, filename):
+                drawer = self.node2drawer(_format, node, diagram, filename)
+                drawer.draw()
+                drawer.save()
+                if key:
+                    rendercache.store(key, _format, filename)
 
         return nodes.image(uri=filename, **node['options'])
 
-    def node2image_inline_svg(self, node, diagram):
-        fontmap = self.create_fontmap()
-        if hasattr(node, 'to_drawer'):
-            drawer = node.to_drawer('SVG', None, fontmap,
-                                    **self.global_options)
-        else:
-            drawer = self.processor.drawer.DiagramDraw('svg', diagram,
-                                                       None, fontmap=fontmap,
-                                                       **self.global_options)
-        drawer.draw()
-
-        size = drawer.pagesize().resize(**node['options']).to_integer_point()
-        content = drawer.save(size)
+    def node2image_inline_svg(self, node, diagram, tree=None):
+        content = None
+        key = self.cache_key(node, tree) if rendercache else None
+        if key:
+            content = rendercache.read(key, 'svg')
+            if content is not None:
+                content = content.decode('utf-8')
+
+        if content is None:
+            drawer = self.node2drawer('svg', node, diagram, None)
+            size = drawer.pagesize().resize(**node['options'])
+            drawer.draw()
+            content = drawer.save(size.to_integer_point())
+            if key:
+                rendercache.store(key, 'svg', content=content)
 
         return nodes.raw('', content, format='html')
 
+    def drawer_options(self, node):
+        # class names of compact SVG images are global in HTML documents
+        return dict(self.global_options,
+                    classprefix=classprefix(code=node['code']))
+
     def create_fontmap(self):
         Options = namedtuple('Options', 'font fontmap')
         fontpath = self.global_options['fontpath']
@@ -301,6 +338,24 @@ class BlockdiagDirective(BlockdiagDirectiveBase):
 
             return filename
 
+    def cache_key(self, node, tree=None, **options):
+        """Returns a key of the node in render cache (without building it)"""
+        options.update(self.global_options)
+        for name in ('outputdir', 'cachedir', 'cachesize'):
+            options.pop(name, None)
+
+        if tree is None:
+            tree = self.node2tree(node)
+
+        processor = getattr(node, 'processor', None) or self.processor
+        return RenderCache.key(node['code'], self.create_fontmap(),
+                               images=referenced_images(tree),
+                               module=processor.__name__,
+                               version=processor.__version__,
+                               directive=self.name,
+                               node_options=sorted(node['options'].items()),
+                               **options)
+
     def description_tables(self, diagram):
         tables = []
         desctable = self.node_description_table(diagram)
@@ -391,9 +446,12 @@ class BlockdiagDirective(BlockdiagDirectiveBase):
 
 
 def setup(**kwargs):
-    global directive_options, directive_options_default
+    global directive_options, directive_options_default, rendercache
 
     for key, value in directive_options_default.items():
         directive_options[key] = kwargs.get(key, value)
 
+    rendercache = RenderCache.from_environ(directive_options['cachedir'],
+                                           directive_options['cachesize'])
+
     rst.directives.register_directive("blockdiag", BlockdiagDirective)
@@ -25,14 +25,17 @@ class blockdiag(nodes.General, nodes.Element):
     name = 'blockdiag'
     processor = blockdiag
 
-    def to_diagram(self):
+    def to_tree(self):
         try:
-            tree = self.processor.parser.parse_string(self['code'])
+            return self.processor.parser.parse_string(self['code'])
         except:
             code = '%s { %s }' % (self.name, self['code'])
             tree = self.processor.parser.parse_string(code)
             self['code'] = code  # replace if succeeded
+            return tree
 
+    def to_diagram(self):
+        tree = self.to_tree()
         return self.processor.builder.ScreenNodeBuilder.build(tree)
 
     def to_drawer(self, image_format, filename, fontmap, **kwargs):